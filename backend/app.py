@@ -1,15 +1,49 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager
+from flask_jwt_extended import JWTManager, get_jwt_identity
 import os
+import io
+import secrets
+from urllib.parse import urlparse
 from datetime import datetime
 from dotenv import load_dotenv
+from sqlalchemy import or_, and_, func, select, union
+from sqlalchemy.orm.exc import StaleDataError
 
 # Import our modules
-from models import db, User, Ticket, Comment, TimeEntry, Client
+from models import (
+    db, User, Ticket, Comment, TimeEntry, Client, ArchivedTicket, ArchivedComment, ArchivedTimeEntry,
+    WebhookSubscription, WebhookDeadLetter
+)
 from config import config
-from database import init_db, get_next_ticket_number
+from database import init_db, get_next_ticket_number, encode_cursor, decode_cursor, prefix_range
 from auth import create_token, authenticate_user, login_required, admin_required, get_current_user
+from ratelimit import limiter
+from history import snapshot, get_ticket_history, event_to_dict
+from changes import ticket_changed
+from ticket_counts import get_ticket_counts, forget_user
+from archive import archive_resolved_tickets, restore_ticket, find_ticket, is_archived
+from cli import tickets_cli, users_cli, tenants_cli, webhooks_cli
+from importer import import_tickets, read_ndjson, read_csv
+from provisioning import provision_users
+from user_cache import user_cache
+from json_provider import FastJSONProvider
+from compression import compressor
+from query_budget import query_budget
+from slow_query import slow_query_log
+from sla import sla_scheduler, record_response, get_sla_events, sla_event_to_dict
+from assignment import agent_index, choose_assignee
+from duplicates import duplicate_index, find_duplicates, duplicate_summaries, merge_tickets
+from similar import similar_index, similar_tickets
+from triage import triage_model, retriage_open_tickets
+from reports import DIMENSIONS, aggregate_time, report_csv
+from client_stats import add_logged_hours
+from autocomplete import autocomplete, KINDS as AUTOCOMPLETE_KINDS
+from tenancy import tenancy
+from versioning import with_etag, precondition_failed, conflict_response
+from webhooks import webhook_dispatcher, retry_dead_letter
+from outbox import EVENTS as CHANGE_EVENTS, record_change, read_changes, encode_changes, latest_offset
+from idempotency import idempotent
 
 load_dotenv()
 
@@ -19,6 +53,7 @@ def create_app(config_name=None):
         config_name = os.environ.get('FLASK_ENV', 'development')
     
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     
     # Load configuration
     app.config.from_object(config[config_name])
@@ -26,9 +61,32 @@ def create_app(config_name=None):
     # Initialize extensions
     CORS(app, origins=app.config['CORS_ORIGINS'])
     jwt = JWTManager(app)
+    limiter.init_app(app)
+    compressor.init_app(app)
     
     # Initialize database
     init_db(app)
+    user_cache.init_app(app)
+    query_budget.init_app(app)
+    slow_query_log.init_app(app)
+    sla_scheduler.init_app(app)
+    agent_index.init_app(app)
+    duplicate_index.init_app(app)
+    similar_index.init_app(app)
+    triage_model.init_app(app)
+    autocomplete.init_app(app)
+    webhook_dispatcher.init_app(app)
+    tenancy.init_app(app)
+    app.cli.add_command(tickets_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(tenants_cli)
+    app.cli.add_command(webhooks_cli)
+    
+    @app.errorhandler(StaleDataError)
+    def handle_write_conflict(error):
+        # A versioned UPDATE matched no row: another request saved first
+        db.session.rollback()
+        return conflict_response()
     
     # Health check endpoint
     @app.route('/api/v1/health', methods=['GET'])
@@ -64,12 +122,15 @@ def create_app(config_name=None):
     @login_required
     def get_current_user_info():
         user = get_current_user()
-        return jsonify(user.to_dict())
+        return with_etag(jsonify(user.to_dict()), user)
     
     @app.route('/api/v1/auth/profile', methods=['PUT'])
     @login_required
     def update_profile():
         user = get_current_user()
+        failed = precondition_failed(user)
+        if failed:
+            return failed
         data = request.get_json()
         
         if 'name' in data:
@@ -80,9 +141,15 @@ def create_app(config_name=None):
             user.department = data['department']
         
         user.updated_at = datetime.utcnow()
+        user_cache.invalidate(user.id)
+        autocomplete.invalidate('user')
+        db.session.flush()
+        record_change('user.updated', user.id, user.to_dict(), user.id)
         db.session.commit()
+        agent_index.invalidate()
+        autocomplete.put('user', user)
         
-        return jsonify(user.to_dict())
+        return with_etag(jsonify(user.to_dict()), user)
     
     # Ticket endpoints
     @app.route('/api/v1/ticket', methods=['GET'])
@@ -92,36 +159,94 @@ def create_app(config_name=None):
         per_page = request.args.get('per_page', 20, type=int)
         status = request.args.get('status')
         priority = request.args.get('priority')
+        assigned_to = request.args.get('assigned_to')
+        created_by = request.args.get('created_by')
+        include_archived = request.args.get('include_archived', 'false').lower() == 'true'
         
-        query = Ticket.query
+        def filtered(model):
+            query = model.query
+            if status:
+                query = query.filter(model.status == status)
+            if priority:
+                query = query.filter(model.priority == priority)
+            if assigned_to:
+                query = query.filter(model.assigned_to == assigned_to)
+            if created_by:
+                query = query.filter(model.created_by == created_by)
+            return query
         
-        if status:
-            query = query.filter(Ticket.status == status)
-        if priority:
-            query = query.filter(Ticket.priority == priority)
-        
-        tickets = query.order_by(Ticket.created_at.desc()).paginate(
+        tickets = filtered(Ticket).order_by(Ticket.created_at.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
+        items = list(tickets.items)
+        total = tickets.total
+        pages = tickets.pages
+        
+        # Archived tickets are listed after every live ticket
+        if include_archived:
+            archived_query = filtered(ArchivedTicket)
+            archived_total = archived_query.count()
+            remaining = per_page - len(items)
+            if remaining > 0 and archived_total:
+                offset = max(0, (page - 1) * per_page - total)
+                items += archived_query.order_by(ArchivedTicket.created_at.desc()).offset(offset).limit(remaining).all()
+            total += archived_total
+            pages = (total + per_page - 1) // per_page if per_page else 0
         
+        user_cache.prime([ticket.created_by for ticket in items] + [ticket.assigned_to for ticket in items])
         return jsonify({
-            'tickets': [ticket.to_dict() for ticket in tickets.items],
-            'total': tickets.total,
-            'pages': tickets.pages,
+            'tickets': [ticket.to_dict() for ticket in items],
+            'total': total,
+            'pages': pages,
             'current_page': page
         })
     
+    @app.route('/api/v1/me/queue', methods=['GET'])
+    @login_required
+    def get_my_queue():
+        user_id = get_jwt_identity()
+        status = request.args.get('status')
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        cursor = request.args.get('cursor')
+        
+        query = Ticket.query.filter(Ticket.assigned_to == user_id)
+        if status:
+            query = query.filter(Ticket.status == status)
+        if cursor:
+            try:
+                created_at, last_id = decode_cursor(cursor, datetime, str)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            query = query.filter(or_(
+                Ticket.created_at < created_at,
+                and_(Ticket.created_at == created_at, Ticket.id < last_id)
+            ))
+        
+        tickets = query.order_by(Ticket.created_at.desc(), Ticket.id.desc()).limit(limit + 1).all()
+        has_more = len(tickets) > limit
+        tickets = tickets[:limit]
+        counts = get_ticket_counts(user_id)
+        
+        user_cache.prime([ticket.created_by for ticket in tickets] + [user_id])
+        return jsonify({
+            'tickets': [ticket.to_dict() for ticket in tickets],
+            'counts': counts,
+            'total': sum(counts.values()),
+            'nextCursor': encode_cursor(tickets[-1].created_at, tickets[-1].id) if has_more else None
+        })
+    
     @app.route('/api/v1/ticket/<ticket_id>', methods=['GET'])
     @login_required
     def get_ticket(ticket_id):
-        ticket = Ticket.query.get(ticket_id)
+        ticket = find_ticket(ticket_id)
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
         
-        return jsonify(ticket.to_dict())
+        return with_etag(jsonify(ticket.to_dict()), ticket)
     
     @app.route('/api/v1/ticket/create', methods=['POST'])
     @login_required
+    @idempotent
     def create_ticket():
         data = request.get_json()
         user = get_current_user()
@@ -132,6 +257,15 @@ def create_app(config_name=None):
             if not data.get(field):
                 return jsonify({'error': f'{field} is required'}), 400
         
+        client_id = data.get('client_id')
+        if client_id and not Client.query.get(client_id):
+            return jsonify({'error': 'Client not found'}), 400
+        
+        ticket_type = data.get('type', 'support')
+        assigned_to = data.get('assigned_to')
+        if not assigned_to and app.config['AUTO_ASSIGN_ENABLED']:
+            assigned_to = choose_assignee(ticket_type, department=data.get('department'))
+        
         # Create new ticket
         ticket = Ticket(
             number=get_next_ticket_number(),
@@ -139,15 +273,47 @@ def create_app(config_name=None):
             detail=data['detail'],
             status=data.get('status', 'needs_support'),
             priority=data.get('priority', 'medium'),
-            type=data.get('type', 'support'),
+            type=ticket_type,
             created_by=user.id,
-            assigned_to=data.get('assigned_to')
+            assigned_to=assigned_to,
+            client_id=client_id or None
         )
         
         db.session.add(ticket)
+        db.session.flush()
+        ticket_changed(ticket, None, 'created', user.id)
         db.session.commit()
         
-        return jsonify(ticket.to_dict()), 201
+        result = ticket.to_dict()
+        result['possibleDuplicates'] = duplicate_summaries(find_duplicates(ticket.id))
+        # Suggested values for whatever the submitter left at the default
+        result['triage'] = triage_model.suggest(
+            ticket.title, ticket.detail, [field for field in ('priority', 'type') if not data.get(field)]
+        )
+        return jsonify(result), 201
+    
+    @app.route('/api/v1/ticket/import', methods=['POST'])
+    @admin_required
+    def import_ticket_batch():
+        user = get_current_user()
+        fmt = request.args.get('format')
+        if fmt is None:
+            fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+        if fmt not in ('ndjson', 'csv'):
+            return jsonify({'error': 'format must be ndjson or csv'}), 400
+        
+        # Read the body as a stream so large uploads are validated line by line
+        lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        records = read_csv(lines) if fmt == 'csv' else read_ndjson(lines)
+        result = import_tickets(
+            records, user.id,
+            batch_size=request.args.get('batch_size', type=int),
+            chunk_size=request.args.get('chunk_size', type=int)
+        )
+        
+        if result.stopped:
+            return jsonify(result.to_dict()), 409
+        return jsonify(result.to_dict()), 201 if result.imported else 200
     
     @app.route('/api/v1/ticket/<ticket_id>', methods=['PUT'])
     @login_required
@@ -155,8 +321,14 @@ def create_app(config_name=None):
         ticket = Ticket.query.get(ticket_id)
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
+        failed = precondition_failed(ticket)
+        if failed:
+            return failed
         
         data = request.get_json()
+        if data.get('client_id') and not Client.query.get(data['client_id']):
+            return jsonify({'error': 'Client not found'}), 400
+        before = snapshot(ticket)
         
         # Update fields
         if 'title' in data:
@@ -171,11 +343,14 @@ def create_app(config_name=None):
             ticket.type = data['type']
         if 'assigned_to' in data:
             ticket.assigned_to = data['assigned_to']
+        if 'client_id' in data:
+            ticket.client_id = data['client_id'] or None
         
         ticket.updated_at = datetime.utcnow()
+        ticket_changed(ticket, before, 'updated', get_jwt_identity())
         db.session.commit()
         
-        return jsonify(ticket.to_dict())
+        return with_etag(jsonify(ticket.to_dict()), ticket)
     
     @app.route('/api/v1/ticket/<ticket_id>/close', methods=['PATCH'])
     @login_required
@@ -183,13 +358,18 @@ def create_app(config_name=None):
         ticket = Ticket.query.get(ticket_id)
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
+        failed = precondition_failed(ticket)
+        if failed:
+            return failed
         
+        before = snapshot(ticket)
         ticket.status = 'resolved'
         ticket.is_complete = True
         ticket.updated_at = datetime.utcnow()
+        ticket_changed(ticket, before, 'closed', get_jwt_identity())
         db.session.commit()
         
-        return jsonify(ticket.to_dict())
+        return with_etag(jsonify(ticket.to_dict()), ticket)
     
     @app.route('/api/v1/ticket/<ticket_id>/reopen', methods=['PATCH'])
     @login_required
@@ -197,27 +377,266 @@ def create_app(config_name=None):
         ticket = Ticket.query.get(ticket_id)
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
+        failed = precondition_failed(ticket)
+        if failed:
+            return failed
         
+        before = snapshot(ticket)
         ticket.status = 'needs_support'
         ticket.is_complete = False
         ticket.updated_at = datetime.utcnow()
+        ticket_changed(ticket, before, 'reopened', get_jwt_identity())
+        db.session.commit()
+        
+        return with_etag(jsonify(ticket.to_dict()), ticket)
+    
+    @app.route('/api/v1/ticket/<ticket_id>/history', methods=['GET'])
+    @login_required
+    def get_ticket_events(ticket_id):
+        ticket = find_ticket(ticket_id)
+        if not ticket:
+            return jsonify({'error': 'Ticket not found'}), 404
+        
+        after = request.args.get('after', 0, type=int)
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        
+        events = get_ticket_history(ticket_id, after=after, limit=limit)
+        return jsonify({
+            'events': [event_to_dict(event) for event in events],
+            'nextCursor': events[-1].id if len(events) == limit else None
+        })
+    
+    @app.route('/api/v1/ticket/<ticket_id>/duplicates', methods=['GET'])
+    @login_required
+    def get_ticket_duplicates(ticket_id):
+        ticket = Ticket.query.get(ticket_id)
+        if not ticket:
+            return jsonify({'error': 'Ticket not found'}), 404
+        
+        limit = min(request.args.get('limit', app.config['DUPLICATE_LIMIT'], type=int), 50)
+        return jsonify({'duplicates': duplicate_summaries(find_duplicates(ticket.id, limit=limit))})
+    
+    @app.route('/api/v1/ticket/<ticket_id>/similar', methods=['GET'])
+    @login_required
+    def get_similar_tickets(ticket_id):
+        ticket = Ticket.query.get(ticket_id)
+        if not ticket:
+            return jsonify({'error': 'Ticket not found'}), 404
+        
+        limit = min(request.args.get('limit', app.config['SIMILAR_LIMIT'], type=int), 50)
+        return jsonify({'similar': similar_tickets(ticket, limit=limit)})
+    
+    @app.route('/api/v1/ticket/<ticket_id>/merge', methods=['POST'])
+    @login_required
+    def merge_ticket_duplicates(ticket_id):
+        ticket = Ticket.query.get(ticket_id)
+        if not ticket:
+            return jsonify({'error': 'Ticket not found'}), 404
+        if ticket.merged_into:
+            return jsonify({'error': 'Ticket has been merged into another ticket'}), 400
+        
+        data = request.get_json() or {}
+        duplicate_ids = data.get('duplicates')
+        if not isinstance(duplicate_ids, list) or not duplicate_ids:
+            return jsonify({'error': 'duplicates must be a non-empty list of ticket ids'}), 400
+        if ticket.id in duplicate_ids:
+            return jsonify({'error': 'A ticket cannot be merged into itself'}), 400
+        
+        merged = merge_tickets(ticket, duplicate_ids, get_jwt_identity())
         db.session.commit()
         
+        return jsonify({
+            'ticket': ticket.to_dict(),
+            'merged': [duplicate.to_dict() for duplicate in merged]
+        })
+    
+    @app.route('/api/v1/sla/events', methods=['GET'])
+    @login_required
+    def get_sla_event_stream():
+        after = request.args.get('after', 0, type=int)
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        
+        events = get_sla_events(after=after, limit=limit, ticket_id=request.args.get('ticket_id'))
+        return jsonify({
+            'events': [sla_event_to_dict(event) for event in events],
+            # Poll again from here; unchanged when there is nothing new yet
+            'nextCursor': events[-1].id if events else after
+        })
+    
+    @app.route('/api/v1/ticket/<ticket_id>/restore', methods=['POST'])
+    @admin_required
+    def restore_archived_ticket(ticket_id):
+        ticket = restore_ticket(ticket_id, actor_id=get_jwt_identity())
+        if not ticket:
+            return jsonify({'error': 'Archived ticket not found'}), 404
+        
         return jsonify(ticket.to_dict())
     
+    @app.route('/api/v1/admin/archive', methods=['POST'])
+    @admin_required
+    def archive_tickets():
+        data = request.get_json(silent=True) or {}
+        for field in ('older_than_days', 'batch_size'):
+            value = data.get(field)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+                return jsonify({'error': f'{field} must be a positive integer'}), 400
+        moved = archive_resolved_tickets(
+            older_than_days=data.get('older_than_days'),
+            batch_size=data.get('batch_size'),
+            actor_id=get_jwt_identity()
+        )
+        return jsonify({'archived': moved})
+    
+    @app.route('/api/v1/admin/triage', methods=['POST'])
+    @admin_required
+    def retriage_tickets():
+        data = request.get_json(silent=True) or {}
+        min_confidence = data.get('min_confidence')
+        if min_confidence is not None and (isinstance(min_confidence, bool) or
+                                           not isinstance(min_confidence, (int, float)) or
+                                           not 0 <= min_confidence <= 1):
+            return jsonify({'error': 'min_confidence must be a number from 0 to 1'}), 400
+        batch_size = data.get('batch_size')
+        if batch_size is not None and (isinstance(batch_size, bool) or not isinstance(batch_size, int) or batch_size < 1):
+            return jsonify({'error': 'batch_size must be a positive integer'}), 400
+        summary = retriage_open_tickets(
+            apply=bool(data.get('apply')),
+            min_confidence=min_confidence,
+            batch_size=batch_size,
+            actor_id=get_jwt_identity()
+        )
+        return jsonify(summary)
+    
+    @app.route('/api/v1/admin/agents/load', methods=['GET'])
+    @admin_required
+    def get_agent_load():
+        return jsonify({'agents': agent_index.snapshot()})
+    
+    @app.route('/api/v1/admin/slow-queries', methods=['GET'])
+    @admin_required
+    def get_slow_queries():
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        sort = request.args.get('sort', 'total')
+        return jsonify({
+            'enabled': slow_query_log.enabled,
+            'thresholdMs': slow_query_log.threshold * 1000,
+            'statements': slow_query_log.top(limit, sort)
+        })
+    
+    @app.route('/api/v1/admin/slow-queries', methods=['DELETE'])
+    @admin_required
+    def reset_slow_queries():
+        slow_query_log.reset()
+        return jsonify({'message': 'Slow query log cleared'})
+    
+    @app.route('/api/v1/admin/webhooks', methods=['GET'])
+    @admin_required
+    def get_webhooks():
+        subscriptions = WebhookSubscription.query.order_by(WebhookSubscription.created_at).all()
+        return jsonify({'latestChangeId': latest_offset(), 'webhooks': [
+            subscription.to_dict() for subscription in subscriptions
+        ]})
+    
+    @app.route('/api/v1/admin/webhooks', methods=['POST'])
+    @admin_required
+    def create_webhook():
+        data = request.get_json()
+        url = data.get('url') or ''
+        if urlparse(url).scheme not in ('http', 'https') or not urlparse(url).netloc:
+            return jsonify({'error': 'url must be an http(s) URL'}), 400
+        events = data.get('events') or ['*']
+        if not isinstance(events, list) or any(event != '*' and event not in CHANGE_EVENTS for event in events):
+            return jsonify({'error': f"events must be a list of: *, {', '.join(CHANGE_EVENTS)}"}), 400
+        
+        subscription = WebhookSubscription(
+            url=url,
+            secret=data.get('secret') or secrets.token_hex(32),
+            events='*' if '*' in events else ','.join(events),
+            created_by=get_jwt_identity(),
+            # Only changes made from now on are sent
+            last_change_id=latest_offset()
+        )
+        db.session.add(subscription)
+        db.session.commit()
+        
+        # The secret is only ever shown here
+        return jsonify(dict(subscription.to_dict(), secret=subscription.secret)), 201
+    
+    @app.route('/api/v1/admin/webhooks/<subscription_id>', methods=['DELETE'])
+    @admin_required
+    def delete_webhook(subscription_id):
+        subscription = WebhookSubscription.query.get(subscription_id)
+        if not subscription:
+            return jsonify({'error': 'Webhook not found'}), 404
+        
+        # Kept for its dead letters
+        subscription.active = False
+        db.session.commit()
+        
+        return jsonify({'message': 'Webhook deleted'})
+    
+    @app.route('/api/v1/admin/webhooks/dead-letters', methods=['GET'])
+    @admin_required
+    def get_webhook_dead_letters():
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        query = WebhookDeadLetter.query
+        if request.args.get('subscription_id'):
+            query = query.filter_by(subscription_id=request.args['subscription_id'])
+        dead_letters = query.order_by(WebhookDeadLetter.id.desc()).limit(limit).all()
+        return jsonify({'deadLetters': [dead_letter.to_dict() for dead_letter in dead_letters]})
+    
+    @app.route('/api/v1/admin/webhooks/dead-letters/<int:dead_letter_id>/retry', methods=['POST'])
+    @admin_required
+    def retry_webhook_dead_letter(dead_letter_id):
+        dead_letter = WebhookDeadLetter.query.get(dead_letter_id)
+        if not dead_letter:
+            return jsonify({'error': 'Dead letter not found'}), 404
+        if not dead_letter.subscription.active:
+            return jsonify({'error': 'Webhook was deleted'}), 400
+        
+        error = retry_dead_letter(dead_letter)
+        db.session.commit()
+        if error:
+            return jsonify({'error': f'Delivery failed: {error}'}), 502
+        
+        return jsonify({'message': 'Delivered'})
+    
+    @app.route('/api/v1/changes', methods=['GET'])
+    @admin_required
+    def get_changes():
+        after = request.args.get('after', 0, type=int)
+        limit = max(1, min(request.args.get('limit', app.config['CHANGES_PAGE_SIZE'], type=int),
+                           app.config['CHANGES_MAX_PAGE_SIZE']))
+        events = [event for event in request.args.get('events', '').split(',') if event]
+        unknown = [event for event in events if event not in CHANGE_EVENTS]
+        if unknown:
+            return jsonify({'error': f"events must be a list of: {', '.join(CHANGE_EVENTS)}"}), 400
+        
+        rows = read_changes(after, limit + 1, events)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_offset = rows[-1].id if rows else after
+        # The stored payloads are spliced in as they are instead of being decoded and encoded again
+        body = (f'{{"changes":{encode_changes(rows)},"nextOffset":{next_offset},'
+                f'"hasMore":{"true" if has_more else "false"}}}')
+        return app.response_class(body, mimetype='application/json')
+    
     # Comment endpoints
     @app.route('/api/v1/ticket/<ticket_id>/comments', methods=['GET'])
     @login_required
     def get_comments(ticket_id):
-        ticket = Ticket.query.get(ticket_id)
+        ticket = find_ticket(ticket_id)
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
         
-        comments = Comment.query.filter_by(ticket_id=ticket_id).order_by(Comment.created_at.desc()).all()
+        model = ArchivedComment if is_archived(ticket) else Comment
+        comments = model.query.filter_by(ticket_id=ticket_id).order_by(model.created_at.desc()).all()
+        user_cache.prime([comment.user_id for comment in comments])
         return jsonify([comment.to_dict() for comment in comments])
     
     @app.route('/api/v1/ticket/<ticket_id>/comments', methods=['POST'])
     @login_required
+    @idempotent
     def add_comment(ticket_id):
         ticket = Ticket.query.get(ticket_id)
         if not ticket:
@@ -237,6 +656,10 @@ def create_app(config_name=None):
         )
         
         db.session.add(comment)
+        if not comment.is_internal:
+            record_response(ticket, user.id)
+        db.session.flush()
+        record_change('comment.created', comment.id, dict(comment.to_dict(), ticketId=ticket_id), user.id)
         db.session.commit()
         
         return jsonify(comment.to_dict()), 201
@@ -245,15 +668,18 @@ def create_app(config_name=None):
     @app.route('/api/v1/ticket/<ticket_id>/time', methods=['GET'])
     @login_required
     def get_time_tracking(ticket_id):
-        ticket = Ticket.query.get(ticket_id)
+        ticket = find_ticket(ticket_id)
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
         
-        time_entries = TimeEntry.query.filter_by(ticket_id=ticket_id).order_by(TimeEntry.date.desc()).all()
+        model = ArchivedTimeEntry if is_archived(ticket) else TimeEntry
+        time_entries = model.query.filter_by(ticket_id=ticket_id).order_by(model.date.desc()).all()
+        user_cache.prime([entry.user_id for entry in time_entries])
         return jsonify([entry.to_dict() for entry in time_entries])
     
     @app.route('/api/v1/ticket/<ticket_id>/time', methods=['POST'])
     @login_required
+    @idempotent
     def add_time_tracking(ticket_id):
         ticket = Ticket.query.get(ticket_id)
         if not ticket:
@@ -269,17 +695,57 @@ def create_app(config_name=None):
         
         time_entry = TimeEntry(
             description=data['description'],
-            hours=data['hours'],
+            hours=float(data['hours']),
             date=datetime.strptime(data['date'], '%Y-%m-%d').date(),
             ticket_id=ticket_id,
             user_id=user.id
         )
         
         db.session.add(time_entry)
+        add_logged_hours(ticket, time_entry.hours)
+        db.session.flush()
+        record_change('time_entry.created', time_entry.id, dict(time_entry.to_dict(), ticketId=ticket_id), user.id)
         db.session.commit()
         
         return jsonify(time_entry.to_dict()), 201
     
+    @app.route('/api/v1/reports/time', methods=['GET'])
+    @admin_required
+    def get_time_report():
+        group_by = [name for name in request.args.get('group_by', 'user').split(',') if name]
+        unknown = [name for name in group_by if name not in DIMENSIONS]
+        if unknown or len(set(group_by)) != len(group_by):
+            return jsonify({'error': f'group_by must be a list of distinct {", ".join(DIMENSIONS)}'}), 400
+        fmt = request.args.get('format', 'json')
+        if fmt not in ('json', 'csv'):
+            return jsonify({'error': 'format must be json or csv'}), 400
+        try:
+            start, end = (
+                datetime.strptime(request.args[name], '%Y-%m-%d').date() if request.args.get(name) else None
+                for name in ('from', 'to')
+            )
+        except ValueError:
+            return jsonify({'error': 'from and to must be dates as YYYY-MM-DD'}), 400
+        
+        rows, totals = aggregate_time(
+            group_by, start=start, end=end,
+            user_id=request.args.get('user_id'),
+            ticket_type=request.args.get('type'),
+            include_archived=request.args.get('include_archived', 'true').lower() == 'true'
+        )
+        if fmt == 'csv':
+            return app.response_class(
+                report_csv(group_by, rows), mimetype='text/csv',
+                headers={'Content-Disposition': 'attachment; filename=time-report.csv'}
+            )
+        return jsonify({
+            'groupBy': group_by,
+            'from': start,
+            'to': end,
+            'rows': rows,
+            'totals': totals
+        })
+    
     # User endpoints
     @app.route('/api/v1/users', methods=['GET'])
     @login_required
@@ -305,7 +771,7 @@ def create_app(config_name=None):
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        return jsonify(user.to_dict())
+        return with_etag(jsonify(user.to_dict()), user)
     
     @app.route('/api/v1/users', methods=['POST'])
     @admin_required
@@ -334,16 +800,40 @@ def create_app(config_name=None):
         user.set_password(data['password'])
         
         db.session.add(user)
+        autocomplete.invalidate('user')
+        db.session.flush()
+        record_change('user.created', user.id, user.to_dict(), get_jwt_identity())
         db.session.commit()
+        agent_index.invalidate()
+        autocomplete.put('user', user)
         
         return jsonify(user.to_dict()), 201
     
+    @app.route('/api/v1/users/bulk', methods=['POST'])
+    @admin_required
+    def create_users_bulk():
+        data = request.get_json()
+        users = data.get('users') if isinstance(data, dict) else None
+        if not isinstance(users, list) or not users:
+            return jsonify({'error': 'users must be a non-empty list'}), 400
+        
+        records = (
+            (index, row if isinstance(row, dict) else 'Expected a JSON object')
+            for index, row in enumerate(users, 1)
+        )
+        result = provision_users(records, actor_id=get_jwt_identity())
+        
+        return jsonify(result.to_dict()), 201 if result.imported else 400
+    
     @app.route('/api/v1/users/<user_id>', methods=['PUT'])
     @admin_required
     def update_user(user_id):
         user = User.query.get(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
+        failed = precondition_failed(user)
+        if failed:
+            return failed
         
         data = request.get_json()
         
@@ -366,9 +856,15 @@ def create_app(config_name=None):
             user.set_password(data['password'])
         
         user.updated_at = datetime.utcnow()
+        user_cache.invalidate(user.id)
+        autocomplete.invalidate('user')
+        db.session.flush()
+        record_change('user.updated', user.id, user.to_dict(), get_jwt_identity())
         db.session.commit()
+        agent_index.invalidate()
+        autocomplete.put('user', user)
         
-        return jsonify(user.to_dict())
+        return with_etag(jsonify(user.to_dict()), user)
     
     @app.route('/api/v1/users/<user_id>', methods=['DELETE'])
     @admin_required
@@ -378,16 +874,80 @@ def create_app(config_name=None):
             return jsonify({'error': 'User not found'}), 404
         
         db.session.delete(user)
+        forget_user(user_id)
+        user_cache.invalidate(user_id)
+        autocomplete.invalidate('user')
+        record_change('user.deleted', user_id, {'id': user_id}, get_jwt_identity())
         db.session.commit()
+        agent_index.invalidate()
+        autocomplete.remove('user', user_id)
         
         return jsonify({'message': 'User deleted successfully'})
     
+    @app.route('/api/v1/autocomplete', methods=['GET'])
+    @login_required
+    def get_autocomplete():
+        kind = request.args.get('kind')
+        if kind not in AUTOCOMPLETE_KINDS:
+            return jsonify({'error': f'kind must be one of {", ".join(AUTOCOMPLETE_KINDS)}'}), 400
+        limit = min(request.args.get('limit', app.config['AUTOCOMPLETE_LIMIT'], type=int), 50)
+        
+        return jsonify({
+            'kind': kind,
+            'results': autocomplete.search(kind, request.args.get('q', ''), limit)
+        })
+    
     # Client endpoints
     @app.route('/api/v1/clients', methods=['GET'])
     @login_required
     def get_clients():
-        clients = Client.query.filter_by(active=True).all()
-        return jsonify([client.to_dict() for client in clients])
+        search = request.args.get('q', '').strip().lower()
+        view = request.args.get('view', 'full')
+        if view not in ('full', 'picker'):
+            return jsonify({'error': 'view must be full or picker'}), 400
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        cursor = request.args.get('cursor')
+        
+        sort_name = func.lower(Client.name)
+        conditions = [Client.active.is_(True)]
+        if cursor:
+            try:
+                last_id, last_name = decode_cursor(cursor, str, str)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            conditions.append(or_(
+                sort_name > last_name,
+                and_(sort_name == last_name, Client.id > last_id)
+            ))
+        
+        # Pickers only need id and name: plain rows, no ORM objects or stats join
+        columns = [Client.name] if view == 'picker' else [Client]
+        if search:
+            # One index range scan per searched column; only the first rows
+            # of their union are joined back to clients
+            low, high = prefix_range(search)
+            matches = union(*[
+                select(Client.id, sort_name.label('sort_name'))
+                .where(*conditions, func.lower(column) >= low, func.lower(column) < high)
+                for column in (Client.name, Client.email, Client.contact_name)
+            ]).subquery()
+            query = select(Client.id, *columns, matches.c.sort_name).join(matches, matches.c.id == Client.id)
+            order = [matches.c.sort_name, matches.c.id]
+        else:
+            query = select(Client.id, *columns, sort_name.label('sort_name')).where(*conditions)
+            order = [sort_name, Client.id]
+        
+        rows = db.session.execute(query.order_by(*order).limit(limit + 1)).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if view == 'picker':
+            clients = [{'id': row.id, 'name': row.name} for row in rows]
+        else:
+            clients = [row.Client.to_dict() for row in rows]
+        return jsonify({
+            'clients': clients,
+            'nextCursor': encode_cursor(rows[-1].id, rows[-1].sort_name) if has_more else None
+        })
     
     @app.route('/api/v1/clients', methods=['POST'])
     @admin_required
@@ -408,10 +968,47 @@ def create_app(config_name=None):
         )
         
         db.session.add(client)
+        autocomplete.invalidate('client')
         db.session.commit()
+        autocomplete.put('client', client)
         
         return jsonify(client.to_dict()), 201
     
+    @app.route('/api/v1/clients/<client_id>/tickets', methods=['GET'])
+    @login_required
+    def get_client_tickets(client_id):
+        client = Client.query.get(client_id)
+        if not client:
+            return jsonify({'error': 'Client not found'}), 404
+        
+        status = request.args.get('status')
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        cursor = request.args.get('cursor')
+        
+        query = Ticket.query.filter(Ticket.client_id == client_id)
+        if status:
+            query = query.filter(Ticket.status == status)
+        if cursor:
+            try:
+                created_at, last_id = decode_cursor(cursor, datetime, str)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            query = query.filter(or_(
+                Ticket.created_at < created_at,
+                and_(Ticket.created_at == created_at, Ticket.id < last_id)
+            ))
+        
+        tickets = query.order_by(Ticket.created_at.desc(), Ticket.id.desc()).limit(limit + 1).all()
+        has_more = len(tickets) > limit
+        tickets = tickets[:limit]
+        
+        user_cache.prime([ticket.created_by for ticket in tickets] + [ticket.assigned_to for ticket in tickets])
+        return jsonify({
+            'client': client.to_dict(),
+            'tickets': [ticket.to_dict() for ticket in tickets],
+            'nextCursor': encode_cursor(tickets[-1].created_at, tickets[-1].id) if has_more else None
+        })
+    
     # Root endpoint
     @app.route('/', methods=['GET'])
     def root():
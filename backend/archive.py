@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, or_, literal, func, literal_column
+
+from models import db, Ticket, Comment, TimeEntry, ArchivedTicket, ArchivedComment, ArchivedTimeEntry
+from ticket_counts import count_tickets
+from outbox import record_batch, record_change
+
+# (hot table, archive table, column linking rows to their ticket)
+ARCHIVE_TABLES = (
+    (Ticket.__table__, ArchivedTicket.__table__, 'id'),
+    (Comment.__table__, ArchivedComment.__table__, 'ticket_id'),
+    (TimeEntry.__table__, ArchivedTimeEntry.__table__, 'ticket_id'),
+)
+
+
+def _source_value(source, target, name):
+    default = target.c[name].server_default
+    if default is None:
+        return source.c[name]
+    # Rows archived before the column existed hold NULL there; restore them with its default
+    return func.coalesce(source.c[name], literal_column(default.arg)).label(name)
+
+
+def _copy_rows(source, target, key, ticket_ids, archived_at=None):
+    """INSERT ... SELECT the rows of ``ticket_ids`` from one table into another"""
+    columns = [column.name for column in source.columns if column.name in target.columns]
+    selected = [_source_value(source, target, name) for name in columns]
+    if 'archived_at' in target.columns and 'archived_at' not in source.columns:
+        columns.append('archived_at')
+        selected.append(literal(archived_at, db.DateTime))
+    db.session.execute(
+        target.insert().from_select(columns, select(*selected).where(source.c[key].in_(ticket_ids)))
+    )
+
+
+def _move_tickets(ticket_ids, to_archive, archived_at=None):
+    pairs = ARCHIVE_TABLES if to_archive else [(archive, hot, key) for hot, archive, key in ARCHIVE_TABLES]
+    for source, target, key in pairs:
+        _copy_rows(source, target, key, ticket_ids, archived_at)
+    # The live rows exist on both sides of a move at this point
+    count_tickets(ticket_ids, sign=-1 if to_archive else 1)
+    # Children first so foreign keys never dangle mid-transaction
+    for source, _, key in reversed(pairs):
+        db.session.execute(source.delete().where(source.c[key].in_(ticket_ids)))
+
+
+def archive_resolved_tickets(older_than_days=None, batch_size=None, actor_id=None):
+    """Move resolved or hidden tickets untouched for ``older_than_days`` into the archive tables.
+
+    Each batch of tickets is moved together with its comments and time
+    entries in its own transaction, so a long run never holds the writer lock
+    for long and can be interrupted safely. Returns the number of tickets moved.
+    """
+    if older_than_days is None:
+        older_than_days = current_app.config['ARCHIVE_AFTER_DAYS']
+    if batch_size is None:
+        batch_size = current_app.config['ARCHIVE_BATCH_SIZE']
+
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    tickets = Ticket.__table__
+    candidates = select(tickets.c.id).where(
+        or_(tickets.c.is_complete.is_(True), tickets.c.hidden.is_(True)),
+        tickets.c.updated_at < cutoff
+    ).limit(batch_size)
+
+    moved = 0
+    while True:
+        ticket_ids = db.session.execute(candidates).scalars().all()
+        if not ticket_ids:
+            break
+        _move_tickets(ticket_ids, to_archive=True, archived_at=now)
+        record_batch('ticket.archived', ticket_ids, actor_id)
+        db.session.commit()
+        moved += len(ticket_ids)
+    return moved
+
+
+def restore_ticket(ticket_id, actor_id=None):
+    """Move an archived ticket and its children back into the hot tables"""
+    archived = ArchivedTicket.query.get(ticket_id)
+    if not archived:
+        return None
+    _move_tickets([ticket_id], to_archive=False)
+    ticket = Ticket.query.get(ticket_id)
+    # Count the restore as activity so the next archive run leaves it alone
+    ticket.updated_at = datetime.utcnow()
+    db.session.flush()
+    record_change('ticket.restored', ticket.id, ticket.to_dict(), actor_id)
+    db.session.commit()
+    return ticket
+
+
+def find_ticket(ticket_id):
+    """Look a ticket up in the hot table, falling back to the archive"""
+    return Ticket.query.get(ticket_id) or ArchivedTicket.query.get(ticket_id)
+
+
+def is_archived(ticket):
+    return isinstance(ticket, ArchivedTicket)
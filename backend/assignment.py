@@ -0,0 +1,192 @@
+import heapq
+import threading
+import time
+from itertools import count
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from models import db, User, TicketCount
+from tenancy import TenantLocal
+from ticket_counts import on_counts_adjusted
+
+# Statuses that no longer count towards an agent's load
+CLOSED_STATUSES = frozenset(['resolved', 'closed'])
+
+ASSIGNABLE_ROLE = 'agent'
+ACTIVE_STATUS = 'active'
+
+
+class AgentLoadIndex:
+    """Open-ticket counts per active agent, kept in memory.
+
+    Loads are seeded from ``ticket_counts`` (never from the tickets table)
+    and then follow every counter adjustment made in this process. Least
+    loaded lookups use a lazy min-heap per department plus one over all
+    agents: an update pushes a fresh ``(load, sequence, user_id)`` entry and
+    stale entries are discarded when they reach the top, so both updates and
+    picks are O(log n). Ties go to whoever was picked least recently.
+
+    Other workers' changes arrive through a full reload every
+    AGENT_INDEX_RESYNC_SECONDS; :meth:`invalidate` forces one sooner, e.g.
+    after an agent is added, removed or moved to another department.
+    """
+
+    def __init__(self, resync_interval=60.0):
+        self.resync_interval = resync_interval
+        self.loads = {}
+        self.departments = {}
+        self._sequence = {}
+        self._heaps = {}
+        self._rotation = {}
+        self._positions = {}
+        self._counter = count()
+        self._loaded_at = None
+        self._lock = threading.RLock()
+
+    def init_app(self, app):
+        self.resync_interval = app.config.get('AGENT_INDEX_RESYNC_SECONDS', self.resync_interval)
+        with app.app_context():
+            self.rebuild()
+
+    def rebuild(self):
+        """Reload the agent roster and their open-ticket counts"""
+        agents = db.session.execute(
+            select(User.id, User.department)
+            .where(User.status == ACTIVE_STATUS, User.role == ASSIGNABLE_ROLE)
+        ).all()
+        open_counts = dict(db.session.execute(
+            select(TicketCount.user_id, func.sum(TicketCount.count))
+            .where(TicketCount.status.not_in(CLOSED_STATUSES))
+            .group_by(TicketCount.user_id)
+        ).all())
+
+        with self._lock:
+            self.departments = {user_id: department for user_id, department in agents}
+            self.loads = {user_id: int(open_counts.get(user_id) or 0) for user_id in self.departments}
+            self._sequence = {}
+            self._heaps = {}
+            self._rotation = {}
+            for user_id in self.loads:
+                self._push(user_id)
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _fresh(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.resync_interval:
+            self.rebuild()
+
+    def _push(self, user_id):
+        sequence = self._sequence.get(user_id, 0)
+        entry = (self.loads[user_id], sequence, user_id)
+        for key in {None, self.departments[user_id]}:
+            heap = self._heaps.setdefault(key, [])
+            heapq.heappush(heap, entry)
+            if len(heap) > 4 * len(self.loads) + 16:
+                self._compact(key)
+
+    def _compact(self, key):
+        self._heaps[key] = [entry for entry in self._heaps[key] if self._valid(entry, key)]
+        heapq.heapify(self._heaps[key])
+
+    def _valid(self, entry, key):
+        load, sequence, user_id = entry
+        return (self.loads.get(user_id) == load and self._sequence.get(user_id, 0) == sequence
+                and (key is None or self.departments.get(user_id) == key))
+
+    def apply(self, deltas):
+        """Follow a ticket counter adjustment: ``{(user_id, status): delta}``"""
+        with self._lock:
+            for (user_id, status), delta in deltas.items():
+                if delta and user_id in self.loads and status not in CLOSED_STATUSES:
+                    self.loads[user_id] = max(0, self.loads[user_id] + delta)
+                    self._push(user_id)
+
+    def least_loaded(self, department=None):
+        """The agent with the fewest open tickets, optionally within one department"""
+        with self._lock:
+            self._fresh()
+            heap = self._heaps.get(department)
+            while heap:
+                entry = heap[0]
+                if self._valid(entry, department):
+                    user_id = entry[2]
+                    # Later picks among equally loaded agents go to someone else
+                    self._sequence[user_id] = next(self._counter) + 1
+                    self._push(user_id)
+                    return user_id
+                heapq.heappop(heap)
+            return None
+
+    def next_in_rotation(self, department=None):
+        """Round-robin over the agents, optionally within one department"""
+        with self._lock:
+            self._fresh()
+            members = self._rotation.get(department)
+            if members is None:
+                members = self._rotation[department] = sorted(
+                    user_id for user_id, agent_department in self.departments.items()
+                    if department is None or agent_department == department
+                )
+            if not members:
+                return None
+            # Positions survive a reload so the rotation doesn't restart
+            position = self._positions.get(department, 0) % len(members)
+            self._positions[department] = position + 1
+            return members[position]
+
+    def snapshot(self):
+        with self._lock:
+            self._fresh()
+            return [
+                {'userId': user_id, 'department': self.departments[user_id], 'openTickets': load}
+                for user_id, load in sorted(self.loads.items(), key=lambda item: (item[1], item[0]))
+            ]
+
+
+agent_index = TenantLocal(AgentLoadIndex)
+# Resolve the tenant's index per call, not the one current at import
+on_counts_adjusted(lambda deltas: agent_index.apply(deltas))
+
+# name -> strategy(index, department) returning a user id or None
+STRATEGIES = {}
+
+
+def assignment_strategy(name):
+    """Register an assignment strategy under ``name`` for AUTO_ASSIGN_STRATEGY"""
+    def register(strategy):
+        STRATEGIES[name] = strategy
+        return strategy
+    return register
+
+
+@assignment_strategy('round_robin')
+def round_robin(index, department):
+    return index.next_in_rotation()
+
+
+@assignment_strategy('least_loaded')
+def least_loaded(index, department):
+    return index.least_loaded()
+
+
+@assignment_strategy('department')
+def department_match(index, department):
+    """Least loaded agent in the ticket's department, else least loaded overall"""
+    return (department and index.least_loaded(department)) or index.least_loaded()
+
+
+def choose_assignee(ticket_type, department=None, strategy=None):
+    """Pick an agent for a new ticket, or None when nobody is available.
+
+    ``department`` defaults to AUTO_ASSIGN_TYPE_DEPARTMENTS[ticket_type].
+    """
+    config = current_app.config
+    strategy = STRATEGIES[strategy or config['AUTO_ASSIGN_STRATEGY']]
+    if department is None:
+        department = config['AUTO_ASSIGN_TYPE_DEPARTMENTS'].get(ticket_type)
+    return strategy(agent_index, department)
@@ -1,7 +1,11 @@
 from functools import wraps
 from flask import request, jsonify, current_app
 from flask_jwt_extended import create_access_token, decode_token, get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from sqlalchemy.orm.attributes import set_committed_value
 from models import User
+from tenancy import current_tenant
+from user_cache import user_cache
 from datetime import datetime
 import jwt
 
@@ -13,7 +17,8 @@ def create_token(user):
         additional_claims={
             'email': user.email,
             'is_admin': user.is_admin,
-            'role': user.role
+            'role': user.role,
+            'tenant': current_tenant()
         }
     )
 
@@ -35,22 +40,25 @@ def get_current_user():
         if user_id:
             user = User.query.get(user_id)
             print(f"Found user: {user}")
-            if user:
-                # Update last login
-                user.last_login = datetime.utcnow()
-                from models import db
-                db.session.commit()
             return user
         return None
     except Exception as e:
         print(f"Error getting current user: {e}")
         return None
 
+def get_current_user_record():
+    """Get the cached serialized record of the current user without loading the row"""
+    try:
+        verify_jwt_in_request()
+    except (JWTExtendedException, jwt.PyJWTError):
+        return None
+    return user_cache.get(get_jwt_identity())
+
 def login_required(f):
     """Decorator to require authentication"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        user = get_current_user()
+        user = get_current_user_record()
         if not user:
             return jsonify({'error': 'Authentication required'}), 401
         return f(*args, **kwargs)
@@ -60,10 +68,10 @@ def admin_required(f):
     """Decorator to require admin privileges"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        user = get_current_user()
+        user = get_current_user_record()
         if not user:
             return jsonify({'error': 'Authentication required'}), 401
-        if not user.is_admin:
+        if not user['isAdmin']:
             return jsonify({'error': 'Admin privileges required'}), 403
         return f(*args, **kwargs)
     return decorated_function
@@ -73,10 +81,10 @@ def role_required(required_role):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            user = get_current_user()
+            user = get_current_user_record()
             if not user:
                 return jsonify({'error': 'Authentication required'}), 401
-            if user.role != required_role and not user.is_admin:
+            if user['role'] != required_role and not user['isAdmin']:
                 return jsonify({'error': f'{required_role} role required'}), 403
             return f(*args, **kwargs)
         return decorated_function
@@ -86,5 +94,17 @@ def authenticate_user(email, password):
     """Authenticate a user with email and password"""
     user = User.query.filter_by(email=email).first()
     if user and user.check_password(password):
+        # A login isn't an edit: leave version (and so the ETag) and updated_at alone
+        from models import db
+        table = User.__table__
+        now = datetime.utcnow()
+        db.session.execute(
+            table.update().where(table.c.id == user.id)
+            .values(last_login=now, updated_at=table.c.updated_at)
+        )
+        set_committed_value(user, 'last_login', now)
+        # Refresh this worker's copy; other workers catch up when theirs expires
+        user_cache.put(user.id, user.to_dict())
+        db.session.commit()
         return user
     return None 
\ No newline at end of file
@@ -0,0 +1,200 @@
+import bisect
+import re
+import threading
+import time
+
+from flask import g
+from sqlalchemy import select
+
+from models import db, User, Client
+from database import get_cache_version, bump_cache_version, prefix_range
+from tenancy import TenantLocal
+
+WORD = re.compile(r'\w+')
+SEPARATOR = '\x00'
+
+
+def _user_record(row):
+    return {'id': row.id, 'name': row.name, 'email': row.email, 'role': row.role, 'status': row.status}
+
+
+def _client_record(row):
+    return {'id': row.id, 'name': row.name, 'email': row.email}
+
+
+# kind -> (cache_versions name, query of every indexed row, record of a row)
+KINDS = {
+    'user': (
+        'autocomplete_users',
+        lambda: select(User.id, User.name, User.email, User.role, User.status),
+        _user_record,
+    ),
+    'client': (
+        'autocomplete_clients',
+        lambda: select(Client.id, Client.name, Client.email).where(Client.active.is_(True)),
+        _client_record,
+    ),
+}
+
+
+def tokens(record):
+    """Lowercased words of the name plus the email address and its domain"""
+    name = (record.get('name') or '').casefold().replace(SEPARATOR, '')
+    words = set(name.split())
+    words.update(WORD.findall(name))
+    email = (record.get('email') or '').casefold().replace(SEPARATOR, '')
+    if email:
+        words.add(email)
+        words.add(email.partition('@')[2])
+    words.discard('')
+    return tuple(words)
+
+
+class PrefixIndex:
+    """Sorted ``token + SEPARATOR + id`` keys of one kind.
+
+    Keys are plain strings rather than ``(token, id)`` tuples because
+    sorting and bisecting strings is several times faster, and the
+    separator sorts before every other character, so the keys of all
+    tokens starting with a prefix stay contiguous.
+    """
+
+    def __init__(self, records=()):
+        self.records = {}
+        self.tokens = {}
+        keys = []
+        for record in records:
+            self.records[record['id']] = record
+            self.tokens[record['id']] = words = tokens(record)
+            keys.extend(word + SEPARATOR + record['id'] for word in words)
+        keys.sort()
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.records)
+
+    def put(self, record):
+        self.remove(record['id'])
+        self.records[record['id']] = record
+        self.tokens[record['id']] = words = tokens(record)
+        for word in words:
+            bisect.insort(self.keys, word + SEPARATOR + record['id'])
+
+    def remove(self, entity_id):
+        self.records.pop(entity_id, None)
+        for word in self.tokens.pop(entity_id, ()):
+            key = word + SEPARATOR + entity_id
+            i = bisect.bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key:
+                del self.keys[i]
+
+    def search(self, query, limit):
+        """Records with a token starting with every word of ``query``, in token order"""
+        words = query.casefold().replace(SEPARATOR, '').split()
+        if not words:
+            return []
+        # Scan the word matching the fewest keys; the others only filter
+        keys = self.keys
+        ranges = [(bisect.bisect_left(keys, low), bisect.bisect_left(keys, high), low)
+                  for low, high in map(prefix_range, words)]
+        start, end, scan = min(ranges, key=lambda r: r[1] - r[0])
+        rest = [word for word in words if word != scan]
+        found, seen = [], set()
+        for i in range(start, end):
+            entity_id = keys[i].partition(SEPARATOR)[2]
+            if entity_id in seen:
+                continue
+            seen.add(entity_id)
+            entity_tokens = self.tokens[entity_id]
+            if all(any(token.startswith(word) for token in entity_tokens) for word in rest):
+                found.append(self.records[entity_id])
+                if len(found) >= limit:
+                    break
+        return found
+
+
+class Autocomplete:
+    """In-memory prefix indexes of users and clients for typeahead pickers.
+
+    Both are built at startup. Handlers that create, change or delete a
+    user or client call :meth:`invalidate` before committing, which bumps the
+    kind's ``cache_versions`` row in the same transaction, and :meth:`put` or
+    :meth:`remove` after, which updates this worker's index at once. Other
+    workers compare that counter at most every AUTOCOMPLETE_CHECK_INTERVAL
+    and rebuild the kind when it moved, so lookups otherwise never touch the
+    database.
+    """
+
+    def __init__(self, check_interval=2.0):
+        self.check_interval = check_interval
+        self.indexes = {}
+        self._versions = {}
+        self._checked_at = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.check_interval = app.config.get('AUTOCOMPLETE_CHECK_INTERVAL', self.check_interval)
+        with app.app_context():
+            for kind in KINDS:
+                self.rebuild(kind)
+
+    def rebuild(self, kind, version=None):
+        name, query, record = KINDS[kind]
+        if version is None:
+            version = get_cache_version(name)
+        index = PrefixIndex(record(row) for row in db.session.execute(query()))
+        with self._lock:
+            self.indexes[kind] = index
+            self._versions[kind] = version
+            self._checked_at[kind] = time.monotonic()
+
+    def _fresh(self, kind):
+        now = time.monotonic()
+        if kind in self.indexes and now - self._checked_at.get(kind, 0.0) < self.check_interval:
+            return
+        version = get_cache_version(KINDS[kind][0])
+        if kind not in self.indexes or version != self._versions.get(kind):
+            self.rebuild(kind, version)
+        else:
+            self._checked_at[kind] = now
+
+    def search(self, kind, query, limit=10):
+        self._fresh(kind)
+        with self._lock:
+            return self.indexes[kind].search(query, limit)
+
+    def invalidate(self, kind):
+        """Tell other workers to rebuild ``kind``; call before the change is committed"""
+        name = KINDS[kind][0]
+        bump_cache_version(name)
+        # Remember the version this change creates so that put/remove can
+        # adopt it instead of this worker rebuilding for its own change
+        g.setdefault('autocomplete_versions', {})[kind] = get_cache_version(name)
+
+    def _applied(self, kind):
+        """Adopt this request's version when it directly follows the one the index has"""
+        version = g.get('autocomplete_versions', {}).pop(kind, None)
+        if version is not None and self._versions.get(kind) == version - 1:
+            self._versions[kind] = version
+
+    def put(self, kind, row):
+        """Add or replace one user or client in this worker's index; call after committing"""
+        with self._lock:
+            index = self.indexes.get(kind)
+            if index is None:
+                return
+            if kind == 'client' and not row.active:
+                index.remove(row.id)
+            else:
+                index.put(KINDS[kind][2](row))
+            self._applied(kind)
+
+    def remove(self, kind, entity_id):
+        with self._lock:
+            index = self.indexes.get(kind)
+            if index is not None:
+                index.remove(entity_id)
+                self._applied(kind)
+
+
+autocomplete = TenantLocal(Autocomplete)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark for bulk ticket import (importer.import_tickets).
+Generates synthetic NDJSON rows and times the end-to-end import into a
+throwaway SQLite database: parsing, validation, id and number allocation,
+the inserts, counters and the outbox record. A bare executemany of the
+validated rows into a second database shows how much of that is SQLite
+itself.
+
+Usage: python bench_import.py [--rows 200000] [--users 50] [--chunk-size 20000]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from flask import Flask
+
+from config import Config
+from models import db, Ticket
+from importer import TICKET_COLUMNS, RowValidator, _new_ids, import_tickets, read_ndjson
+from database import bulk_insert
+
+PRIORITIES = ['low', 'medium', 'high']
+TYPES = ['bug', 'support', 'feature', 'question']
+STATUSES = ['needs_support', 'in_progress', 'done']
+
+
+def make_lines(rows, emails):
+    lines = []
+    for i in range(rows):
+        lines.append(json.dumps({
+            'title': f'Imported ticket {i}: users cannot log in',
+            'detail': 'The login page shows an error after entering valid credentials.',
+            'status': STATUSES[i % len(STATUSES)],
+            'priority': PRIORITIES[i % len(PRIORITIES)],
+            'type': TYPES[i % len(TYPES)],
+            'is_complete': i % len(STATUSES) == 2,
+            'created_at': f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}T09:30:00',
+            'assigned_to': emails[i % len(emails)],
+        }))
+    return lines
+
+
+def make_app(path, chunk_size, batch_size):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['IMPORT_CHUNK_SIZE'] = chunk_size
+    app.config['IMPORT_BATCH_SIZE'] = batch_size
+    db.init_app(app)
+    return app
+
+
+def add_users(users):
+    now = '2024-01-01 00:00:00.000000'
+    rows = [(str(uuid.uuid4()), f'Agent {i}', f'agent{i}@example.com') for i in range(users)]
+    db.session.connection().exec_driver_sql(
+        'INSERT INTO users (id, name, email, password_hash, is_admin, role, status, version, created_at, updated_at) '
+        "VALUES (?, ?, ?, '', 0, 'agent', 'active', 1, ?, ?)",
+        [row + (now, now) for row in rows]
+    )
+    db.session.commit()
+    return rows[0][0], [email for _, _, email in rows]
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--chunk-size', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    for name, run in (('import_tickets', 'import'), ('bare executemany', 'bare')):
+        app = make_app(os.path.join(directory, f'{run}.db'), args.chunk_size, args.batch_size)
+        with app.app_context():
+            db.create_all()
+            creator, emails = add_users(args.users)
+            lines = make_lines(args.rows, emails)
+            if run == 'import':
+                elapsed, result = timed(lambda: import_tickets(read_ndjson(lines), creator))
+                assert result.imported == args.rows, result.to_dict()
+            else:
+                validate = RowValidator(creator)
+                rows = [validate(json.loads(line)) for line in lines]
+
+                def insert():
+                    for start in range(0, len(rows), args.chunk_size):
+                        chunk = rows[start:start + args.chunk_size]
+                        ids = _new_ids(len(chunk))
+                        bulk_insert(Ticket.__table__, TICKET_COLUMNS, [
+                            (ids[i], start + 1001 + i) + row for i, row in enumerate(chunk)
+                        ])
+                        db.session.commit()
+
+                elapsed, _ = timed(insert)
+            print(f'{name:18} {elapsed:7.2f}s  {args.rows / elapsed / 1e3:6.1f}k rows/s')
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for JSON encoding of a 100-ticket page.
+Compares Flask's default provider with FastJSONProvider on the stdlib and
+orjson paths, with and without pre-encoded user summaries.
+
+Usage: python bench_json.py [--tickets 100] [--repeat 200]
+"""
+
+import argparse
+import timeit
+import uuid
+from datetime import datetime, timedelta
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import json_provider
+from json_provider import FastJSONProvider, PreEncoded
+
+
+def make_user(i):
+    now = datetime(2024, 1, 1) + timedelta(minutes=i)
+    return {
+        'id': str(uuid.uuid4()),
+        'name': f'Agent {i}',
+        'email': f'agent{i}@company.com',
+        'isAdmin': False,
+        'role': 'agent',
+        'status': 'active',
+        'phone': '+1 (555) 123-4567',
+        'department': 'Technical Support',
+        'createdAt': now,
+        'updatedAt': now,
+        'lastLogin': now,
+    }
+
+
+def make_page(count, users, summary):
+    tickets = []
+    for i in range(count):
+        created = datetime(2024, 1, 1) + timedelta(hours=i)
+        tickets.append({
+            'id': str(uuid.uuid4()),
+            'Number': 1000 + i,
+            'title': f'Ticket {i}: users cannot log in',
+            'detail': 'The login page shows an error message after entering valid credentials. ' * 3,
+            'status': 'needs_support',
+            'priority': 'high',
+            'type': 'bug',
+            'isComplete': False,
+            'hidden': False,
+            'locked': False,
+            'createdAt': created,
+            'updatedAt': created,
+            'createdBy': summary(users[i % len(users)]),
+            'assignedTo': summary(users[(i + 1) % len(users)]),
+        })
+    return {'tickets': tickets, 'total': count, 'pages': 1, 'current_page': 1}
+
+
+def isoformat_all(value):
+    """What the serializers did before: strings for every datetime"""
+    if isinstance(value, dict):
+        return {k: isoformat_all(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [isoformat_all(v) for v in value]
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tickets', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    users = [make_user(i) for i in range(20)]
+    native_page = make_page(args.tickets, users, dict)
+    string_page = isoformat_all(native_page)
+
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = FastJSONProvider(app)
+
+    # The stdlib fallback is exactly the parent class path with our default hook
+    stdlib_dumps = lambda: DefaultJSONProvider.dumps(fast_provider, native_page)
+    cases = [
+        ('flask default, datetimes pre-formatted', lambda: default_provider.dumps(string_page)),
+        ('fast provider, stdlib fallback', stdlib_dumps),
+    ]
+    if json_provider.orjson is not None:
+        cases.append(('fast provider, orjson', lambda: fast_provider.dumps(native_page)))
+        if json_provider.Fragment is not None:
+            fragment_page = make_page(args.tickets, users, PreEncoded)
+            cases.append(('fast provider, orjson + pre-encoded users', lambda: fast_provider.dumps(fragment_page)))
+    else:
+        print('orjson is not installed; only the stdlib paths are measured')
+
+    print(f'Encoding a {args.tickets}-ticket page ({len(stdlib_dumps()) / 1024:.0f} KiB), best of 5 x {args.repeat}')
+    baseline = None
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=args.repeat, repeat=5)) / args.repeat
+        baseline = baseline or best
+        print(f'  {name:45s} {best * 1e6:9.1f} us/page  {baseline / best:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
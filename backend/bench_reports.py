@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the time report aggregation (reports.aggregate_time).
+Fills a throwaway SQLite database with synthetic time entries and times
+the streamed NumPy aggregation against a plain per-row Python loop over
+the same query and against GROUP BY in SQLite, for a few groupings.
+
+Usage: python bench_reports.py [--entries 10000000] [--users 200] [--tickets 200000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+from flask import Flask
+from sqlalchemy import func, select
+
+from models import db, User, Ticket, TimeEntry
+from reports import DIMENSIONS, aggregate_time, time_entries_query
+
+GROUPINGS = [('user',), ('user', 'week'), ('ticket',), ('type', 'month')]
+TYPES = ['bug', 'support', 'feature', 'question']
+
+
+def populate(entries, users, tickets, batch=200000):
+    rng = np.random.default_rng(7)
+    connection = db.session.connection()
+    now = '2024-01-01 00:00:00.000000'
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    connection.exec_driver_sql(
+        'INSERT INTO users (id, name, email, password_hash, is_admin, role, status, created_at, updated_at) '
+        "VALUES (?, ?, ?, '', 0, ?, ?, ?, ?)",
+        [(user_id, f'Agent {i}', f'agent{i}@example.com', 'agent', 'active', now, now)
+         for i, user_id in enumerate(user_ids)]
+    )
+    ticket_ids = [str(uuid.uuid4()) for _ in range(tickets)]
+    connection.exec_driver_sql(
+        'INSERT INTO tickets (id, number, title, detail, status, priority, type, is_complete, '
+        'created_by, created_at, updated_at, sla_flags) VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?, 0)',
+        [(ticket_id, 1000 + i, f'Ticket {i}', 'detail', 'open', 'medium', TYPES[i % len(TYPES)],
+          user_ids[i % users], now, now) for i, ticket_id in enumerate(ticket_ids)]
+    )
+    start = date(2023, 1, 1)
+    days = [(start + timedelta(days=i)).isoformat() for i in range(730)]
+    for offset in range(0, entries, batch):
+        n = min(batch, entries - offset)
+        user = rng.integers(0, users, n)
+        ticket = rng.integers(0, tickets, n)
+        day = rng.integers(0, len(days), n)
+        hours = np.round(rng.uniform(0.25, 4, n), 2)
+        db.session.connection().exec_driver_sql(
+            'INSERT INTO time_entries (id, description, hours, date, created_at, ticket_id, user_id) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(f'{offset + i:x}', 'work', h, days[d], now, ticket_ids[t], user_ids[u])
+             for i, (u, t, d, h) in enumerate(zip(user.tolist(), ticket.tolist(), day.tolist(), hours.tolist()))]
+        )
+        db.session.commit()
+
+
+def python_loop(group_by, chunk_size):
+    """The obvious version: stream the same rows and sum into a dict"""
+    sources = []
+    for name in group_by:
+        if DIMENSIONS[name][0] not in sources:
+            sources.append(DIMENSIONS[name][0])
+    columns = ['hours'] + sources
+    keys = [(columns.index(DIMENSIONS[name][0]), name) for name in group_by]
+    totals = defaultdict(float)
+    result = db.session.execute(time_entries_query(columns), execution_options={'yield_per': chunk_size})
+    for row in result:
+        key = []
+        for index, name in keys:
+            value = row[index]
+            if name == 'week':
+                day = date.fromisoformat(value)
+                value = day - timedelta(days=day.weekday())
+            elif name == 'month':
+                value = value[:7]
+            key.append(value)
+        totals[tuple(key)] += row[0]
+    return totals
+
+
+def sql_group_by(group_by):
+    entries, tickets = TimeEntry.__table__, Ticket.__table__
+    expressions = {
+        'user': entries.c.user_id,
+        'ticket': tickets.c.number,
+        'type': tickets.c.type,
+        'day': entries.c.date,
+        'week': func.date(entries.c.date, 'weekday 0', '-6 days'),
+        'month': func.strftime('%Y-%m', entries.c.date),
+    }
+    columns = [expressions[name] for name in group_by]
+    query = select(*columns, func.sum(entries.c.hours), func.count()).group_by(*columns)
+    if {'ticket', 'type'} & set(group_by):
+        query = query.select_from(entries.join(tickets, tickets.c.id == entries.c.ticket_id))
+    return db.session.execute(query).all()
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, default=10_000_000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--tickets', type=int, default=200_000)
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--skip-loop', action='store_true', help='Skip the slow per-row Python baseline.')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['REPORT_CHUNK_SIZE'] = args.chunk_size
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        elapsed, _ = timed(lambda: populate(args.entries, args.users, args.tickets))
+        print(f'Inserted {args.entries:,} time entries in {elapsed:.1f}s ({path})')
+
+        for group_by in GROUPINGS:
+            print(f'group_by={",".join(group_by)}')
+            elapsed, (rows, totals) = timed(lambda: aggregate_time(list(group_by), include_archived=False))
+            print(f'  numpy, streamed     {elapsed:7.2f}s  {args.entries / elapsed / 1e6:5.2f}M rows/s  '
+                  f'{len(rows):,} groups')
+            if not args.skip_loop:
+                elapsed, loop = timed(lambda: python_loop(group_by, args.chunk_size))
+                print(f'  python dict loop    {elapsed:7.2f}s  {args.entries / elapsed / 1e6:5.2f}M rows/s')
+                assert len(loop) == len(rows)
+            elapsed, grouped = timed(lambda: sql_group_by(group_by))
+            print(f'  sqlite GROUP BY     {elapsed:7.2f}s  {args.entries / elapsed / 1e6:5.2f}M rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+"""Single place ticket handlers report a change to.
+
+Handlers take ``history.snapshot(ticket)`` before modifying a ticket, then
+call :func:`ticket_changed` before committing. Every registered listener
+runs inside the same transaction, so derived data (history, counters, ...)
+commits or rolls back together with the ticket itself.
+"""
+
+_listeners = []
+
+
+def on_ticket_change(listener):
+    """Register ``listener(ticket, before, kind, actor_id)``; usable as a decorator"""
+    _listeners.append(listener)
+    return listener
+
+
+def ticket_changed(ticket, before, kind, actor_id=None):
+    """Notify listeners of a change; ``before`` is the snapshot, or None for a new ticket"""
+    for listener in _listeners:
+        listener(ticket, before, kind, actor_id)
@@ -0,0 +1,200 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, select
+
+from models import db, User, Ticket
+from archive import archive_resolved_tickets, restore_ticket
+from importer import import_tickets, read_ndjson, read_csv
+from provisioning import provision_users
+from ticket_counts import rebuild_ticket_counts
+from client_stats import rebuild_client_stats
+from sla import process_overdue
+from duplicates import reindex_signatures
+from similar import similar_index
+from triage import train_triage_model, retriage_open_tickets
+from tenancy import tenancy
+from webhooks import webhook_dispatcher
+from outbox import prune_changes
+from idempotency import prune_idempotency_keys
+
+tickets_cli = AppGroup('tickets', help='Ticket maintenance commands.')
+users_cli = AppGroup('users', help='User management commands.')
+tenants_cli = AppGroup('tenants', help='Commands across tenant databases.')
+webhooks_cli = AppGroup('webhooks', help='Outbound webhook commands.')
+
+
+@tickets_cli.command('archive')
+@click.option('--days', type=click.IntRange(min=1), default=None, help='Archive resolved tickets untouched for this many days.')
+@click.option('--batch-size', type=click.IntRange(min=1), default=None, help='Tickets moved per transaction.')
+def archive_command(days, batch_size):
+    """Move old resolved and hidden tickets into the archive tables"""
+    moved = archive_resolved_tickets(older_than_days=days, batch_size=batch_size)
+    click.echo(f'Archived {moved} tickets')
+
+
+@tickets_cli.command('restore')
+@click.argument('ticket_id')
+def restore_command(ticket_id):
+    """Move an archived ticket back into the live tables"""
+    ticket = restore_ticket(ticket_id)
+    if not ticket:
+        raise click.ClickException(f'Archived ticket {ticket_id} not found')
+    click.echo(f'Restored ticket #{ticket.number}')
+
+
+@tickets_cli.command('recount')
+def recount_command():
+    """Rebuild the per-agent ticket counters and per-client stats"""
+    rebuild_ticket_counts()
+    click.echo('Ticket counters rebuilt')
+    rebuild_client_stats()
+    click.echo('Client stats rebuilt')
+
+
+@tickets_cli.command('sla-check')
+def sla_check_command():
+    """Fire SLA warnings and breaches that are already due"""
+    checked = process_overdue()
+    click.echo(f'Checked {checked} tickets with SLA checkpoints due')
+
+
+@tickets_cli.command('reindex-duplicates')
+def reindex_duplicates_command():
+    """Recompute the duplicate-detection signatures of recent tickets"""
+    signed = reindex_signatures()
+    click.echo(f'Signed {signed} tickets')
+
+
+@tickets_cli.command('index-similar')
+@click.option('--full', is_flag=True, help='Rebuild from scratch instead of adding newly resolved tickets.')
+def index_similar_command(full):
+    """Add newly resolved tickets to the similar-ticket index"""
+    indexed = similar_index.update(full=full)
+    click.echo(f'Indexed {indexed} resolved tickets')
+
+
+@tickets_cli.command('triage-train')
+def triage_train_command():
+    """Train the priority/type classifier from resolved tickets"""
+    classes = train_triage_model()
+    if not classes:
+        raise click.ClickException('Not enough resolved tickets to train on')
+    for field, values in classes.items():
+        click.echo(f'{field}: {", ".join(values)}')
+
+
+@tickets_cli.command('triage')
+@click.option('--apply', is_flag=True, help='Write the suggestions instead of only counting them.')
+@click.option('--min-confidence', type=float, default=None, help='Overrides TRIAGE_MIN_CONFIDENCE.')
+def triage_command(apply, min_confidence):
+    """Re-triage open tickets still carrying the default priority or type"""
+    summary = retriage_open_tickets(apply=apply, min_confidence=min_confidence)
+    changes = ', '.join(f'{field} {count}' for field, count in summary['changes'].items())
+    click.echo(f"Scored {summary['scored']} tickets in {summary['seconds']}s; changes: {changes}; "
+               f"applied to {summary['applied']} tickets")
+
+
+@tickets_cli.command('prune-changes')
+@click.option('--days', type=int, default=None, help='Keep change records newer than this (CHANGES_RETENTION_DAYS).')
+def prune_changes_command(days):
+    """Delete old change records that every active webhook has been sent"""
+    deleted = prune_changes(days)
+    click.echo(f'Deleted {deleted} change records')
+
+
+@tickets_cli.command('prune-idempotency-keys')
+def prune_idempotency_keys_command():
+    """Delete Idempotency-Key records older than IDEMPOTENCY_KEY_TTL_HOURS"""
+    deleted = prune_idempotency_keys()
+    click.echo(f'Deleted {deleted} expired idempotency keys')
+
+
+@tickets_cli.command('import')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default=None,
+              help='Input format; guessed from the file extension by default.')
+@click.option('--created-by', default=None, help='Email of the user credited for rows without created_by.')
+@click.option('--batch-size', type=int, default=None, help='Rows per executemany.')
+@click.option('--chunk-size', type=int, default=None, help='Rows per transaction.')
+def import_command(source, fmt, created_by, batch_size, chunk_size):
+    """Bulk import tickets from an NDJSON or CSV file ('-' for stdin)"""
+    if fmt is None:
+        fmt = 'csv' if source.name.endswith('.csv') else 'ndjson'
+
+    if created_by:
+        creator = User.query.filter_by(email=created_by).first()
+    else:
+        creator = User.query.filter_by(is_admin=True).order_by(User.created_at).first()
+    if not creator:
+        raise click.ClickException('No user found to credit the imported tickets to')
+
+    records = read_csv(source) if fmt == 'csv' else read_ndjson(source)
+    result = import_tickets(records, creator.id, batch_size=batch_size, chunk_size=chunk_size)
+
+    for error in result.errors:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(f'Imported {result.imported} tickets, {result.failed} rows failed')
+    if result.stopped:
+        raise click.ClickException('Import stopped early; see the last error')
+
+
+@users_cli.command('provision')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default=None,
+              help='Input format; guessed from the file extension by default.')
+@click.option('--workers', type=int, default=None, help='Processes used for password hashing.')
+def provision_command(source, fmt, workers):
+    """Create users in bulk from an NDJSON or CSV file ('-' for stdin)"""
+    if fmt is None:
+        fmt = 'csv' if source.name.endswith('.csv') else 'ndjson'
+
+    records = read_csv(source) if fmt == 'csv' else read_ndjson(source)
+    result = provision_users(records, workers=workers)
+
+    for error in result.errors:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(f'Created {result.imported} users, {result.failed} rows failed')
+
+
+@webhooks_cli.command('deliver')
+def deliver_webhooks_command():
+    """Send every webhook batch that is due now (for when WEBHOOKS_ENABLED is off)"""
+    total = 0
+    while True:
+        sent = webhook_dispatcher.deliver_due()
+        if not sent:
+            break
+        total += sent
+    click.echo(f'Attempted {total} deliveries')
+
+
+@tenants_cli.command('list')
+def list_tenants_command():
+    """Show each tenant's database with its user and ticket counts"""
+    if not tenancy.tenants:
+        click.echo('No tenants configured (TENANTS); everything uses the default database')
+        return
+    for tenant in tenancy.tenants:
+        with tenancy.use(tenant):
+            users = db.session.execute(select(func.count()).select_from(User)).scalar()
+            tickets = db.session.execute(select(func.count()).select_from(Ticket)).scalar()
+            url = db.session.get_bind().url.render_as_string(hide_password=True)
+        click.echo(f'{tenant}\t{users} users\t{tickets} tickets\t{url}')
+
+
+@tenants_cli.command('exec', context_settings={'ignore_unknown_options': True, 'allow_interspersed_args': False})
+@click.option('--tenant', 'names', multiple=True, help='Tenant to run for; repeat for several. Defaults to all.')
+@click.argument('args', nargs=-1, required=True, type=click.UNPROCESSED)
+def exec_command(names, args):
+    """Run another command once per tenant, e.g. ``flask tenants exec tickets recount``"""
+    unknown = set(names) - set(tenancy.tenants)
+    if unknown:
+        raise click.BadParameter(f"unknown tenant {', '.join(sorted(unknown))}", param_hint='--tenant')
+    if not tenancy.tenants:
+        raise click.ClickException('No tenants configured (TENANTS)')
+    obj = click.get_current_context().obj
+    for tenant in names or tenancy.tenants:
+        click.echo(f'[{tenant}]')
+        with tenancy.use(tenant):
+            current_app.cli.main(args=list(args), prog_name='flask', standalone_mode=False, obj=obj)
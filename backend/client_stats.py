@@ -0,0 +1,99 @@
+from collections import defaultdict
+
+from sqlalchemy import case, func, literal, select, union_all
+
+from models import db, Ticket, TimeEntry, ArchivedTicket, ArchivedTimeEntry, ClientStats
+from changes import on_ticket_change
+from history import previous
+from ticket_counts import UPSERT_DIALECTS
+
+COLUMNS = ('open_tickets', 'resolved_tickets', 'logged_hours')
+
+
+def _status_column(is_complete):
+    return 'resolved_tickets' if is_complete else 'open_tickets'
+
+
+def adjust_client_stats(deltas):
+    """Apply ``{client_id: {column: delta}}`` to the stats table in the current transaction.
+
+    Tickets without a client aren't counted.
+    """
+    table = ClientStats.__table__
+    upsert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    for client_id, changes in deltas.items():
+        changes = {column: delta for column, delta in changes.items() if delta}
+        if client_id is None or not changes:
+            continue
+        increments = {column: table.c[column] + delta for column, delta in changes.items()}
+        if upsert is not None:
+            db.session.execute(
+                upsert(table).values(client_id=client_id, **changes).on_conflict_do_update(
+                    index_elements=['client_id'], set_=increments
+                )
+            )
+            continue
+        updated = db.session.execute(
+            table.update().where(table.c.client_id == client_id).values(**increments)
+        ).rowcount
+        if not updated:
+            db.session.execute(table.insert().values(client_id=client_id, **changes))
+
+
+@on_ticket_change
+def count_client_ticket(ticket, before, kind, actor_id=None):
+    """Move a ticket between its client's open and resolved counts, or between clients"""
+    old_client, new_client = previous(before, 'client_id'), ticket.client_id
+    old_column = _status_column(previous(before, 'is_complete'))
+    new_column = _status_column(ticket.is_complete)
+    if before is not None and (old_client, old_column) == (new_client, new_column):
+        return
+
+    deltas = defaultdict(lambda: defaultdict(int))
+    if before is not None:
+        deltas[old_client][old_column] -= 1
+    deltas[new_client][new_column] += 1
+    if before is not None and old_client != new_client:
+        # Hours already logged on the ticket follow it to the new client
+        hours = db.session.execute(
+            select(func.coalesce(func.sum(TimeEntry.hours), 0.0)).where(TimeEntry.ticket_id == ticket.id)
+        ).scalar()
+        deltas[old_client]['logged_hours'] -= hours
+        deltas[new_client]['logged_hours'] += hours
+    adjust_client_stats(deltas)
+
+
+def add_logged_hours(ticket, hours):
+    """Count a new time entry against the ticket's client"""
+    adjust_client_stats({ticket.client_id: {'logged_hours': hours}})
+
+
+def rebuild_client_stats():
+    """Recompute every client's stats from live and archived tickets; used to backfill or repair"""
+    counts = union_all(*[
+        select(
+            tickets.c.client_id,
+            func.sum(case((tickets.c.is_complete.is_(True), 0), else_=1)).label('open_tickets'),
+            func.sum(case((tickets.c.is_complete.is_(True), 1), else_=0)).label('resolved_tickets'),
+            literal(0.0).label('logged_hours'),
+        ).where(tickets.c.client_id.is_not(None)).group_by(tickets.c.client_id)
+        for tickets in (Ticket.__table__, ArchivedTicket.__table__)
+    ] + [
+        select(
+            tickets.c.client_id, literal(0).label('open_tickets'), literal(0).label('resolved_tickets'),
+            func.sum(entries.c.hours).label('logged_hours'),
+        ).select_from(entries.join(tickets, tickets.c.id == entries.c.ticket_id))
+        .where(tickets.c.client_id.is_not(None)).group_by(tickets.c.client_id)
+        for entries, tickets in (
+            (TimeEntry.__table__, Ticket.__table__), (ArchivedTimeEntry.__table__, ArchivedTicket.__table__)
+        )
+    ]).subquery()
+
+    db.session.execute(ClientStats.__table__.delete())
+    db.session.execute(ClientStats.__table__.insert().from_select(
+        ['client_id'] + list(COLUMNS),
+        select(counts.c.client_id, *[func.sum(counts.c[column]) for column in COLUMNS])
+        .group_by(counts.c.client_id)
+    ))
+    db.session.commit()
+
@@ -0,0 +1,164 @@
+import gzip
+import threading
+from collections import OrderedDict
+from hashlib import blake2b
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _gzip(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _zstd(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+CODECS = {'gzip': _gzip}
+if brotli is not None:
+    CODECS['br'] = _brotli
+if zstandard is not None:
+    CODECS['zstd'] = _zstd
+
+
+def coded_etag(tag, coding):
+    """Strong ETag of the ``coding`` representation of a resource tagged ``tag``"""
+    return f'{tag}-{coding}'
+
+
+def uncoded_etag(tag):
+    """The resource's own tag from a possibly coded one"""
+    base, _, coding = tag.rpartition('-')
+    return base if base and coding in CODECS else tag
+
+
+def parse_accept_encoding(header):
+    """Return {coding: q} for an Accept-Encoding header"""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+class CompressedBodyCache:
+    """LRU of compressed bodies keyed by (body digest, coding), bounded by total bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class Compressor:
+    """Compress responses according to Accept-Encoding.
+
+    Identical bodies (a ticket list nobody has changed, the same user page)
+    are compressed once: the compressed bytes are cached under a digest of the
+    uncompressed body and reused on later hits.
+
+    A strong ETag gets a ``-<coding>`` suffix on compressed responses, since
+    each coding is a different byte sequence; :func:`uncoded_etag` strips it
+    again when validators come back in If-Match or If-None-Match.
+    """
+
+    def __init__(self, app=None):
+        self.cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('COMPRESS_ENABLED', True):
+            return
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.levels = app.config['COMPRESS_LEVELS']
+        self.mimetypes = frozenset(app.config['COMPRESS_MIMETYPES'])
+        self.preference = [coding for coding in app.config['COMPRESS_ALGORITHMS'] if coding in CODECS]
+        self.cache = CompressedBodyCache(app.config['COMPRESS_CACHE_BYTES'])
+        app.after_request(self.compress)
+
+    def choose_coding(self, header):
+        accepted = parse_accept_encoding(header)
+        wildcard = accepted.get('*', 0.0)
+        best, best_q = None, 0.0
+        for coding in self.preference:
+            q = accepted.get(coding, wildcard)
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def compress(self, response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.mimetype not in self.mimetypes
+                or 'Content-Encoding' in response.headers
+                or not 200 <= response.status_code < 300):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        coding = self.choose_coding(request.headers.get('Accept-Encoding', ''))
+        if coding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        key = (blake2b(data, digest_size=16).digest(), coding)
+        body = self.cache.get(key)
+        if body is None:
+            body = CODECS[coding](data, self.levels[coding])
+            self.cache.put(key, body)
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = coding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(coded_etag(etag, coding))
+        return response
+
+
+compressor = Compressor()
@@ -11,6 +11,17 @@ class Config:
         'sqlite:///peppermint.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Multi-tenancy: each tenant id in TENANTS gets a database of its own,
+    # chosen per request by the token's tenant claim (TENANT_HEADER at login).
+    # Empty means a single tenant in SQLALCHEMY_DATABASE_URI.
+    TENANTS = [name.strip() for name in os.environ.get('TENANTS', '').split(',') if name.strip()]
+    TENANT_DATABASE_URI = os.environ.get('TENANT_DATABASE_URI') or \
+        'sqlite:///tenants/{tenant}.db'   # '{tenant}' is replaced by the tenant id
+    TENANT_SCHEMAS = os.environ.get('TENANT_SCHEMAS', 'false').lower() == 'true'  # PostgreSQL: one schema per tenant in DATABASE_URL instead
+    TENANT_HEADER = 'X-Tenant'
+    TENANT_POOL_SIZE = 5              # connections kept per tenant
+    TENANT_MAX_OVERFLOW = 5
+    
     # JWT Configuration
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key-change-in-production'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=8)
@@ -22,6 +33,182 @@ class Config:
     TICKETS_PER_PAGE = 20
     USERS_PER_PAGE = 20
     
+    # User cache (serialized user records shared by auth and serializers)
+    USER_CACHE_SIZE = 4096
+    USER_CACHE_TTL = 300              # seconds before a record is reloaded
+    USER_CACHE_CHECK_INTERVAL = 1.0   # seconds between cross-worker version checks
+    
+    # Keep embedded user summaries as pre-encoded JSON (needs orjson >= 3.9)
+    JSON_CACHE_FRAGMENTS = os.environ.get('JSON_CACHE_FRAGMENTS', 'true').lower() == 'true'
+    
+    # SLA targets: (priority, type) -> (minutes to first response, minutes to
+    # resolution). A type of None covers every type without its own entry.
+    SLA_POLICIES = {
+        ('urgent', None): (30, 240),
+        ('high', None): (60, 480),
+        ('high', 'bug'): (30, 480),
+        ('medium', None): (240, 2880),
+        ('low', None): (480, 10080),
+    }
+    SLA_WARNING_FRACTION = 0.8   # near-breach once this much of the target has elapsed
+    SLA_SCHEDULER_ENABLED = os.environ.get('SLA_SCHEDULER_ENABLED', 'true').lower() == 'true'
+    SLA_TICK_SECONDS = 1.0       # timer wheel resolution
+    SLA_WHEEL_SLOTS = 64
+    SLA_WHEEL_LEVELS = 4         # 64**4 ticks (~194 days) before a timer overflows
+
+    # Automatic assignment of new tickets sent without assigned_to
+    AUTO_ASSIGN_ENABLED = os.environ.get('AUTO_ASSIGN_ENABLED', 'true').lower() == 'true'
+    AUTO_ASSIGN_STRATEGY = os.environ.get('AUTO_ASSIGN_STRATEGY', 'department')  # or round_robin, least_loaded
+    # Department whose agents handle a ticket type, for the department strategy
+    AUTO_ASSIGN_TYPE_DEPARTMENTS = {
+        'bug': 'Technical Support',
+        'support': 'Customer Service',
+    }
+    AGENT_INDEX_RESYNC_SECONDS = 60   # reload loads to pick up other workers' changes
+
+    # Near-duplicate detection (MinHash signatures in an in-memory LSH index)
+    DUPLICATE_WINDOW_DAYS = 30      # only tickets this recent are candidates
+    DUPLICATE_SYNC_SECONDS = 5      # pick up signatures written by other workers
+    DUPLICATE_THRESHOLD = 0.5       # estimated Jaccard similarity of the text shingles
+    DUPLICATE_LIMIT = 5
+
+    # Similar resolved tickets (TF-IDF segments memory-mapped from disk);
+    # rebuild with ``flask tickets index-similar``, e.g. from cron
+    SIMILAR_INDEX_PATH = os.environ.get('SIMILAR_INDEX_PATH')  # default: instance/similar
+    SIMILAR_HASH_BITS = 20          # words hash into 2**20 term buckets
+    SIMILAR_SEGMENT_SIZE = 100000   # tickets per segment
+    SIMILAR_MAX_DELTA_SEGMENTS = 8  # incremental segments before a full rebuild
+    SIMILAR_MAX_DF = 0.5            # ignore query words found in more than this share of tickets
+    SIMILAR_MAX_POSTINGS = 2000     # heaviest postings read per word and segment
+    SIMILAR_RELOAD_SECONDS = 10     # how often workers look for a new build
+    SIMILAR_LIMIT = 5
+    SIMILAR_COMMENTS = 3            # latest comments returned per similar ticket
+
+    # Priority/type suggestions from a naive Bayes model trained offline
+    # with ``flask tickets triage-train``
+    TRIAGE_MODEL_PATH = os.environ.get('TRIAGE_MODEL_PATH')  # default: instance/triage.npz
+    TRIAGE_HASH_BITS = 16           # words hash into 2**16 features
+    TRIAGE_ALPHA = 1.0              # additive smoothing
+    TRIAGE_MIN_EXAMPLES = 5         # classes seen less often are not predicted
+    TRIAGE_MIN_CONFIDENCE = 0.7     # needed before re-triage replaces a default
+    TRIAGE_BATCH_SIZE = 5000        # tickets scored per batch by re-triage
+    TRIAGE_RELOAD_SECONDS = 60      # how often workers look for a retrained model
+
+    # Responses to ticket, comment and time entry creation sent with an
+    # Idempotency-Key are replayed to retries for this long
+    IDEMPOTENCY_KEY_TTL_HOURS = 24
+    
+    # Change stream (transactional outbox) at GET /api/v1/changes
+    CHANGES_PAGE_SIZE = 1000
+    CHANGES_MAX_PAGE_SIZE = 10000
+    CHANGES_BATCH_SIZE = 1000       # ids listed per record of a bulk import, archive or provisioning
+    CHANGES_RETENTION_DAYS = 30     # ``flask tickets prune-changes`` keeps newer records and unsent ones
+    
+    # Outbound webhooks: a background worker POSTs each subscription the
+    # change records after its offset, in signed batches
+    WEBHOOKS_ENABLED = os.environ.get('WEBHOOKS_ENABLED', 'true').lower() == 'true'
+    WEBHOOK_POLL_SECONDS = 1.0        # idle wait between looks at the queue
+    WEBHOOK_BATCH_SIZE = 100          # events per POST
+    WEBHOOK_WORKERS = 8               # endpoints posted to in parallel (and connections kept per host)
+    WEBHOOK_POOL_CONNECTIONS = 32     # hosts with a pool of keep-alive connections
+    WEBHOOK_TIMEOUT_SECONDS = 10
+    WEBHOOK_LEASE_SECONDS = 120       # a claimed batch is retried after this if the worker dies
+    WEBHOOK_BACKOFF_SECONDS = 10      # first retry delay, doubled per attempt
+    WEBHOOK_BACKOFF_MAX_SECONDS = 3600
+    WEBHOOK_MAX_ATTEMPTS = 12         # then the batch goes to webhook_dead_letters
+
+    # Typeahead over users and clients (in-memory prefix indexes)
+    AUTOCOMPLETE_LIMIT = 10
+    AUTOCOMPLETE_CHECK_INTERVAL = 2.0   # seconds between cross-worker version checks
+
+    # Rate Limiting
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
+    # 'shared' keeps buckets in a memory-mapped file in the instance folder so
+    # every worker sees the same state; 'memory' is per process; anything else
+    # is used as the path of the shared file
+    RATELIMIT_STORAGE = os.environ.get('RATELIMIT_STORAGE', 'shared')
+    RATELIMIT_SLOTS = 65536
+    # (burst capacity, refill tokens per second) per route group
+    RATELIMIT_GROUPS = {
+        'login': (5, 5 / 60),
+        'writes': (60, 1.0),
+        'reads': (300, 10.0),
+    }
+    RATELIMIT_EXEMPT = ('health_check', 'root')
+    
+    # Archival of resolved tickets
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS') or 180)
+    ARCHIVE_BATCH_SIZE = 500
+    
+    # Bulk ticket import
+    IMPORT_BATCH_SIZE = 1000    # rows per executemany
+    IMPORT_CHUNK_SIZE = 20000   # rows per transaction
+    IMPORT_MAX_ERRORS = 1000    # per-row errors kept in the report
+    
+    # Bulk user provisioning
+    PROVISION_BATCH_SIZE = 500
+    PROVISION_HASH_WORKERS = None  # processes used for bcrypt; None = one per CPU
+    
+    # Response compression
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_MIN_SIZE = 1024       # bytes; smaller bodies aren't worth the CPU
+    # Server preference; br and zstd are used when brotli / zstandard are installed
+    COMPRESS_ALGORITHMS = ('zstd', 'br', 'gzip')
+    # Low-to-mid levels: most of the size win for a fraction of the latency
+    COMPRESS_LEVELS = {'gzip': 5, 'br': 4, 'zstd': 3}
+    COMPRESS_MIMETYPES = ('application/json', 'text/csv', 'text/plain', 'text/html')
+    COMPRESS_CACHE_BYTES = 32 * 1024 * 1024
+    
+    # SQL query budgets: count statements per request and flag N+1 patterns
+    QUERY_BUDGET_ENABLED = os.environ.get('QUERY_BUDGET_ENABLED', 'false').lower() == 'true'
+    QUERY_BUDGET_ENFORCE = False       # raise instead of logging a warning
+    QUERY_BUDGET_DEFAULT = 10
+    QUERY_BUDGET_REPEAT_THRESHOLD = 3  # same statement shape this often = N+1
+    # Per-endpoint ceilings; a cold user cache costs one extra IN query
+    QUERY_BUDGETS = {
+        'login': 4,
+        'get_current_user_info': 2,
+        'update_profile': 8,
+        'get_tickets': 6,
+        'get_my_queue': 5,
+        'get_ticket': 3,
+        'create_ticket': 17,  # includes reloading an agent index invalidated by a user change
+        'update_ticket': 12,
+        'close_ticket': 9,
+        'reopen_ticket': 9,
+        'get_ticket_events': 3,
+        'get_ticket_duplicates': 3,
+        'get_similar_tickets': 5,
+        'restore_archived_ticket': 14,
+        'get_comments': 4,
+        'add_comment': 9,
+        'get_time_tracking': 4,
+        'add_time_tracking': 9,
+        'get_time_report': 5,
+        'get_users': 2,
+        'get_user': 2,
+        'create_user': 6,
+        'update_user': 9,
+        'delete_user': 12,
+        'get_autocomplete': 4,
+        'get_clients': 2,
+        'create_client': 5,
+        'get_client_tickets': 4,
+        'get_changes': 2,
+    }
+    # Batch endpoints whose statement count grows with the payload by design
+    QUERY_BUDGET_EXEMPT = ('import_ticket_batch', 'create_users_bulk', 'archive_tickets', 'merge_ticket_duplicates',
+                          'retriage_tickets')
+
+    # Slow query log (aggregated report at GET /api/v1/admin/slow-queries)
+    SLOW_QUERY_ENABLED = os.environ.get('SLOW_QUERY_ENABLED', 'true').lower() == 'true'
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '200'))
+    SLOW_QUERY_MAX_STATEMENTS = 500   # distinct statement shapes kept
+    SLOW_QUERY_STACK_DEPTH = 8
+
+    # Time reports
+    REPORT_CHUNK_SIZE = 50000       # rows fetched and aggregated at a time
+
     # File Upload
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     UPLOAD_FOLDER = 'uploads'
@@ -51,6 +238,17 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///peppermint_test.db'
+    RATELIMIT_ENABLED = False
+    QUERY_BUDGET_ENABLED = True
+    QUERY_BUDGET_ENFORCE = True
+    SLA_SCHEDULER_ENABLED = False
+    WEBHOOKS_ENABLED = False
+    # One process, so nothing to pick up from other workers; periodic checks
+    # would only make a request's query count depend on how long tests take
+    USER_CACHE_CHECK_INTERVAL = 3600
+    AUTOCOMPLETE_CHECK_INTERVAL = 3600
+    DUPLICATE_SYNC_SECONDS = 3600
+    AGENT_INDEX_RESYNC_SECONDS = 3600
 
 config = {
     'development': DevelopmentConfig,
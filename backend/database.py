@@ -1,5 +1,11 @@
-from models import db, User, Ticket, Comment, TimeEntry, Client
+from models import db, User, Ticket, Comment, TimeEntry, Client, ArchivedTicket, CacheVersion
 from datetime import datetime, date
+from sqlalchemy import func, inspect
+from sqlalchemy.schema import CreateIndex
+import base64
+from ticket_counts import rebuild_ticket_counts
+from duplicates import reindex_signatures
+from client_stats import rebuild_client_stats
 import uuid
 
 def init_db(app):
@@ -8,11 +14,64 @@ def init_db(app):
     db.init_app(app)
     
     with app.app_context():
-        print("Creating database tables...")
-        db.create_all()
-        print("Seeding database...")
-        seed_database()
-        print("Database initialization complete!")
+        prepare_database()
+
+def prepare_database():
+    """Create, migrate, seed and backfill the database the session is routed to"""
+    engine = db.session.get_bind()
+    print("Creating database tables...")
+    existing_tables = set(inspect(engine).get_table_names())
+    db.metadata.create_all(engine)
+    ensure_schema(engine)
+    print("Seeding database...")
+    seed_database()
+    backfill_new_tables(existing_tables)
+    print("Database initialization complete!")
+
+def ensure_schema(engine):
+    """Bring an existing database up to date with the models.
+
+    create_all only creates missing tables; columns and indexes added to
+    tables that already exist are created here. New columns are added as
+    nullable unless they have a server default, since existing rows have no
+    value for them.
+    """
+    dialect = engine.dialect
+    ddl = dialect.ddl_compiler(dialect, None)
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                sql = 'ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    table.name, column.name, column.type.compile(dialect=dialect)
+                )
+                default = ddl.get_column_default_string(column)
+                if default is not None:
+                    sql += ' DEFAULT ' + default
+                    if not column.nullable:
+                        sql += ' NOT NULL'
+                print(f"Adding column {table.name}.{column.name}...")
+                connection.exec_driver_sql(sql)
+        # IF NOT EXISTS rather than checkfirst: expression indexes can't be
+        # reflected, so checkfirst would try to create them again
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+
+def backfill_new_tables(existing_tables):
+    """Fill derived tables that were just created from the data already there"""
+    if 'ticket_counts' not in existing_tables:
+        print("Building ticket counters...")
+        rebuild_ticket_counts()
+    if 'ticket_signatures' not in existing_tables:
+        print("Signing recent tickets for duplicate detection...")
+        reindex_signatures()
+    if 'client_stats' not in existing_tables:
+        print("Building client stats...")
+        rebuild_client_stats()
 
 def seed_database():
     """Seed the database with initial data"""
@@ -208,7 +267,77 @@ def seed_database():
 
 def get_next_ticket_number():
     """Get the next available ticket number"""
-    last_ticket = Ticket.query.order_by(Ticket.number.desc()).first()
-    if last_ticket:
-        return last_ticket.number + 1
-    return 1001 
\ No newline at end of file
+    # Archived tickets keep their numbers, so both tables count
+    last_number = max(
+        db.session.query(func.max(Ticket.number)).scalar() or 0,
+        db.session.query(func.max(ArchivedTicket.number)).scalar() or 0
+    )
+    if last_number:
+        return last_number + 1
+    return 1001 
+
+def get_cache_version(name):
+    """Read the current version counter for a named cache"""
+    version = db.session.query(CacheVersion.version).filter_by(name=name).scalar()
+    return version or 0
+
+def bump_cache_version(name):
+    """Increment a cache version counter inside the current transaction"""
+    updated = CacheVersion.query.filter_by(name=name).update(
+        {CacheVersion.version: CacheVersion.version + 1}, synchronize_session=False
+    )
+    if not updated:
+        db.session.add(CacheVersion(name=name, version=1))
+
+def bulk_insert(table, columns, rows):
+    """Insert many rows with a single driver-level executemany.
+
+    ``rows`` are tuples in ``columns`` order. This bypasses SQLAlchemy's
+    per-row parameter processing, which dominates the cost of large batches,
+    so values must already be in a form the driver accepts.
+    """
+    connection = db.session.connection()
+    dialect = connection.dialect
+    marker = '?' if dialect.paramstyle == 'qmark' else '%s'
+    if dialect.name == 'sqlite':
+        # Store datetimes exactly as SQLAlchemy's SQLite DateTime type does
+        positions = [i for i, name in enumerate(columns) if isinstance(table.c[name].type, db.DateTime)]
+        if positions:
+            converted = []
+            for row in rows:
+                row = list(row)
+                for i in positions:
+                    if row[i] is not None:
+                        row[i] = row[i].isoformat(' ', 'microseconds')
+                converted.append(tuple(row))
+            rows = converted
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        table.name, ', '.join(columns), ', '.join([marker] * len(columns))
+    )
+    connection.exec_driver_sql(sql, rows)
+
+def encode_cursor(*values):
+    """Opaque keyset pagination cursor for the sort key of the last row on a page"""
+    raw = '|'.join(value.isoformat() if isinstance(value, datetime) else str(value) for value in values)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, *types):
+    """Inverse of encode_cursor; raises ValueError for a cursor that wasn't ours.
+
+    Only the last value may itself contain ``|``.
+    """
+    try:
+        parts = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|', len(types) - 1)
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if len(parts) != len(types):
+        raise ValueError('Invalid cursor')
+    return tuple(datetime.fromisoformat(part) if kind is datetime else kind(part) for part, kind in zip(parts, types))
+
+def prefix_range(prefix):
+    """``(low, high)`` bounds matching exactly the strings that start with ``prefix``.
+
+    ``low <= column < high`` is an index range scan, which LIKE 'prefix%'
+    only is under collation rules the database may not apply.
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
@@ -0,0 +1,324 @@
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import event, func, select
+
+from models import db, Ticket, Comment, TicketSignature
+from changes import on_ticket_change, ticket_changed
+from history import previous, snapshot
+from tenancy import TenantLocal
+
+# Changing any of these invalidates stored signatures: rebuild them with
+# ``flask tickets reindex-duplicates``.
+NUM_PERM = 64
+BANDS = 16              # 16 bands of 4 rows: pairs above ~0.5 similarity collide
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 4        # characters
+SEED = 20240601
+
+_rng = np.random.default_rng(SEED)
+# Multiply-shift hashing: odd 64-bit multipliers, keep the high 32 bits
+_A = _rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+_SHIFT = np.uint64(32)
+_EMPTY = np.full(NUM_PERM, 0xFFFFFFFF, dtype=np.uint32)
+
+# Session.info key for index changes waiting for their transaction to commit
+PENDING_KEY = 'pending_duplicate_index'
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def shingles(text):
+    """Hashes of the overlapping character n-grams of normalized text"""
+    normalized = ' '.join(_WORD.findall(text.lower()))
+    if len(normalized) <= SHINGLE_SIZE:
+        return {zlib.crc32(normalized.encode('utf-8'))} if normalized else set()
+    data = normalized.encode('utf-8')
+    return {zlib.crc32(data[i:i + SHINGLE_SIZE]) for i in range(len(data) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """MinHash signature of ``text`` as NUM_PERM uint32 values"""
+    hashes = shingles(text)
+    if not hashes:
+        return _EMPTY.copy()
+    x = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+    return ((x[:, None] * _A + _B) >> _SHIFT).min(axis=0).astype(np.uint32)
+
+
+def ticket_text(title, detail):
+    return f'{title or ""}\n{detail or ""}'
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of the sets behind two signatures"""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def band_keys(signature):
+    return [(band, signature[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+
+class DuplicateIndex:
+    """In-memory LSH index over the MinHash signatures of recent tickets.
+
+    Signatures are persisted in ``ticket_signatures`` and loaded at startup
+    for tickets created within DUPLICATE_WINDOW_DAYS. Lookups touch only the
+    BANDS buckets a signature hashes to and compare the few candidates found
+    there, so they take microseconds regardless of how many tickets are
+    indexed. Rows written by other workers are pulled in by id every
+    DUPLICATE_SYNC_SECONDS; a replaced signature gets a new row, so
+    changes travel the same way.
+    """
+
+    def __init__(self):
+        self.window = timedelta(days=30)
+        self.sync_interval = 5.0
+        self.signatures = {}
+        self.created = {}
+        self.buckets = {}
+        self._last_id = 0
+        self._synced_at = None
+        self._evicted_at = None
+        self._lock = threading.RLock()
+
+    def init_app(self, app):
+        self.window = timedelta(days=app.config['DUPLICATE_WINDOW_DAYS'])
+        self.sync_interval = app.config['DUPLICATE_SYNC_SECONDS']
+        with app.app_context():
+            self.reload()
+
+    def reload(self):
+        with self._lock:
+            self.signatures = {}
+            self.created = {}
+            self.buckets = {}
+            self._last_id = 0
+            # Only the window is loaded; later syncs continue after every existing row
+            last_id = db.session.execute(select(func.max(TicketSignature.id))).scalar() or 0
+            self._pull(since=datetime.utcnow() - self.window, upto=last_id)
+            self._last_id = last_id
+            self._evicted_at = time.monotonic()
+
+    def _pull(self, since=None, upto=None):
+        query = select(
+            TicketSignature.id, TicketSignature.ticket_id, TicketSignature.signature, TicketSignature.created_at
+        ).where(TicketSignature.id > self._last_id).order_by(TicketSignature.id)
+        if since is not None:
+            query = query.where(TicketSignature.created_at >= since)
+        if upto is not None:
+            query = query.where(TicketSignature.id <= upto)
+        for row_id, ticket_id, signature, created_at in db.session.execute(query):
+            self._add(ticket_id, np.frombuffer(signature, dtype=np.uint32), created_at)
+            self._last_id = row_id
+        self._synced_at = time.monotonic()
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._synced_at is None or now - self._synced_at > self.sync_interval:
+            self._pull()
+        if now - (self._evicted_at or 0) > 3600:
+            cutoff = datetime.utcnow() - self.window
+            for ticket_id in [t for t, created in self.created.items() if created < cutoff]:
+                self.remove(ticket_id)
+            self._evicted_at = now
+
+    def _add(self, ticket_id, signature, created_at):
+        self.remove(ticket_id)
+        self.signatures[ticket_id] = signature
+        self.created[ticket_id] = created_at
+        for key in band_keys(signature):
+            self.buckets.setdefault(key, set()).add(ticket_id)
+
+    def add(self, ticket_id, signature, created_at):
+        with self._lock:
+            self._add(ticket_id, signature, created_at)
+
+    def remove(self, ticket_id):
+        with self._lock:
+            signature = self.signatures.pop(ticket_id, None)
+            self.created.pop(ticket_id, None)
+            if signature is None:
+                return
+            for key in band_keys(signature):
+                bucket = self.buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(ticket_id)
+                    if not bucket:
+                        del self.buckets[key]
+
+    def query(self, signature, exclude=None, threshold=0.5, limit=5):
+        """[(ticket_id, similarity)] of the most similar indexed tickets, best first"""
+        with self._lock:
+            self._sync()
+            candidates = set()
+            for key in band_keys(signature):
+                candidates |= self.buckets.get(key, set())
+            candidates.discard(exclude)
+            scored = []
+            for ticket_id in candidates:
+                score = similarity(signature, self.signatures[ticket_id])
+                if score >= threshold:
+                    scored.append((ticket_id, score))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:limit]
+
+    def signature_of(self, ticket_id):
+        with self._lock:
+            return self.signatures.get(ticket_id)
+
+
+duplicate_index = TenantLocal(DuplicateIndex)
+
+
+def _defer(ticket_id, signature=None, created_at=None):
+    """Index ``signature`` for a ticket, or drop the ticket when None, once the transaction commits"""
+    db.session.info.setdefault(PENDING_KEY, []).append((ticket_id, signature, created_at))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_committed(session):
+    for ticket_id, signature, created_at in session.info.pop(PENDING_KEY, ()):
+        if signature is None:
+            duplicate_index.remove(ticket_id)
+        else:
+            duplicate_index.add(ticket_id, signature, created_at)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def store_signature(ticket, signature, replace=True):
+    """Persist a ticket's signature (as a new row, so other workers see it) and index it on commit"""
+    table = TicketSignature.__table__
+    if replace:
+        db.session.execute(table.delete().where(table.c.ticket_id == ticket.id))
+    db.session.execute(table.insert().values(
+        ticket_id=ticket.id, signature=signature.tobytes(), created_at=ticket.created_at
+    ))
+    _defer(ticket.id, signature, ticket.created_at)
+
+
+@on_ticket_change
+def index_ticket(ticket, before, kind, actor_id=None):
+    """Sign new tickets and tickets whose text changed; drop merged ones from the index"""
+    if ticket.merged_into:
+        _defer(ticket.id)
+        return
+    if (before is not None and previous(before, 'title') == ticket.title
+            and previous(before, 'detail') == ticket.detail):
+        return
+    store_signature(ticket, minhash(ticket_text(ticket.title, ticket.detail)), replace=before is not None)
+
+
+def find_duplicates(ticket_id, signature=None, limit=None):
+    """[(ticket_id, similarity)] of likely duplicates of a ticket, best first"""
+    config = current_app.config
+    if signature is None:
+        signature = duplicate_index.signature_of(ticket_id)
+    if signature is None:
+        stored = db.session.execute(
+            select(TicketSignature.signature).where(TicketSignature.ticket_id == ticket_id)
+        ).scalar()
+        if stored is None:
+            return []
+        signature = np.frombuffer(stored, dtype=np.uint32)
+    return duplicate_index.query(
+        signature, exclude=ticket_id,
+        threshold=config['DUPLICATE_THRESHOLD'],
+        limit=limit or config['DUPLICATE_LIMIT']
+    )
+
+
+def duplicate_summaries(matches):
+    """Attach ticket numbers and titles to find_duplicates() output, skipping vanished tickets"""
+    if not matches:
+        return []
+    tickets = {
+        ticket_id: (number, title, status)
+        for ticket_id, number, title, status in db.session.execute(
+            select(Ticket.id, Ticket.number, Ticket.title, Ticket.status)
+            .where(Ticket.id.in_([ticket_id for ticket_id, _ in matches]), Ticket.merged_into.is_(None))
+        )
+    }
+    return [
+        {
+            'id': ticket_id,
+            'Number': tickets[ticket_id][0],
+            'title': tickets[ticket_id][1],
+            'status': tickets[ticket_id][2],
+            'similarity': round(score, 3),
+        }
+        for ticket_id, score in matches if ticket_id in tickets
+    ]
+
+
+def merge_tickets(primary, duplicate_ids, actor_id):
+    """Close ``duplicate_ids`` as duplicates of ``primary``; returns the tickets merged.
+
+    Each duplicate keeps its comments and history, points at the primary
+    through ``merged_into`` and gets an internal note; the primary gets one
+    note listing everything merged into it. Tickets that are already merged
+    are skipped. The caller commits.
+    """
+    now = datetime.utcnow()
+    duplicates = Ticket.query.filter(
+        Ticket.id.in_(duplicate_ids), Ticket.id != primary.id, Ticket.merged_into.is_(None)
+    ).order_by(Ticket.number).all()
+    for duplicate in duplicates:
+        before = snapshot(duplicate)
+        duplicate.merged_into = primary.id
+        duplicate.status = 'closed'
+        duplicate.is_complete = True
+        duplicate.updated_at = now
+        db.session.add(Comment(
+            content=f'Merged into #{primary.number} as a duplicate',
+            is_internal=True, ticket_id=duplicate.id, user_id=actor_id
+        ))
+        ticket_changed(duplicate, before, 'merged', actor_id)
+    if duplicates:
+        numbers = ', '.join(f'#{duplicate.number}' for duplicate in duplicates)
+        db.session.add(Comment(
+            content=f'Merged duplicates: {numbers}', is_internal=True, ticket_id=primary.id, user_id=actor_id
+        ))
+    return duplicates
+
+
+def reindex_signatures(batch_size=1000):
+    """Sign every live ticket created within the window; returns how many were signed"""
+    since = datetime.utcnow() - duplicate_index.window
+    tickets = Ticket.__table__
+    table = TicketSignature.__table__
+    query = select(tickets.c.id, tickets.c.title, tickets.c.detail, tickets.c.created_at).where(
+        tickets.c.created_at >= since, tickets.c.merged_into.is_(None)
+    ).order_by(tickets.c.id).limit(batch_size)
+
+    signed = 0
+    after = ''
+    while True:
+        rows = db.session.execute(query.where(tickets.c.id > after)).all()
+        if not rows:
+            break
+        ids = [row.id for row in rows]
+        db.session.execute(table.delete().where(table.c.ticket_id.in_(ids)))
+        db.session.execute(table.insert(), [
+            {
+                'ticket_id': row.id,
+                'signature': minhash(ticket_text(row.title, row.detail)).tobytes(),
+                'created_at': row.created_at,
+            }
+            for row in rows
+        ])
+        db.session.commit()
+        signed += len(rows)
+        after = ids[-1]
+    duplicate_index.reload()
+    return signed
@@ -0,0 +1,163 @@
+import json
+
+from sqlalchemy import select
+
+from models import db, TicketEvent
+from changes import on_ticket_change
+
+# Integer codes are part of the stored format: only ever append to these.
+EVENT_KINDS = {
+    'created': 1,
+    'updated': 2,
+    'closed': 3,
+    'reopened': 4,
+    'merged': 5,
+}
+
+TRACKED_FIELDS = (
+    'title',
+    'detail',
+    'status',
+    'priority',
+    'type',
+    'assigned_to',
+    'is_complete',
+    'hidden',
+    'locked',
+    'merged_into',
+    'client_id',
+)
+
+FIELD_CODES = {name: code for code, name in enumerate(TRACKED_FIELDS, 1)}
+
+STATUS_CODES = {
+    'needs_support': 1,
+    'in_progress': 2,
+    'in_review': 3,
+    'hold': 4,
+    'resolved': 5,
+    'closed': 6,
+}
+
+EVENT_KIND_NAMES = {code: name for name, code in EVENT_KINDS.items()}
+FIELD_NAMES = {code: name for name, code in FIELD_CODES.items()}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+STATUS_FIELD = FIELD_CODES['status']
+
+# Fields not worth copying into the "created" event; they live on the ticket
+CREATE_SKIP_FIELDS = frozenset(['detail'])
+
+
+def snapshot(ticket):
+    """Capture the tracked fields of a ticket before it is modified"""
+    return tuple(getattr(ticket, field) for field in TRACKED_FIELDS)
+
+
+def previous(before, field):
+    """Value a tracked field had in a snapshot; None for a newly created ticket"""
+    if before is None:
+        return None
+    return before[FIELD_CODES[field] - 1]
+
+
+def _encode_value(code, value):
+    if code == STATUS_FIELD:
+        return STATUS_CODES.get(value, value)
+    return value
+
+
+def _decode_value(code, value):
+    if code == STATUS_FIELD and isinstance(value, int):
+        return STATUS_NAMES.get(value, value)
+    return value
+
+
+def diff(before, ticket):
+    """Return [field_code, old, new] triples for the fields that changed"""
+    changes = []
+    for code, field in enumerate(TRACKED_FIELDS, 1):
+        new = getattr(ticket, field)
+        if before is None:
+            if new is None or field in CREATE_SKIP_FIELDS:
+                continue
+            changes.append([code, None, _encode_value(code, new)])
+        elif before[code - 1] != new:
+            changes.append([code, _encode_value(code, before[code - 1]), _encode_value(code, new)])
+    return changes
+
+
+@on_ticket_change
+def record_event(ticket, before, kind, actor_id=None):
+    """Add a history event for a ticket change to the current transaction.
+
+    ``before`` is the result of :func:`snapshot` taken before the change, or
+    None for a newly created ticket. Nothing is written when no tracked field
+    changed. The caller commits.
+    """
+    changes = diff(before, ticket)
+    if not changes and kind == 'updated':
+        return None
+
+    event = TicketEvent(
+        ticket_id=ticket.id,
+        actor_id=actor_id,
+        kind=EVENT_KINDS[kind],
+        changes=json.dumps(changes, separators=(',', ':'))
+    )
+    db.session.add(event)
+    return event
+
+
+def decode_changes(encoded):
+    """Expand a stored changes column into readable dicts"""
+    return [
+        {'field': FIELD_NAMES.get(code, code), 'from': _decode_value(code, old), 'to': _decode_value(code, new)}
+        for code, old, new in json.loads(encoded)
+    ]
+
+
+def event_to_dict(event):
+    return {
+        'id': event.id,
+        'ticketId': event.ticket_id,
+        'kind': EVENT_KIND_NAMES.get(event.kind, event.kind),
+        'actorId': event.actor_id,
+        'changes': decode_changes(event.changes),
+        'createdAt': event.created_at
+    }
+
+
+def get_ticket_history(ticket_id, after=0, limit=50):
+    """Return one page of a ticket's events in order, starting after event id ``after``"""
+    return TicketEvent.query.filter(
+        TicketEvent.ticket_id == ticket_id,
+        TicketEvent.id > after
+    ).order_by(TicketEvent.id).limit(limit).all()
+
+
+def iter_event_batches(after=0, batch_size=10000, ticket_id=None):
+    """Yield every event after ``after`` as lists of plain row tuples.
+
+    Rows are ``(id, ticket_id, kind, actor_id, created_at, changes)`` straight
+    from the driver with no ORM objects built, and each batch is a single
+    keyset query on the primary key, so analytics jobs can scan millions of
+    events with flat memory. Decode ``changes`` lazily with
+    :func:`decode_changes` or ``json.loads`` when only the codes are needed.
+    """
+    table = TicketEvent.__table__
+    query = select(
+        table.c.id, table.c.ticket_id, table.c.kind,
+        table.c.actor_id, table.c.created_at, table.c.changes
+    ).order_by(table.c.id).limit(batch_size)
+    if ticket_id is not None:
+        query = query.where(table.c.ticket_id == ticket_id)
+
+    while True:
+        rows = db.session.execute(query.where(table.c.id > after)).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        after = rows[-1][0]
@@ -0,0 +1,130 @@
+"""Idempotency-Key support for creating endpoints that clients retry.
+
+A request sent with an ``Idempotency-Key`` header inserts the key before
+the handler runs, with an ``INSERT ... ON CONFLICT`` on the primary key
+that only updates an expired key, in the transaction the handler then
+commits. So the key exists if and only if the handler's changes
+committed, and of two concurrent requests with the same key the unique
+index lets exactly one insert: the other waits for it on the index and
+then finds the key taken, without a lock or a read first.
+
+Handlers build their response after committing, so it is stored on the
+key in a second, short transaction and replayed to every retry until the
+key is IDEMPOTENCY_KEY_TTL_HOURS old, after which that insert takes it
+over as a new key. A committed key is never deleted: if the handler
+raises or the process dies between the two commits, the key is left
+without a response and retries get a 409 asking the client to check the
+outcome, rather than running the handler a second time.
+
+Keys are per user. A request that failed or was rejected before its
+handler committed leaves no key behind, so its retry runs the handler
+again.
+"""
+
+import hashlib
+import zlib
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import select
+
+from models import db, IdempotencyKey
+from ticket_counts import UPSERT_DIALECTS
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def _digest(*parts):
+    return hashlib.blake2b(b'\x00'.join(parts), digest_size=16).digest()
+
+
+def _cutoff():
+    return datetime.utcnow() - timedelta(hours=current_app.config['IDEMPOTENCY_KEY_TTL_HOURS'])
+
+
+def _reserve(key, fingerprint):
+    """Insert the key in the current transaction, taking it over if expired; False if another request has it"""
+    table = IdempotencyKey.__table__
+    values = {'key': key, 'fingerprint': fingerprint, 'status_code': None, 'body': None,
+              'created_at': datetime.utcnow()}
+    upsert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if upsert is not None:
+        statement = upsert(table).values(**values)
+        return db.session.execute(statement.on_conflict_do_update(
+            index_elements=['key'], set_={name: statement.excluded[name] for name in values if name != 'key'},
+            where=table.c.created_at < _cutoff()
+        )).rowcount == 1
+    db.session.execute(table.delete().where(table.c.key == key, table.c.created_at < _cutoff()))
+    if db.session.execute(select(table.c.key).where(table.c.key == key)).first():
+        return False
+    db.session.execute(table.insert().values(**values))
+    return True
+
+
+def _replay(key, fingerprint):
+    table = IdempotencyKey.__table__
+    row = db.session.execute(
+        select(table.c.fingerprint, table.c.status_code, table.c.body, table.c.created_at)
+        .where(table.c.key == key)
+    ).first()
+    if row is None or row.created_at < _cutoff():
+        # Its request rolled back, or the key expired: reserve it again
+        return None
+    if row.fingerprint != fingerprint:
+        return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+    if row.status_code is None:
+        # In progress, or it committed and its response was lost
+        return jsonify({'error': f'A request with this {HEADER} is in progress or its response was lost; '
+                                 'check whether it took effect before retrying with a new key'}), 409
+    response = current_app.response_class(zlib.decompress(row.body), status=row.status_code,
+                                          mimetype='application/json')
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(f):
+    """Replay the first response to requests repeating its Idempotency-Key; goes under login_required"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        supplied = request.headers.get(HEADER)
+        if supplied is None:
+            return f(*args, **kwargs)
+        if not supplied or len(supplied) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+        key = _digest(get_jwt_identity().encode('utf-8'), supplied.encode('utf-8'))
+        fingerprint = _digest(request.method.encode('ascii'), request.path.encode('utf-8'), request.get_data())
+
+        while not _reserve(key, fingerprint):
+            replayed = _replay(key, fingerprint)
+            if replayed is not None:
+                db.session.rollback()
+                return replayed
+
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            # Drops the key unless the handler committed before raising
+            db.session.rollback()
+            raise
+        if not 200 <= response.status_code < 300:
+            # Likewise: only a key the handler committed keeps this response
+            db.session.rollback()
+        table = IdempotencyKey.__table__
+        db.session.execute(table.update().where(table.c.key == key).values(
+            status_code=response.status_code, body=zlib.compress(response.get_data())
+        ))
+        db.session.commit()
+        return response
+    return decorated_function
+
+
+def prune_idempotency_keys():
+    """Delete expired keys; returns how many"""
+    table = IdempotencyKey.__table__
+    deleted = db.session.execute(table.delete().where(table.c.created_at < _cutoff())).rowcount
+    db.session.commit()
+    return deleted
@@ -0,0 +1,97 @@
+import dataclasses
+import decimal
+import uuid
+from datetime import date, datetime, time
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.Fragment (3.9+) embeds already-encoded JSON without re-parsing it
+Fragment = getattr(orjson, 'Fragment', None)
+
+
+class PreEncoded:
+    """An immutable sub-object together with its encoded JSON bytes.
+
+    orjson splices the stored fragment into the output; the stdlib encoder
+    falls back to encoding ``obj`` normally.
+    """
+
+    __slots__ = ('obj', 'fragment')
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.fragment = Fragment(orjson.dumps(obj, default=_default, option=orjson.OPT_SORT_KEYS))
+
+
+def _default(o):
+    """Encode the types our serializers emit that json/orjson don't handle natively"""
+    if isinstance(o, (datetime, date, time)):
+        return o.isoformat()
+    if isinstance(o, PreEncoded):
+        return o.obj
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+def _orjson_default(o):
+    if isinstance(o, PreEncoded):
+        return o.fragment
+    return _default(o)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that encodes with orjson when it is installed.
+
+    Datetimes are written as ISO 8601 strings on both paths, so serializers
+    can hand over native datetime objects instead of calling isoformat()
+    themselves. Without orjson this falls back to the stdlib encoder.
+    """
+
+    default = staticmethod(_default)
+
+    def _options(self, pretty=False):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if pretty:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_orjson_default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=_orjson_default, option=self._options(pretty))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def encode_fragment(obj):
+    """Pre-encode an immutable sub-object so later responses embed its bytes as-is.
+
+    Returns None when the installed orjson cannot embed fragments; callers
+    then keep using the plain object.
+    """
+    if Fragment is None:
+        return None
+    return PreEncoded(obj)
@@ -3,7 +3,14 @@ from datetime import datetime
 import bcrypt
 import uuid
 
-db = SQLAlchemy()
+from tenancy import TenantSession
+from user_cache import user_cache
+
+db = SQLAlchemy(session_options={'class_': TenantSession})
+
+def hash_password(password):
+    """Hash a password with bcrypt; module level so process pools can pickle it"""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -20,6 +27,10 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_login = db.Column(db.DateTime)
+    # Bumped by every ORM update, which only matches the version it read (see versioning.py)
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    
+    __mapper_args__ = {'version_id_col': version}
     
     # Relationships
     tickets_created = db.relationship('Ticket', foreign_keys='Ticket.created_by', backref='creator', lazy='dynamic')
@@ -28,7 +39,7 @@ class User(db.Model):
     time_entries = db.relationship('TimeEntry', backref='user', lazy='dynamic')
     
     def set_password(self, password):
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
         return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
@@ -43,13 +54,30 @@ class User(db.Model):
             'status': self.status,
             'phone': self.phone,
             'department': self.department,
-            'createdAt': self.created_at.isoformat() if self.created_at else None,
-            'updatedAt': self.updated_at.isoformat() if self.updated_at else None,
-            'lastLogin': self.last_login.isoformat() if self.last_login else None
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at,
+            'lastLogin': self.last_login,
+            'version': self.version
         }
 
+# Ticket.sla_flags bits; each is set once, when its SLA event fires
+SLA_RESPONSE_WARNING = 1
+SLA_RESPONSE_BREACH = 2
+SLA_RESOLUTION_WARNING = 4
+SLA_RESOLUTION_BREACH = 8
+
 class Ticket(db.Model):
     __tablename__ = 'tickets'
+    __table_args__ = (
+        # Keyset pagination of an agent's queue, newest first
+        db.Index('ix_tickets_assigned_to_created_at', 'assigned_to', 'created_at', 'id'),
+        # Reloads pending SLA timers after a restart
+        db.Index('ix_tickets_sla_due_at', 'sla_due_at'),
+        # Incremental builds of the similar-ticket index, by resolution order
+        db.Index('ix_tickets_is_complete_updated_at', 'is_complete', 'updated_at', 'id'),
+        # Keyset pagination of a client's tickets, newest first
+        db.Index('ix_tickets_client_id_created_at', 'client_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     number = db.Column(db.Integer, unique=True, nullable=False)
@@ -64,9 +92,25 @@ class Ticket(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # SLA targets and state, maintained by sla.py
+    first_response_at = db.Column(db.DateTime)
+    response_due_at = db.Column(db.DateTime)
+    resolution_due_at = db.Column(db.DateTime)
+    sla_due_at = db.Column(db.DateTime)  # next warning or breach check
+    sla_flags = db.Column(db.SmallInteger, nullable=False, default=0, server_default='0')
+    
+    # Set when this ticket was merged into another as a duplicate
+    merged_into = db.Column(db.String(36))
+    
     # Foreign Keys
     created_by = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
     assigned_to = db.Column(db.String(36), db.ForeignKey('users.id'))
+    client_id = db.Column(db.String(36), db.ForeignKey('clients.id'))
+    
+    # Bumped by every ORM update, which only matches the version it read (see versioning.py)
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    
+    __mapper_args__ = {'version_id_col': version}
     
     # Relationships
     comments = db.relationship('Comment', backref='ticket', lazy='dynamic', cascade='all, delete-orphan')
@@ -84,10 +128,36 @@ class Ticket(db.Model):
             'isComplete': self.is_complete,
             'hidden': self.hidden,
             'locked': self.locked,
-            'createdAt': self.created_at.isoformat() if self.created_at else None,
-            'updatedAt': self.updated_at.isoformat() if self.updated_at else None,
-            'createdBy': self.creator.to_dict() if self.creator else None,
-            'assignedTo': self.assignee.to_dict() if self.assignee else None
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at,
+            'createdBy': user_cache.summary(self.created_by),
+            'assignedTo': user_cache.summary(self.assigned_to),
+            'clientId': self.client_id,
+            'mergedInto': self.merged_into,
+            'version': self.version,
+            'sla': self.sla_to_dict()
+        }
+    
+    def sla_to_dict(self):
+        flags = self.sla_flags or 0
+        
+        def state(met, warning, breach):
+            if flags & breach:
+                return 'breached'
+            if met:
+                return 'met'
+            if flags & warning:
+                return 'at_risk'
+            return 'pending'
+        
+        return {
+            'responseDueAt': self.response_due_at,
+            'resolutionDueAt': self.resolution_due_at,
+            'firstResponseAt': self.first_response_at,
+            'response': state(self.first_response_at is not None, SLA_RESPONSE_WARNING, SLA_RESPONSE_BREACH)
+                if self.response_due_at else None,
+            'resolution': state(self.is_complete, SLA_RESOLUTION_WARNING, SLA_RESOLUTION_BREACH)
+                if self.resolution_due_at else None,
         }
 
 class Comment(db.Model):
@@ -108,13 +178,17 @@ class Comment(db.Model):
             'id': self.id,
             'content': self.content,
             'isInternal': self.is_internal,
-            'createdAt': self.created_at.isoformat() if self.created_at else None,
-            'updatedAt': self.updated_at.isoformat() if self.updated_at else None,
-            'author': self.author.to_dict() if self.author else None
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at,
+            'author': user_cache.summary(self.user_id)
         }
 
 class TimeEntry(db.Model):
     __tablename__ = 'time_entries'
+    __table_args__ = (
+        # Date-range scans for time reports
+        db.Index('ix_time_entries_date', 'date'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     description = db.Column(db.Text, nullable=False)
@@ -131,11 +205,207 @@ class TimeEntry(db.Model):
             'id': self.id,
             'description': self.description,
             'hours': self.hours,
-            'date': self.date.isoformat() if self.date else None,
-            'createdAt': self.created_at.isoformat() if self.created_at else None,
-            'user': self.user.to_dict() if self.user else None
+            'date': self.date,
+            'createdAt': self.created_at,
+            'user': user_cache.summary(self.user_id)
         }
 
+def archive_columns(table):
+    """Copy a table's columns for its archive table, without defaults or constraints"""
+    return [
+        db.Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+        for column in table.columns
+    ]
+
+class ArchivedTicket(db.Model):
+    __table__ = db.Table(
+        'archived_tickets', db.metadata,
+        *archive_columns(Ticket.__table__),
+        db.Column('archived_at', db.DateTime, nullable=False),
+        db.Index('ix_archived_tickets_number', 'number', unique=True),
+        db.Index('ix_archived_tickets_created_at', 'created_at')
+    )
+    
+    creator = db.relationship('User', primaryjoin='foreign(ArchivedTicket.created_by) == User.id', viewonly=True)
+    assignee = db.relationship('User', primaryjoin='foreign(ArchivedTicket.assigned_to) == User.id', viewonly=True)
+    
+    def to_dict(self):
+        data = Ticket.to_dict(self)
+        data['archived'] = True
+        data['archivedAt'] = self.archived_at
+        return data
+    
+    sla_to_dict = Ticket.sla_to_dict
+
+class ArchivedComment(db.Model):
+    __table__ = db.Table(
+        'archived_comments', db.metadata,
+        *archive_columns(Comment.__table__),
+        db.Index('ix_archived_comments_ticket_id', 'ticket_id')
+    )
+    
+    author = db.relationship('User', primaryjoin='foreign(ArchivedComment.user_id) == User.id', viewonly=True)
+    
+    to_dict = Comment.to_dict
+
+class ArchivedTimeEntry(db.Model):
+    __table__ = db.Table(
+        'archived_time_entries', db.metadata,
+        *archive_columns(TimeEntry.__table__),
+        db.Index('ix_archived_time_entries_ticket_id', 'ticket_id')
+    )
+    
+    user = db.relationship('User', primaryjoin='foreign(ArchivedTimeEntry.user_id) == User.id', viewonly=True)
+    
+    to_dict = TimeEntry.to_dict
+
+class TicketEvent(db.Model):
+    __tablename__ = 'ticket_events'
+    __table_args__ = (
+        db.Index('ix_ticket_events_ticket_id_id', 'ticket_id', 'id'),
+    )
+    
+    # Append-only: rows are never updated. No foreign key on ticket_id so the
+    # history outlives the ticket row itself.
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    ticket_id = db.Column(db.String(36), nullable=False)
+    actor_id = db.Column(db.String(36))
+    kind = db.Column(db.SmallInteger, nullable=False)
+    # Compact JSON list of [field_code, old, new] triples, see history.py
+    changes = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class TicketSignature(db.Model):
+    __tablename__ = 'ticket_signatures'
+    
+    # MinHash signature of a ticket's title and detail, see duplicates.py.
+    # The autoincrement id lets other workers pick up new rows by keyset.
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    ticket_id = db.Column(db.String(36), nullable=False, unique=True)
+    signature = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+    
+    # Bumped whenever cached data of this name changes so other worker
+    # processes can tell their in-memory copies are stale
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class TicketCount(db.Model):
+    __tablename__ = 'ticket_counts'
+    
+    # Live tickets per assignee and status, maintained by ticket_counts.py
+    user_id = db.Column(db.String(36), primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class ClientStats(db.Model):
+    __tablename__ = 'client_stats'
+    
+    # Per-client ticket counts and logged hours, live and archived,
+    # maintained by client_stats.py
+    client_id = db.Column(db.String(36), db.ForeignKey('clients.id'), primary_key=True)
+    open_tickets = db.Column(db.Integer, nullable=False, default=0)
+    resolved_tickets = db.Column(db.Integer, nullable=False, default=0)
+    logged_hours = db.Column(db.Float, nullable=False, default=0.0)
+
+class SlaEvent(db.Model):
+    __tablename__ = 'sla_events'
+    
+    # Append-only feed of warnings and breaches; the id is the stream cursor
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    ticket_id = db.Column(db.String(36), nullable=False, index=True)
+    kind = db.Column(db.SmallInteger, nullable=False)
+    due_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChangeRecord(db.Model):
+    __tablename__ = 'change_records'
+    __table_args__ = (
+        # Pruning by age
+        db.Index('ix_change_records_created_at', 'created_at'),
+        # Offsets must never be handed out twice, even after pruning
+        {'sqlite_autoincrement': True},
+    )
+    
+    # Transactional outbox (see outbox.py): append-only, the id is the offset
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    event = db.Column(db.String(50), nullable=False)
+    entity_id = db.Column(db.String(36), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # encoded JSON object
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class WebhookSubscription(db.Model):
+    __tablename__ = 'webhook_subscriptions'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    url = db.Column(db.String(500), nullable=False)
+    secret = db.Column(db.String(100), nullable=False)  # HMAC key for the payload signatures
+    events = db.Column(db.String(500), nullable=False, default='*')  # comma-separated names, or '*'
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_by = db.Column(db.String(36), db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Delivery state: the last change record sent, and the retry/lease
+    # schedule of the batch after it
+    last_change_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'url': self.url,
+            'events': self.events.split(','),
+            'active': self.active,
+            'createdAt': self.created_at,
+            'lastChangeId': self.last_change_id,
+            'attempts': self.attempts,
+            'nextAttemptAt': self.next_attempt_at,
+            'lastError': self.last_error
+        }
+
+class WebhookDeadLetter(db.Model):
+    __tablename__ = 'webhook_dead_letters'
+    
+    # Deliveries that ran out of attempts, kept for inspection and manual retry
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    subscription_id = db.Column(db.String(36), db.ForeignKey('webhook_subscriptions.id'), nullable=False,
+                                index=True)
+    change_id = db.Column(db.Integer)  # offset of the change record, the delivery id receivers saw
+    event = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False)
+    last_error = db.Column(db.Text)
+    failed_at = db.Column(db.DateTime, nullable=False)
+    
+    subscription = db.relationship('WebhookSubscription')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'subscriptionId': self.subscription_id,
+            'changeId': self.change_id,
+            'event': self.event,
+            'attempts': self.attempts,
+            'lastError': self.last_error,
+            'failedAt': self.failed_at
+        }
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+
+    # First response to a request sent with an Idempotency-Key, replayed to
+    # retries (see idempotency.py). Keys are stored as digests of user and key.
+    key = db.Column(db.LargeBinary(16), primary_key=True)
+    fingerprint = db.Column(db.LargeBinary(16), nullable=False)  # digest of method, path and body
+    status_code = db.Column(db.SmallInteger)  # null while the first request is running
+    body = db.Column(db.LargeBinary)  # zlib-compressed JSON
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
 class Client(db.Model):
     __tablename__ = 'clients'
     
@@ -149,7 +419,12 @@ class Client(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    stats = db.relationship('ClientStats', uselist=False, lazy='joined', viewonly=True)
+    
     def to_dict(self):
+        stats = self.stats
+        open_tickets = stats.open_tickets if stats else 0
+        resolved_tickets = stats.resolved_tickets if stats else 0
         return {
             'id': self.id,
             'name': self.name,
@@ -158,6 +433,16 @@ class Client(db.Model):
             'phone': self.phone,
             'notes': self.notes,
             'active': self.active,
-            'createdAt': self.created_at.isoformat() if self.created_at else None,
-            'updatedAt': self.updated_at.isoformat() if self.updated_at else None
-        } 
\ No newline at end of file
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at,
+            'openTickets': open_tickets,
+            'resolvedTickets': resolved_tickets,
+            'totalTickets': open_tickets + resolved_tickets,
+            'loggedHours': round(stats.logged_hours, 2) if stats else 0.0
+        }
+
+# Directory order and prefix search are case-insensitive, so these index
+# lower() of the columns; expressions can't be declared before the class
+db.Index('ix_clients_active_name', Client.active, db.func.lower(Client.name), Client.id)
+db.Index('ix_clients_active_email', Client.active, db.func.lower(Client.email))
+db.Index('ix_clients_active_contact_name', Client.active, db.func.lower(Client.contact_name))
@@ -0,0 +1,136 @@
+"""Transactional outbox of ticket, comment, time entry and user changes.
+
+Handlers call :func:`record_change` (tickets through the ticket_changed
+listener below) before committing, so a change record exists if and only
+if the change itself committed. Bulk operations (import, archive,
+provisioning) call :func:`record_batch` instead, which writes one record
+per CHANGES_BATCH_SIZE ids rather than one per row. Records are never
+updated; the autoincrement id is the stream offset that consumers resume
+from, via ``GET /api/v1/changes?after=<offset>`` or, for webhooks, a
+cursor per subscription.
+
+Offsets are only safe to resume from if ids become visible in order. On
+SQLite writers are serialized anyway. On PostgreSQL ids come from a
+sequence and can commit out of order, so writers take a transaction-scoped
+advisory lock before inserting, which makes id order commit order for the
+tail of each writing transaction.
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from models import db, ChangeRecord, WebhookSubscription
+from changes import on_ticket_change
+from history import TRACKED_FIELDS, previous
+
+EVENTS = (
+    'ticket.created',
+    'ticket.updated',
+    'ticket.closed',
+    'ticket.reopened',
+    'ticket.merged',
+    'ticket.restored',
+    'comment.created',
+    'time_entry.created',
+    'user.created',
+    'user.updated',
+    'user.deleted',
+    # Bulk operations: ``data.ids`` lists the affected rows
+    'ticket.imported',
+    'ticket.archived',
+    'user.provisioned',
+)
+
+# pg_advisory_xact_lock key serializing outbox writers
+ADVISORY_LOCK_KEY = 0x6f7574626f78
+
+
+def _lock_writers():
+    session = db.session
+    if session.get_bind().dialect.name != 'postgresql':
+        return
+    transaction = session.get_transaction()
+    if session.info.get('outbox_locked') is not transaction:
+        session.execute(select(func.pg_advisory_xact_lock(ADVISORY_LOCK_KEY)))
+        session.info['outbox_locked'] = transaction
+
+
+def record_change(event, entity_id, data, actor_id=None):
+    """Append a change record in the current transaction"""
+    _lock_writers()
+    now = datetime.utcnow()
+    payload = current_app.json.dumps({
+        'event': event, 'entityId': entity_id, 'occurredAt': now, 'actorId': actor_id, 'data': data
+    })
+    db.session.execute(ChangeRecord.__table__.insert().values(
+        event=event, entity_id=entity_id, payload=payload, created_at=now
+    ))
+
+
+def record_batch(event, ids, actor_id=None):
+    """Append records for a bulk change to ``ids`` in the current transaction.
+
+    The entity id of each record is a fresh batch id; the affected ids are
+    in ``data.ids``, at most CHANGES_BATCH_SIZE per record.
+    """
+    size = current_app.config['CHANGES_BATCH_SIZE']
+    for start in range(0, len(ids), size):
+        chunk = list(ids[start:start + size])
+        record_change(event, str(uuid.uuid4()), {'count': len(chunk), 'ids': chunk}, actor_id)
+
+
+@on_ticket_change
+def record_ticket_change(ticket, before, kind, actor_id=None):
+    # Flush first so the payload has the version and timestamps being committed
+    db.session.flush()
+    data = ticket.to_dict()
+    if before is not None:
+        data['changes'] = {
+            field: [previous(before, field), getattr(ticket, field)]
+            for field in TRACKED_FIELDS if previous(before, field) != getattr(ticket, field)
+        }
+    record_change(f'ticket.{kind}', ticket.id, data, actor_id)
+
+
+def latest_offset():
+    return db.session.execute(select(func.max(ChangeRecord.id))).scalar() or 0
+
+
+def read_changes(after, limit, events=None, upto=None):
+    """``(id, event, payload)`` rows after offset ``after``, oldest first"""
+    query = select(ChangeRecord.id, ChangeRecord.event, ChangeRecord.payload).where(ChangeRecord.id > after)
+    if events:
+        query = query.where(ChangeRecord.event.in_(events))
+    if upto is not None:
+        query = query.where(ChangeRecord.id <= upto)
+    return db.session.execute(query.order_by(ChangeRecord.id).limit(limit)).all()
+
+
+def encode_changes(rows, extra=None):
+    """JSON array of records with their offset spliced in, without decoding the stored payloads.
+
+    ``extra(row)`` may return more leading fields as encoded JSON
+    ``"name":value,`` text.
+    """
+    return '[' + ','.join(
+        f'{{"offset":{row.id},' + (extra(row) if extra else '') + row.payload[1:] for row in rows
+    ) + ']'
+
+
+def prune_changes(older_than_days=None):
+    """Delete records past the retention period that every active webhook has already sent"""
+    if older_than_days is None:
+        older_than_days = current_app.config['CHANGES_RETENTION_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    query = ChangeRecord.__table__.delete().where(ChangeRecord.created_at < cutoff)
+    pending = db.session.execute(
+        select(func.min(WebhookSubscription.last_change_id)).where(WebhookSubscription.active.is_(True))
+    ).scalar()
+    if pending is not None:
+        query = query.where(ChangeRecord.id <= pending)
+    deleted = db.session.execute(query).rowcount
+    db.session.commit()
+    return deleted
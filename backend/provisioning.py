@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, hash_password
+from database import bulk_insert
+from importer import ImportResult, parse_bool
+from assignment import agent_index
+from autocomplete import autocomplete
+from outbox import record_batch
+
+USER_COLUMNS = (
+    'id', 'name', 'email', 'password_hash', 'is_admin', 'role', 'status',
+    'phone', 'department', 'created_at', 'updated_at',
+)
+
+# Keep IN lists under SQLite's bound parameter limit
+IN_QUERY_CHUNK = 500
+
+# bcrypt only looks at the first 72 bytes of a password
+MAX_PASSWORD_BYTES = 72
+
+# Inserts retried after dropping rows whose email a concurrent request took
+MAX_INSERT_ATTEMPTS = 3
+
+
+def hash_passwords(passwords, workers=None):
+    """bcrypt a list of passwords across a process pool, preserving order.
+
+    The workers are spawned rather than forked: a fork from a request
+    thread would copy the parent's locks and open connections mid-use.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < 2:
+        return [hash_password(password) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(pool.map(hash_password, passwords, chunksize=chunksize))
+
+
+def existing_emails(emails):
+    """Return which of ``emails`` already belong to a user, one IN query per chunk"""
+    found = set()
+    emails = list(emails)
+    for start in range(0, len(emails), IN_QUERY_CHUNK):
+        chunk = emails[start:start + IN_QUERY_CHUNK]
+        found.update(db.session.execute(select(User.email).where(User.email.in_(chunk))).scalars())
+    return found
+
+
+def provision_users(records, batch_size=None, workers=None, actor_id=None):
+    """Create many users from (line number, row dict) records.
+
+    Rows are validated first, emails are checked against the database in bulk
+    and within the input, passwords are hashed in parallel, and the remaining
+    users are inserted with executemany in one transaction. If a concurrent
+    request takes one of the emails meanwhile, the insert is retried without
+    the rows that now conflict, which are reported by line.
+    """
+    config = current_app.config
+    batch_size = batch_size or config['PROVISION_BATCH_SIZE']
+    if workers is None:
+        workers = config['PROVISION_HASH_WORKERS']
+    result = ImportResult(config['IMPORT_MAX_ERRORS'])
+
+    valid = []
+    seen = set()
+    for line_no, row in records:
+        if isinstance(row, str):
+            result.add_error(line_no, row)
+            continue
+        missing = [field for field in ('name', 'email', 'password') if not row.get(field)]
+        if missing:
+            result.add_error(line_no, f'{missing[0]} is required')
+            continue
+        invalid = [field for field in ('name', 'email', 'password') if not isinstance(row[field], str)]
+        if invalid:
+            result.add_error(line_no, f'{invalid[0]} must be a string')
+            continue
+        if len(row['password'].encode('utf-8')) > MAX_PASSWORD_BYTES:
+            result.add_error(line_no, f'password must be at most {MAX_PASSWORD_BYTES} bytes')
+            continue
+        if row['email'] in seen:
+            result.add_error(line_no, f"Duplicate email {row['email']} in input")
+            continue
+        seen.add(row['email'])
+        valid.append((line_no, row))
+
+    valid = _drop_taken(valid, result)
+    if not valid:
+        return result
+
+    hashes = hash_passwords([row['password'] for _, row in valid], workers)
+    now = datetime.utcnow()
+    lines = {}
+    values = []
+    for (line_no, row), password_hash in zip(valid, hashes):
+        value = (
+            str(uuid.uuid4()), row['name'], row['email'], password_hash,
+            parse_bool(row.get('is_admin') or False), row.get('role') or 'user', row.get('status') or 'active',
+            row.get('phone'), row.get('department'), now, now
+        )
+        lines[value[0]] = line_no
+        values.append(value)
+
+    for attempt in range(MAX_INSERT_ATTEMPTS):
+        try:
+            for start in range(0, len(values), batch_size):
+                bulk_insert(User.__table__, USER_COLUMNS, values[start:start + batch_size])
+            # Every worker, this one included, rebuilds its user index on the next lookup
+            autocomplete.invalidate('user')
+            record_batch('user.provisioned', [value[0] for value in values], actor_id)
+            db.session.commit()
+            agent_index.invalidate()
+            break
+        except IntegrityError:
+            # Another request created some of these emails since the check above
+            db.session.rollback()
+            remaining = _drop_taken([(lines[value[0]], value) for value in values], result, key=2)
+            if len(remaining) == len(values) or attempt == MAX_INSERT_ATTEMPTS - 1:
+                for line_no, _ in remaining:
+                    result.add_error(line_no, 'Conflict with a concurrent change; user was not created')
+                return result
+            values = [value for _, value in remaining]
+            if not values:
+                return result
+
+    result.imported = len(values)
+    return result
+
+
+def _drop_taken(rows, result, key='email'):
+    """Report and drop the (line number, row) pairs whose email already belongs to a user"""
+    taken = existing_emails(row[key] for _, row in rows)
+    remaining = []
+    for line_no, row in rows:
+        if row[key] in taken:
+            result.add_error(line_no, 'User with this email already exists')
+        else:
+            remaining.append((line_no, row))
+    return remaining
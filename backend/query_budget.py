@@ -0,0 +1,183 @@
+import os
+import re
+import sys
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import g, request, current_app
+from sqlalchemy import event
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_IN_LIST = re.compile(r'IN \((?:\?|%\(\w+\)s|%s)(?:, (?:\?|%\(\w+\)s|%s))*\)', re.IGNORECASE)
+_NUMBER = re.compile(r'\b\d+\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_SPACE = re.compile(r'\s+')
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request ran more SQL than its budget allows, or ran an N+1 pattern"""
+
+
+def normalize_sql(statement):
+    """Reduce a statement to its shape: literals and IN lists collapsed, whitespace squeezed"""
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _IN_LIST.sub('IN (...)', statement)
+    return _SPACE.sub(' ', statement).strip()
+
+
+INSTRUMENTATION = ('query_budget.py', 'slow_query.py')
+
+
+def app_frames():
+    """Yield 'file:line in func' for each stack frame in our own code, innermost first"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(BACKEND_DIR) and 'site-packages' not in filename
+                and not filename.endswith(INSTRUMENTATION)):
+            yield f'{os.path.relpath(filename, BACKEND_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+
+
+def call_site():
+    """Innermost frame in our own code that issued the current statement"""
+    return next(app_frames(), None)
+
+
+class QueryRecorder:
+    """Collects the statements executed while it is active"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __len__(self):
+        return len(self.statements)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def record(self, statement, parameters):
+        self.statements.append((statement, parameters, call_site()))
+
+    def repeated(self, threshold=3):
+        """Statements run ``threshold`` or more times with different parameters: likely N+1 loads"""
+        groups = defaultdict(list)
+        for statement, parameters, site in self.statements:
+            groups[normalize_sql(statement)].append((parameters, site))
+        found = []
+        for statement, calls in groups.items():
+            distinct = {repr(parameters) for parameters, _ in calls}
+            if len(calls) >= threshold and len(distinct) > 1:
+                sites = sorted({site for _, site in calls if site})
+                found.append({'statement': statement, 'count': len(calls), 'sites': sites})
+        return found
+
+
+def _active_recorders():
+    if not hasattr(_local, 'recorders'):
+        _local.recorders = []
+    return _local.recorders
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    for recorder in _active_recorders():
+        recorder.record(statement, parameters)
+
+
+def instrument_engine(engine):
+    """Start counting statements on an engine; safe to call more than once"""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+
+
+@contextmanager
+def count_queries():
+    """Record every statement run on this thread inside the block.
+
+    Usage in tests::
+
+        with count_queries() as queries:
+            client.get('/api/v1/ticket', headers=headers)
+        assert queries.count <= 3, queries.statements
+    """
+    recorder = QueryRecorder()
+    recorders = _active_recorders()
+    recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        recorders.remove(recorder)
+
+
+def format_report(endpoint, budget, recorder, repeated):
+    lines = [f'{endpoint}: {recorder.count} queries (budget {budget})']
+    for item in repeated:
+        lines.append(f"  N+1 x{item['count']}: {item['statement']}")
+        for site in item['sites']:
+            lines.append(f'    at {site}')
+    return '\n'.join(lines)
+
+
+class QueryBudget:
+    """Counts SQL per request and flags requests over their declared budget.
+
+    Budgets come from QUERY_BUDGETS keyed by endpoint name, with
+    QUERY_BUDGET_DEFAULT for everything else; QUERY_BUDGET_EXEMPT lists batch
+    endpoints that are only counted. When QUERY_BUDGET_ENFORCE is set
+    (the testing config) a violation raises QueryBudgetExceeded so the test
+    that made the request fails; otherwise it is logged. The count is also
+    returned in an X-Query-Count header for the HTTP-level test scripts.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('QUERY_BUDGET_ENABLED', False):
+            return
+        from models import db
+        with app.app_context():
+            instrument_engine(db.engine)
+        app.before_request(self.start)
+        app.after_request(self.check)
+        app.teardown_request(self.stop)
+
+    def start(self):
+        recorder = QueryRecorder()
+        _active_recorders().append(recorder)
+        g._query_recorder = recorder
+
+    def stop(self, exc=None):
+        recorder = g.pop('_query_recorder', None)
+        if recorder is not None and recorder in _active_recorders():
+            _active_recorders().remove(recorder)
+
+    def check(self, response):
+        recorder = g.get('_query_recorder')
+        if recorder is None:
+            return response
+        config = current_app.config
+        endpoint = request.endpoint or request.path
+        response.headers['X-Query-Count'] = str(recorder.count)
+        if endpoint in config['QUERY_BUDGET_EXEMPT']:
+            return response
+        budget = config['QUERY_BUDGETS'].get(endpoint, config['QUERY_BUDGET_DEFAULT'])
+
+        repeated = recorder.repeated(config['QUERY_BUDGET_REPEAT_THRESHOLD'])
+        if recorder.count > budget or repeated:
+            report = format_report(endpoint, budget, recorder, repeated)
+            if config['QUERY_BUDGET_ENFORCE']:
+                self.stop()
+                raise QueryBudgetExceeded(report)
+            current_app.logger.warning('Query budget exceeded\n%s', report)
+        return response
+
+
+query_budget = QueryBudget()
@@ -0,0 +1,192 @@
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from hashlib import blake2b
+
+from flask import request, jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+
+try:
+    import fcntl
+except ImportError:  # Windows has no POSIX record locks
+    fcntl = None
+
+WRITE_METHODS = frozenset(['POST', 'PUT', 'PATCH', 'DELETE'])
+
+
+def refill(tokens, updated, capacity, rate, now):
+    """Tokens in a bucket last left at ``tokens`` at time ``updated``.
+
+    A bucket stamped in the future (the clock was set back, or the file
+    came from another host) starts over full rather than staying drained
+    until the clock catches up.
+    """
+    if updated > now:
+        return capacity
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryBucketStore:
+    """Token buckets kept in this process only"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = capacity
+            else:
+                tokens = refill(bucket[0], bucket[1], capacity, rate, now)
+                self._buckets.move_to_end(key)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class SharedBucketStore:
+    """Token buckets in a memory-mapped file shared by every worker process.
+
+    The file is an open-addressed table of fixed-size slots holding a 64-bit
+    key hash, the token count and the last refill time. The file outlives
+    the process, so times are wall-clock seconds: monotonic time restarts
+    at boot. Each check locks only the probe window it touches, so workers
+    rarely contend and a check costs a couple of syscalls instead of a
+    database round trip.
+    """
+
+    SLOT = struct.Struct('<Qdd')
+
+    def __init__(self, path, slots=65536, window=8):
+        if fcntl is None:
+            raise RuntimeError('Shared rate limit storage requires POSIX file locks')
+        self.slots = 1 << max(slots - 1, 1).bit_length()
+        self.window = window
+        size = (self.slots + window) * self.SLOT.size
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        # POSIX record locks are per process, so threads need their own lock
+        self._lock = threading.Lock()
+
+    def _hash(self, key):
+        value = int.from_bytes(blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+        return value or 1
+
+    def take(self, key, capacity, rate, now):
+        key_hash = self._hash(key)
+        first = key_hash & (self.slots - 1)
+        start = first * self.SLOT.size
+        length = self.window * self.SLOT.size
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+            try:
+                target = None
+                oldest = None
+                for i in range(self.window):
+                    offset = start + i * self.SLOT.size
+                    slot_key, tokens, updated = self.SLOT.unpack_from(self._map, offset)
+                    if slot_key == key_hash:
+                        target = offset
+                        tokens = refill(tokens, updated, capacity, rate, now)
+                        break
+                    if slot_key == 0 and target is None:
+                        target = offset
+                    if oldest is None or updated < oldest[1]:
+                        oldest = (offset, updated)
+                else:
+                    # Unknown key: take an empty slot or evict the stalest one
+                    if target is None:
+                        target = oldest[0]
+                    tokens = capacity
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                self.SLOT.pack_into(self._map, target, key_hash, tokens, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+        return allowed, tokens
+
+
+class RateLimiter:
+    """Per-user / per-IP token bucket limiting applied before every request"""
+
+    def __init__(self, app=None):
+        self.store = None
+        self.groups = {}
+        self.exempt = frozenset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('RATELIMIT_ENABLED', True):
+            return
+
+        storage = app.config.get('RATELIMIT_STORAGE', 'shared')
+        if storage == 'memory' or (storage == 'shared' and fcntl is None):
+            self.store = MemoryBucketStore()
+        else:
+            path = storage
+            if storage == 'shared':
+                path = os.path.join(app.instance_path, 'ratelimit.bin')
+            self.store = SharedBucketStore(path, slots=app.config.get('RATELIMIT_SLOTS', 65536))
+
+        self.groups = dict(app.config['RATELIMIT_GROUPS'])
+        self.exempt = frozenset(app.config.get('RATELIMIT_EXEMPT', ()))
+        app.before_request(self.check)
+
+    def route_group(self):
+        """Pick the bucket group for the current request"""
+        if request.endpoint == 'login':
+            return 'login'
+        if request.method in WRITE_METHODS:
+            return 'writes'
+        return 'reads'
+
+    def client_key(self, group):
+        """Key buckets by the JWT user id when present, otherwise by client IP"""
+        if group != 'login':
+            try:
+                verify_jwt_in_request(optional=True)
+                user_id = get_jwt_identity()
+                if user_id:
+                    return f'{group}:user:{user_id}'
+            except Exception:
+                pass
+        return f'{group}:ip:{request.remote_addr}'
+
+    def check(self):
+        if request.endpoint is None or request.endpoint in self.exempt or request.method == 'OPTIONS':
+            return None
+
+        group = self.route_group()
+        limit = self.groups.get(group)
+        if not limit:
+            return None
+        capacity, rate = limit
+
+        allowed, tokens = self.store.take(self.client_key(group), capacity, rate, time.time())
+        if allowed:
+            return None
+
+        retry_after = max(1, math.ceil((1 - tokens) / rate))
+        response = jsonify({'error': 'Too many requests', 'retryAfter': retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+
+limiter = RateLimiter()
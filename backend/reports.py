@@ -0,0 +1,209 @@
+import csv
+import io
+import itertools
+from datetime import date
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import String, cast, select, union_all
+
+from models import db, User, Client, Ticket, TimeEntry, ArchivedTicket, ArchivedTimeEntry
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _day(value):
+    return date.fromordinal(EPOCH_ORDINAL + int(value)).isoformat()
+
+
+def _month(value):
+    return f'{1970 + value // 12:04d}-{value % 12 + 1:02d}'
+
+
+def _days(dates):
+    return np.array(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+def _weeks(dates):
+    # Weeks start on Monday; day 0 (1970-01-01) was a Thursday
+    days = _days(dates)
+    return days - (days + 3) % 7
+
+
+def _months(dates):
+    return np.array(dates, dtype='datetime64[M]').astype(np.int64)
+
+
+# name -> (source column, vectorized key of the column's distinct values, label of a key)
+DIMENSIONS = {
+    'user': ('user_id', np.array, str),
+    'ticket': ('number', lambda numbers: np.array(numbers, dtype=np.int64), int),
+    'type': ('type', lambda types: np.array([value or '' for value in types]), str),
+    'client': ('client_id', lambda ids: np.array([value or '' for value in ids]), str),
+    'day': ('date', _days, _day),
+    'week': ('date', _weeks, _day),
+    'month': ('date', _months, _month),
+}
+
+
+class Codes:
+    """Dense integer codes for the distinct values of one column, stable across chunks.
+
+    A dict lookup per row is far cheaper than sorting the raw strings, and
+    the dimension keys (weeks, months) are then computed once per distinct
+    value instead of once per row.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def encode(self, values):
+        return np.fromiter(map(self._code, values), dtype=np.int64, count=len(values))
+
+    def _code(self, value):
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def keys(self, key):
+        """``(distinct keys, key index of every code)`` for a DIMENSIONS key function"""
+        if not self.values:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        return np.unique(key(self.values), return_inverse=True)
+
+
+def group_sum(codes, hours, entries):
+    """Collapse rows with equal code tuples: ``(codes, hours, entries)`` per distinct tuple"""
+    if not codes:
+        return [], np.array([hours.sum()]), np.array([entries.sum()])
+    radices = [int(column.max()) + 1 for column in codes]
+    keys = np.ravel_multi_index(codes, radices)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return (
+        list(np.unravel_index(unique, radices)),
+        np.bincount(inverse, weights=hours),
+        np.bincount(inverse, weights=entries),
+    )
+
+
+def time_entries_query(columns, start=None, end=None, user_id=None, ticket_type=None, include_archived=True):
+    """SELECT of ``columns`` (names from DIMENSIONS plus ``hours``) over live and archived entries"""
+    selects = []
+    sources = [(TimeEntry.__table__, Ticket.__table__)]
+    if include_archived:
+        sources.append((ArchivedTimeEntry.__table__, ArchivedTicket.__table__))
+    for entries, tickets in sources:
+        available = {
+            'hours': entries.c.hours,
+            'user_id': entries.c.user_id,
+            # The date as text parses straight into a NumPy datetime64 array
+            'date': cast(entries.c.date, String).label('date'),
+            'number': tickets.c.number,
+            'type': tickets.c.type,
+            'client_id': tickets.c.client_id,
+        }
+        query = select(*[available[name] for name in columns])
+        if {'number', 'type', 'client_id'} & set(columns) or ticket_type:
+            query = query.select_from(entries.join(tickets, tickets.c.id == entries.c.ticket_id))
+        if start:
+            query = query.where(entries.c.date >= start)
+        if end:
+            query = query.where(entries.c.date <= end)
+        if user_id:
+            query = query.where(entries.c.user_id == user_id)
+        if ticket_type:
+            query = query.where(tickets.c.type == ticket_type)
+        selects.append(query)
+    return selects[0] if len(selects) == 1 else union_all(*selects)
+
+
+def _reduce_chunk(chunk, columns, encoders):
+    raw = dict(zip(columns, zip(*chunk)))
+    codes = [encoder.encode(raw[column]) for column, encoder in encoders.items()]
+    hours = np.array(raw['hours'], dtype=np.float64)
+    return group_sum(codes, hours, np.ones(len(hours)))
+
+
+def aggregate_time(group_by, start=None, end=None, user_id=None, ticket_type=None,
+                   include_archived=True, chunk_size=None):
+    """Sum logged hours grouped by ``group_by`` dimensions over a date range.
+
+    The matching rows are streamed from one query in chunks of
+    REPORT_CHUNK_SIZE, read as plain tuples off the DB-API cursor since
+    building a Row per entry costs more than the aggregation itself. Each
+    chunk is turned into NumPy arrays, its dimension values are replaced
+    by dense integer codes, and rows are grouped by sorting one combined
+    int64 key and summed with bincount.
+    Only the per-chunk group totals are kept, so memory stays bounded by
+    the number of groups rather than the number of entries.
+
+    Returns ``(rows, totals)`` where each row is ``{dimension: value,
+    'hours', 'entries'}``, sorted by the dimensions.
+    """
+    chunk_size = chunk_size or current_app.config['REPORT_CHUNK_SIZE']
+    # One encoder per source column; week and month share the date column
+    encoders = {DIMENSIONS[name][0]: Codes() for name in group_by}
+    columns = ['hours'] + list(encoders)
+    query = time_entries_query(columns, start, end, user_id, ticket_type, include_archived)
+
+    result = db.session.execute(query, execution_options={'stream_results': True})
+    try:
+        # Streaming results keep a pre-fetched row in SQLAlchemy's buffer, so the
+        # first chunk is read through the result and only the rest off the cursor
+        chunks = [result.fetchmany(chunk_size)]
+        if len(chunks[0]) == chunk_size:
+            chunks = itertools.chain(chunks, iter(lambda: result.cursor.fetchmany(chunk_size), []))
+        partials = [_reduce_chunk(chunk, columns, encoders) for chunk in chunks if chunk]
+    finally:
+        result.close()
+    if not partials:
+        return [], {'hours': 0.0, 'entries': 0}
+    partial_codes, partial_hours, partial_entries = zip(*partials)
+    column_codes = dict(zip(encoders, (np.concatenate(codes) for codes in zip(*partial_codes))))
+
+    # Map column codes to dimension keys and collapse groups that now coincide
+    keys, key_codes = [], []
+    for name in group_by:
+        column, key, _ = DIMENSIONS[name]
+        distinct, key_of_code = encoders[column].keys(key)
+        keys.append(distinct)
+        key_codes.append(key_of_code[column_codes[column]])
+    codes, hours, entries = group_sum(
+        key_codes, np.concatenate(partial_hours), np.concatenate(partial_entries)
+    )
+
+    labels = [
+        [DIMENSIONS[name][2](value) for value in distinct[column].tolist()]
+        for name, distinct, column in zip(group_by, keys, codes)
+    ]
+    rows = [
+        dict(zip(group_by, key), hours=round(float(total), 2), entries=int(count))
+        for *key, total, count in zip(*labels, hours.tolist(), entries.tolist())
+    ]
+    rows.sort(key=lambda row: tuple(row[name] for name in group_by))
+    if 'user' in group_by:
+        names = dict(db.session.execute(
+            select(User.id, User.name).where(User.id.in_({row['user'] for row in rows}))
+        ).all())
+        for row in rows:
+            row['userName'] = names.get(row['user'])
+    if 'client' in group_by:
+        names = dict(db.session.execute(
+            select(Client.id, Client.name).where(Client.id.in_({row['client'] for row in rows}))
+        ).all())
+        for row in rows:
+            row['clientName'] = names.get(row['client'])
+    return rows, {'hours': round(float(hours.sum()), 2), 'entries': int(entries.sum())}
+
+
+def report_csv(group_by, rows):
+    columns = list(group_by) + (['userName'] if 'user' in group_by else []) + \
+        (['clientName'] if 'client' in group_by else []) + ['hours', 'entries']
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=columns, extrasaction='ignore', lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue()
@@ -0,0 +1,407 @@
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, or_, and_, select
+
+from models import db, Ticket, Comment
+from duplicates import ticket_text
+from tenancy import TenantLocal, tenant_path
+from user_cache import user_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds aren't serialized across processes
+    fcntl = None
+
+MANIFEST = 'manifest.json'
+
+_WORD = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset(
+    'a an and are as at be but by can do for from has have i if in is it my no not of on or '
+    'so that the this to was we were when with you your'.split()
+)
+
+
+def term_counts(text, bits):
+    """``{term bucket: count}`` of a text; words are hashed into 2**bits buckets"""
+    mask = (1 << bits) - 1
+    counts = {}
+    for word in _WORD.findall(text.lower()):
+        if len(word) > 1 and word not in STOP_WORDS:
+            term = zlib.crc32(word.encode('utf-8')) & mask
+            counts[term] = counts.get(term, 0) + 1
+    return counts
+
+
+def idf(df, documents):
+    return np.log((1.0 + documents) / (1.0 + df)) + 1.0
+
+
+class Segment:
+    """One immutable slice of the TF-IDF matrix, stored column-wise (one posting list per term).
+
+    ``terms`` holds the sorted term buckets present, ``ptr[i]:ptr[i + 1]``
+    is the range of ``docs``/``weights`` for ``terms[i]``, and ``ids`` maps
+    a document row to its ticket id. Each document's weights are already
+    L2-normalized, so a dot product with a normalized query is the cosine.
+    Posting lists are ordered by weight, heaviest first, so a search can
+    stop after the documents where a term matters most.
+    The arrays are memory-mapped, so every worker shares the page cache.
+    """
+
+    FILES = ('terms', 'ptr', 'docs', 'weights', 'ids')
+
+    def __init__(self, path):
+        self.path = path
+        for name in self.FILES:
+            # Plain ndarray views of the mapping skip np.memmap's per-slice overhead
+            setattr(self, name, np.asarray(np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def write(path, rows, df, documents):
+        """Write a segment for ``rows`` of ``(ticket_id, {term: count})``"""
+        weights_of = idf(df, documents)
+        terms, docs, weights = [], [], []
+        for row, (_, counts) in enumerate(rows):
+            row_terms = np.fromiter(counts, dtype=np.uint32, count=len(counts))
+            tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            row_weights = (1.0 + np.log(tf)) * weights_of[row_terms]
+            norm = np.sqrt(np.dot(row_weights, row_weights)) or 1.0
+            terms.append(row_terms)
+            docs.append(np.full(len(row_terms), row, dtype=np.int32))
+            weights.append((row_weights / norm).astype(np.float32))
+
+        terms = np.concatenate(terms) if terms else np.empty(0, dtype=np.uint32)
+        docs = np.concatenate(docs) if docs else np.empty(0, dtype=np.int32)
+        weights = np.concatenate(weights) if weights else np.empty(0, dtype=np.float32)
+        order = np.lexsort((-weights, terms))
+        terms, docs, weights = terms[order], docs[order], weights[order]
+        unique, starts = np.unique(terms, return_index=True)
+        ptr = np.append(starts, len(terms)).astype(np.int64)
+
+        tmp = path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        arrays = {
+            'terms': unique.astype(np.uint32), 'ptr': ptr, 'docs': docs, 'weights': weights,
+            'ids': np.array([ticket_id for ticket_id, _ in rows], dtype='S36'),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, f'{name}.npy'), array)
+        os.replace(tmp, path)
+
+    def search(self, terms, weights, limit, max_postings):
+        """[(row, score)] of the ``limit`` best rows for a query vector.
+
+        Only the first ``max_postings`` of each posting list are read.
+        """
+        if not len(self.terms) or not len(terms):
+            return []
+        positions = np.searchsorted(self.terms, terms)
+        found = positions < len(self.terms)
+        found[found] = self.terms[positions[found]] == terms[found]
+        if not found.any():
+            return []
+        docs, values = [], []
+        for position, weight in zip(positions[found], weights[found]):
+            start = self.ptr[position]
+            end = min(self.ptr[position + 1], start + max_postings)
+            docs.append(self.docs[start:end])
+            values.append(self.weights[start:end] * weight)
+        scores = np.bincount(np.concatenate(docs), np.concatenate(values), minlength=len(self))
+        # Partition only the rows that matched; selecting among many zeros is slow
+        rows = np.flatnonzero(scores > 0)
+        if len(rows) > limit:
+            rows = rows[np.argpartition(scores[rows], -limit)[-limit:]]
+        return [(int(row), float(scores[row])) for row in rows]
+
+
+class SimilarIndex:
+    """TF-IDF index of resolved tickets for "similar past tickets" lookups.
+
+    The matrix lives on disk (SIMILAR_INDEX_PATH, by default ``similar`` in
+    the instance folder) as immutable segments of at most
+    SIMILAR_SEGMENT_SIZE tickets plus a document-frequency vector; words
+    are hashed into 2**SIMILAR_HASH_BITS term buckets, so segments built
+    at different times share one term space without a vocabulary.
+    :meth:`update` appends a segment for tickets resolved since the last
+    build and rewrites everything once SIMILAR_MAX_DELTA_SEGMENTS small
+    segments have piled up. A manifest swapped in with os.replace names the
+    live files; workers notice a new one within SIMILAR_RELOAD_SECONDS.
+
+    A query reads only the posting lists of its own terms, at most
+    SIMILAR_MAX_POSTINGS entries of each per segment, skips terms found in
+    more than SIMILAR_MAX_DF of all tickets, and accumulates scores per
+    segment with one bincount. Capping the lists makes scores approximate
+    for common words, which is what keeps a query within milliseconds at a
+    million tickets.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.bits = 20
+        self.segment_size = 100000
+        self.max_delta_segments = 8
+        self.max_df = 0.5
+        self.max_postings = 2000
+        self.reload_interval = 10.0
+        self.manifest = None
+        self.segments = []
+        self.df = None
+        self._manifest_mtime = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.path = tenant_path(config.get('SIMILAR_INDEX_PATH') or os.path.join(app.instance_path, 'similar'))
+        self.bits = config['SIMILAR_HASH_BITS']
+        self.segment_size = config['SIMILAR_SEGMENT_SIZE']
+        self.max_delta_segments = config['SIMILAR_MAX_DELTA_SEGMENTS']
+        self.max_df = config['SIMILAR_MAX_DF']
+        self.max_postings = config['SIMILAR_MAX_POSTINGS']
+        self.reload_interval = config['SIMILAR_RELOAD_SECONDS']
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_manifest(self):
+        try:
+            with open(self._file(MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _fresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self._file(MANIFEST)).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._manifest_mtime:
+            self.load()
+
+    def load(self):
+        """Map the files named by the current manifest"""
+        with self._lock:
+            manifest = self._read_manifest()
+            if manifest is None or manifest['bits'] != self.bits:
+                self.manifest, self.segments, self.df = None, [], None
+                self._manifest_mtime = None
+                return
+            loaded = {segment.path: segment for segment in self.segments}
+            paths = [self._file(name) for name in manifest['segments']]
+            self.segments = [loaded.get(path) or Segment(path) for path in paths]
+            self.df = np.load(self._file(manifest['df']), mmap_mode='r')
+            self.manifest = manifest
+            self._manifest_mtime = os.stat(self._file(MANIFEST)).st_mtime_ns
+
+    def query_vector(self, text):
+        """(terms, weights) of the normalized TF-IDF vector of ``text``"""
+        counts = term_counts(text, self.bits)
+        documents = self.manifest['documents']
+        terms = np.fromiter(counts, dtype=np.uint32, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        df = self.df[terms]
+        keep = df <= max(1, self.max_df * documents)
+        terms, tf, df = terms[keep], tf[keep], df[keep]
+        weights = (1.0 + np.log(tf)) * idf(df, documents)
+        norm = np.sqrt(np.dot(weights, weights)) or 1.0
+        return terms, (weights / norm).astype(np.float32)
+
+    def search(self, text, limit=5, exclude=None):
+        """[(ticket_id, cosine similarity)] of the best matches for ``text``, best first"""
+        self._fresh()
+        with self._lock:
+            if self.manifest is None:
+                return []
+            terms, weights = self.query_vector(text)
+            best = {}
+            # Reopened-and-resolved tickets can sit in two segments; keep the best score
+            for segment in self.segments:
+                for row, score in segment.search(terms, weights, limit + 1, self.max_postings):
+                    ticket_id = segment.ids[row].decode('ascii')
+                    if ticket_id != exclude and score > best.get(ticket_id, 0.0):
+                        best[ticket_id] = score
+        return sorted(best.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def _documents(self, after=None):
+        """Batches of ``(ticket_id, {term: count})`` for resolved tickets after a (updated_at, id) keyset"""
+        tickets = Ticket.__table__
+        query = select(tickets.c.id, tickets.c.title, tickets.c.detail, tickets.c.updated_at).where(
+            tickets.c.is_complete.is_(True), tickets.c.merged_into.is_(None)
+        ).order_by(tickets.c.updated_at, tickets.c.id).limit(self.segment_size)
+        while True:
+            batch = query
+            if after is not None:
+                updated_at, ticket_id = after
+                batch = batch.where(or_(
+                    tickets.c.updated_at > updated_at,
+                    and_(tickets.c.updated_at == updated_at, tickets.c.id > ticket_id)
+                ))
+            rows = db.session.execute(batch).all()
+            if not rows:
+                return
+            after = (rows[-1].updated_at, rows[-1].id)
+            yield [(row.id, term_counts(ticket_text(row.title, row.detail), self.bits)) for row in rows], after
+
+    @staticmethod
+    def _count_terms(df, rows):
+        for _, counts in rows:
+            df[np.fromiter(counts, dtype=np.uint32, count=len(counts))] += 1
+
+    def update(self, full=False):
+        """Index tickets resolved since the last build; returns how many were added"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file('build.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self._read_manifest()
+            if manifest is not None and manifest['bits'] != self.bits:
+                full = True
+            if manifest is not None and not full:
+                full_segments = math.ceil(manifest['documents'] / self.segment_size)
+                full = len(manifest['segments']) >= full_segments + self.max_delta_segments
+            if manifest is None or full:
+                return self._rebuild(manifest)
+            return self._append(manifest)
+
+    def _append(self, manifest):
+        after = manifest['watermark']
+        if after is not None:
+            after = (datetime.fromisoformat(after[0]), after[1])
+        df = np.load(self._file(manifest['df'])).astype(np.int32)
+        generation = manifest['generation'] + 1
+        documents = manifest['documents']
+        segments = list(manifest['segments'])
+        added = 0
+        for rows, after in self._documents(after):
+            self._count_terms(df, rows)
+            documents += len(rows)
+            name = f'seg-{generation:06d}-{len(segments):04d}'
+            Segment.write(self._file(name), rows, df, documents)
+            segments.append(name)
+            added += len(rows)
+        if not added:
+            return 0
+        self._publish(generation, segments, df, documents, after)
+        return added
+
+    def _rebuild(self, previous):
+        # Two passes: frequencies over everything first, so every segment gets the same idf
+        df = np.zeros(1 << self.bits, dtype=np.int32)
+        documents = 0
+        for rows, _ in self._documents():
+            self._count_terms(df, rows)
+            documents += len(rows)
+        generation = (previous['generation'] if previous else 0) + 1
+        segments, after, indexed = [], None, 0
+        for rows, after in self._documents():
+            name = f'seg-{generation:06d}-{len(segments):04d}'
+            Segment.write(self._file(name), rows, df, documents)
+            segments.append(name)
+            indexed += len(rows)
+        self._publish(generation, segments, df, indexed, after)
+        return indexed
+
+    def _publish(self, generation, segments, df, documents, after):
+        df_name = f'df-{generation:06d}.npy'
+        np.save(self._file(df_name), df)
+        manifest = {
+            'generation': generation,
+            'bits': self.bits,
+            'segments': segments,
+            'df': df_name,
+            'documents': documents,
+            'watermark': [after[0].isoformat(), after[1]] if after else None,
+            'builtAt': datetime.utcnow().isoformat(),
+        }
+        tmp = self._file(MANIFEST + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._file(MANIFEST))
+
+        # Workers still mapping removed files keep them until they reload
+        live = set(segments) | {df_name, MANIFEST, 'build.lock'}
+        for name in os.listdir(self.path):
+            if name not in live:
+                path = self._file(name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        self._checked_at = None
+
+
+similar_index = TenantLocal(SimilarIndex)
+
+
+def similar_tickets(ticket, limit=None):
+    """Resolved tickets similar to ``ticket`` with their latest comments, best first.
+
+    Index hits that were reopened, merged or archived since the last build
+    are dropped here.
+    """
+    config = current_app.config
+    limit = limit or config['SIMILAR_LIMIT']
+    # Ask for a few extra in case some hits are no longer resolved
+    matches = similar_index.search(ticket_text(ticket.title, ticket.detail), limit=limit + 5, exclude=ticket.id)
+    if not matches:
+        return []
+    ids = [ticket_id for ticket_id, _ in matches]
+    tickets = {
+        row.id: row for row in db.session.execute(
+            select(Ticket.id, Ticket.number, Ticket.title, Ticket.status, Ticket.updated_at)
+            .where(Ticket.id.in_(ids), Ticket.is_complete.is_(True), Ticket.merged_into.is_(None))
+        )
+    }
+    matches = [(ticket_id, score) for ticket_id, score in matches if ticket_id in tickets][:limit]
+    comments = latest_comments([ticket_id for ticket_id, _ in matches], config['SIMILAR_COMMENTS'])
+    return [
+        {
+            'id': ticket_id,
+            'Number': tickets[ticket_id].number,
+            'title': tickets[ticket_id].title,
+            'status': tickets[ticket_id].status,
+            'resolvedAt': tickets[ticket_id].updated_at,
+            'similarity': round(score, 3),
+            'comments': [comment.to_dict() for comment in comments.get(ticket_id, [])],
+        }
+        for ticket_id, score in matches
+    ]
+
+
+def latest_comments(ticket_ids, per_ticket):
+    """``{ticket_id: [Comment]}`` with the newest ``per_ticket`` comments of each, in one query"""
+    if not ticket_ids or not per_ticket:
+        return {}
+    ranked = select(
+        Comment.id,
+        func.row_number().over(partition_by=Comment.ticket_id, order_by=Comment.created_at.desc()).label('rank')
+    ).where(Comment.ticket_id.in_(ticket_ids)).subquery()
+    comments = Comment.query.join(ranked, ranked.c.id == Comment.id).filter(
+        ranked.c.rank <= per_ticket
+    ).order_by(Comment.ticket_id, Comment.created_at.desc()).all()
+    user_cache.prime([comment.user_id for comment in comments])
+    grouped = {}
+    for comment in comments:
+        grouped.setdefault(comment.ticket_id, []).append(comment)
+    return grouped
@@ -0,0 +1,301 @@
+import contextvars
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import (
+    db, Ticket, SlaEvent,
+    SLA_RESPONSE_WARNING, SLA_RESPONSE_BREACH, SLA_RESOLUTION_WARNING, SLA_RESOLUTION_BREACH,
+)
+from changes import on_ticket_change
+from history import previous
+from tenancy import TenantLocal
+from timer_wheel import TimerWheel
+
+# Stored in sla_events.kind; the codes are the Ticket.sla_flags bits
+SLA_EVENT_KINDS = {
+    SLA_RESPONSE_WARNING: 'response_warning',
+    SLA_RESPONSE_BREACH: 'response_breach',
+    SLA_RESOLUTION_WARNING: 'resolution_warning',
+    SLA_RESOLUTION_BREACH: 'resolution_breach',
+}
+
+# A warning is not reported when its breach comes due in the same pass
+SUPERSEDED_BY = {
+    SLA_RESPONSE_WARNING: SLA_RESPONSE_BREACH,
+    SLA_RESOLUTION_WARNING: SLA_RESOLUTION_BREACH,
+}
+
+# Status a ticket is in until somebody picks it up
+UNANSWERED_STATUS = 'needs_support'
+
+
+def find_policy(priority, ticket_type):
+    """(response minutes, resolution minutes) for a ticket, or None when no SLA applies"""
+    policies = current_app.config['SLA_POLICIES']
+    return policies.get((priority, ticket_type)) or policies.get((priority, None))
+
+
+def compute_deadlines(created_at, priority, ticket_type):
+    """(response due, resolution due) for a ticket created at ``created_at``"""
+    policy = find_policy(priority, ticket_type)
+    if policy is None:
+        return None, None
+    response, resolution = policy
+    return created_at + timedelta(minutes=response), created_at + timedelta(minutes=resolution)
+
+
+def checkpoints(created_at, flags, responded, resolved, response_due, resolution_due):
+    """[(flag, when)] for every warning and breach that hasn't fired and can still happen"""
+    fraction = current_app.config['SLA_WARNING_FRACTION']
+    points = []
+    for met, due, warning, breach in (
+        (responded, response_due, SLA_RESPONSE_WARNING, SLA_RESPONSE_BREACH),
+        (resolved, resolution_due, SLA_RESOLUTION_WARNING, SLA_RESOLUTION_BREACH),
+    ):
+        if met or due is None:
+            continue
+        if not flags & warning:
+            points.append((warning, created_at + (due - created_at) * fraction))
+        if not flags & breach:
+            points.append((breach, due))
+    return points
+
+
+def earliest(points):
+    return min(when for _, when in points) if points else None
+
+
+def next_check(*args):
+    """When the next checkpoint comes due, or None; takes the same arguments as checkpoints()"""
+    return earliest(checkpoints(*args))
+
+
+def ticket_checkpoints(ticket):
+    return checkpoints(
+        ticket.created_at, ticket.sla_flags or 0, ticket.first_response_at is not None,
+        bool(ticket.is_complete), ticket.response_due_at, ticket.resolution_due_at
+    )
+
+
+def reschedule(ticket):
+    ticket.sla_due_at = earliest(ticket_checkpoints(ticket))
+    sla_scheduler.schedule(ticket.id, ticket.sla_due_at)
+
+
+@on_ticket_change
+def track_sla(ticket, before, kind, actor_id=None):
+    """Compute deadlines on create and when priority or type change, then re-arm the timer"""
+    if (before is None or previous(before, 'priority') != ticket.priority
+            or previous(before, 'type') != ticket.type):
+        ticket.response_due_at, ticket.resolution_due_at = compute_deadlines(
+            ticket.created_at or datetime.utcnow(), ticket.priority, ticket.type
+        )
+    if ticket.first_response_at is None and (ticket.status != UNANSWERED_STATUS or ticket.is_complete):
+        ticket.first_response_at = datetime.utcnow()
+    reschedule(ticket)
+
+
+def record_response(ticket, user_id):
+    """Count a reply from anyone but the requester as the first response.
+
+    Like fire_due this is a conditional UPDATE rather than an ORM change: a
+    reply isn't an edit of the ticket, so its version, and with it every
+    editor's If-Match, is left alone, and only one of two concurrent first
+    replies sets the time.
+    """
+    if ticket.first_response_at is not None or user_id == ticket.created_by:
+        return
+    tickets = Ticket.__table__
+    now = datetime.utcnow()
+    sla_due_at = earliest(checkpoints(
+        ticket.created_at, ticket.sla_flags or 0, True,
+        bool(ticket.is_complete), ticket.response_due_at, ticket.resolution_due_at
+    ))
+    claimed = db.session.execute(
+        tickets.update()
+        .where(tickets.c.id == ticket.id, tickets.c.first_response_at.is_(None))
+        .values(first_response_at=now, sla_due_at=sla_due_at, updated_at=tickets.c.updated_at)
+    ).rowcount
+    if claimed:
+        set_committed_value(ticket, 'first_response_at', now)
+        set_committed_value(ticket, 'sla_due_at', sla_due_at)
+        sla_scheduler.schedule(ticket.id, sla_due_at)
+
+
+def fire_due(ticket, now):
+    """Emit the warnings and breaches of ``ticket`` due by ``now`` and re-arm its timer.
+
+    Each flag is claimed with a conditional UPDATE, so when several workers
+    hold a timer for the same ticket only one of them records the event.
+    The SLA columns are written without touching updated_at: a timer firing
+    is not activity on the ticket.
+    """
+    tickets = Ticket.__table__
+    due = [(flag, when) for flag, when in ticket_checkpoints(ticket) if when <= now]
+    claimed = 0
+    for flag, when in due:
+        result = db.session.execute(
+            tickets.update()
+            .where(tickets.c.id == ticket.id, tickets.c.sla_flags.op('&')(flag) == 0)
+            .values(sla_flags=tickets.c.sla_flags.op('|')(flag), updated_at=tickets.c.updated_at)
+        )
+        if result.rowcount:
+            claimed |= flag
+    for flag, when in due:
+        if claimed & flag and not claimed & SUPERSEDED_BY.get(flag, 0):
+            db.session.add(SlaEvent(ticket_id=ticket.id, kind=flag, due_at=when))
+
+    db.session.expire(ticket, ['sla_flags'])
+    sla_due_at = earliest(ticket_checkpoints(ticket))
+    db.session.execute(
+        tickets.update().where(tickets.c.id == ticket.id)
+        .values(sla_due_at=sla_due_at, updated_at=tickets.c.updated_at)
+    )
+    db.session.expire(ticket, ['sla_due_at'])
+    return sla_due_at
+
+
+def process_tickets(ticket_ids, now=None):
+    """Fire whatever is due on these tickets; returns how many were checked"""
+    now = now or datetime.utcnow()
+    checked = 0
+    for ticket_id in ticket_ids:
+        ticket = db.session.get(Ticket, ticket_id)
+        if ticket is None:
+            # Deleted or archived since the timer was set
+            continue
+        sla_due_at = fire_due(ticket, now)
+        db.session.commit()
+        sla_scheduler.schedule(ticket_id, sla_due_at)
+        checked += 1
+    return checked
+
+
+def process_overdue(now=None):
+    """Fire every checkpoint already due, found through the sla_due_at index.
+
+    For running without the in-process scheduler (from cron via
+    ``flask tickets sla-check``) or to catch up after downtime.
+    """
+    now = now or datetime.utcnow()
+    ticket_ids = db.session.execute(
+        select(Ticket.id).where(Ticket.sla_due_at <= now).order_by(Ticket.sla_due_at)
+    ).scalars().all()
+    return process_tickets(ticket_ids, now)
+
+
+def get_sla_events(after=0, limit=100, ticket_id=None):
+    """One page of the SLA event stream, oldest first, starting after event id ``after``"""
+    query = SlaEvent.query.filter(SlaEvent.id > after)
+    if ticket_id:
+        query = query.filter(SlaEvent.ticket_id == ticket_id)
+    return query.order_by(SlaEvent.id).limit(limit).all()
+
+
+def sla_event_to_dict(event):
+    return {
+        'id': event.id,
+        'ticketId': event.ticket_id,
+        'kind': SLA_EVENT_KINDS.get(event.kind, event.kind),
+        'dueAt': event.due_at,
+        'createdAt': event.created_at
+    }
+
+
+def _timestamp(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class SlaScheduler:
+    """Fires SLA warnings and breaches from an in-process hierarchical timer wheel.
+
+    Each open ticket has at most one timer, set to its ``sla_due_at`` (the
+    next warning or breach). Handlers re-arm it whenever a change moves that
+    time, and a background thread advances the wheel once per tick and
+    processes only the tickets whose timers expired. On start the wheel is
+    reloaded from the ``sla_due_at`` index, which is also what makes a
+    restart lose nothing: overdue timers fire on the first tick.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.wheel = None
+        self._thread = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.wheel = TimerWheel(
+            tick=app.config['SLA_TICK_SECONDS'],
+            slots=app.config['SLA_WHEEL_SLOTS'],
+            levels=app.config['SLA_WHEEL_LEVELS'],
+            now=time.time()
+        )
+        if app.config.get('SLA_SCHEDULER_ENABLED', False):
+            self.start()
+
+    def schedule(self, ticket_id, due_at):
+        if self.wheel is None:
+            return
+        if due_at is None:
+            self.wheel.cancel(ticket_id)
+        else:
+            self.wheel.schedule(ticket_id, _timestamp(due_at))
+
+    def load(self):
+        """Arm a timer for every ticket with a pending checkpoint"""
+        rows = db.session.execute(
+            select(Ticket.id, Ticket.sla_due_at).where(Ticket.sla_due_at.is_not(None))
+        )
+        count = 0
+        for ticket_id, due_at in rows:
+            self.wheel.schedule(ticket_id, _timestamp(due_at))
+            count += 1
+        return count
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        # The copied context keeps the tenant this scheduler was started for
+        self._thread = threading.Thread(
+            target=contextvars.copy_context().run, args=(self._run,), name='sla-scheduler', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        with self.app.app_context():
+            self.load()
+        while not self._stop.wait(max(0.0, self.wheel.next_tick_at() - time.time())):
+            ticket_ids = self.wheel.advance(time.time())
+            if not ticket_ids:
+                continue
+            with self.app.app_context():
+                try:
+                    process_tickets(ticket_ids)
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('SLA processing failed')
+                    # Try again on the next tick rather than dropping the timers
+                    retry_at = self.wheel.next_tick_at()
+                    for ticket_id in ticket_ids:
+                        if ticket_id not in self.wheel:
+                            self.wheel.schedule(ticket_id, retry_at)
+                finally:
+                    db.session.remove()
+
+
+sla_scheduler = TenantLocal(SlaScheduler)
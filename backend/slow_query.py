@@ -0,0 +1,218 @@
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+from query_budget import app_frames, normalize_sql
+
+EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+# Only plain reads: EXPLAIN runs inside the caller's transaction, and a
+# WITH can wrap an UPDATE or DELETE on PostgreSQL
+EXPLAINABLE = ('SELECT',)
+# Dialects where a failed statement aborts the whole transaction, so the
+# EXPLAIN runs in a savepoint of its own
+SAVEPOINT_DIALECTS = ('postgresql',)
+SORT_KEYS = {
+    'total': lambda s: s.total,
+    'max': lambda s: s.max,
+    'count': lambda s: s.count,
+    'avg': lambda s: s.total / s.count,
+}
+
+
+def redact(parameters):
+    """Replace parameter values with their type (and length for strings/bytes)"""
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: redact_value(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact_value(value) for value in parameters]
+    return redact_value(parameters)
+
+
+def redact_value(value):
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, (str, bytes)):
+        return f'<{type(value).__name__}:{len(value)}>'
+    return f'<{type(value).__name__}>'
+
+
+def explain(conn, cursor, statement, parameters):
+    """Query plan rows for a SELECT, run on a fresh DB-API cursor of the same connection.
+
+    Going through the raw cursor keeps the EXPLAIN out of the engine events,
+    so it neither re-enters this log nor counts towards query budgets. On
+    PostgreSQL it runs in a savepoint, so an EXPLAIN that fails can't
+    abort the caller's transaction.
+    """
+    prefix = EXPLAIN_PREFIX.get(conn.dialect.name)
+    if prefix is None or not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    savepoint = conn.dialect.name in SAVEPOINT_DIALECTS
+    plan_cursor = cursor.connection.cursor()
+    try:
+        if savepoint:
+            plan_cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            plan_cursor.execute(prefix + statement, parameters or ())
+            plan = [' | '.join(str(col) for col in row) for row in plan_cursor.fetchall()]
+        except Exception as e:
+            if not savepoint:
+                raise
+            plan_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            plan = [f'EXPLAIN failed: {e}']
+        if savepoint:
+            plan_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        return plan
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+    finally:
+        plan_cursor.close()
+
+
+class SlowStatement:
+    """Aggregated timings for one normalized statement"""
+
+    __slots__ = ('statement', 'count', 'total', 'max', 'routes', 'parameters',
+                 'stack', 'plan', 'first_seen', 'last_seen')
+
+    def __init__(self, statement):
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.routes = {}
+        self.parameters = None
+        self.stack = []
+        self.plan = None
+        self.first_seen = datetime.utcnow()
+        self.last_seen = self.first_seen
+
+    def add(self, elapsed, route, parameters, stack):
+        self.count += 1
+        self.total += elapsed
+        self.last_seen = datetime.utcnow()
+        if route:
+            self.routes[route] = self.routes.get(route, 0) + 1
+        if elapsed >= self.max:
+            # Keep the context of the slowest run
+            self.max = elapsed
+            self.parameters = parameters
+            self.stack = stack
+
+    def to_dict(self):
+        return {
+            'statement': self.statement,
+            'count': self.count,
+            'totalMs': round(self.total * 1000, 3),
+            'maxMs': round(self.max * 1000, 3),
+            'avgMs': round(self.total / self.count * 1000, 3),
+            'routes': self.routes,
+            'parameters': self.parameters,
+            'stack': self.stack,
+            'plan': self.plan,
+            'firstSeen': self.first_seen,
+            'lastSeen': self.last_seen,
+        }
+
+
+class SlowQueryLog:
+    """Log statements slower than SLOW_QUERY_THRESHOLD_MS and aggregate them.
+
+    Each slow statement is logged with its normalized SQL, redacted
+    parameters, the route that ran it and the stack in our code. The first
+    time a statement shape turns up, its EXPLAIN (EXPLAIN QUERY PLAN on
+    SQLite) is captured and kept with the aggregate; :meth:`top` serves the
+    admin report. Aggregates are per process.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.threshold = 0.1
+        self.max_statements = 500
+        self.stack_depth = 8
+        self.logger = None
+        self._statements = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SLOW_QUERY_ENABLED', False)
+        if not self.enabled:
+            return
+        self.threshold = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000
+        self.max_statements = app.config['SLOW_QUERY_MAX_STATEMENTS']
+        self.stack_depth = app.config['SLOW_QUERY_STACK_DEPTH']
+        self.logger = app.logger
+        from models import db
+        with app.app_context():
+            self.instrument_engine(db.engine)
+
+    def instrument_engine(self, engine):
+        """Time statements on an engine; safe to call more than once"""
+        if not event.contains(engine, 'before_cursor_execute', self._before):
+            event.listen(engine, 'before_cursor_execute', self._before)
+            event.listen(engine, 'after_cursor_execute', self._after)
+            event.listen(engine, 'handle_error', self._failed)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+    def _failed(self, context):
+        starts = context.connection.info.get('slow_query_start') if context.connection else None
+        if starts:
+            starts.pop()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['slow_query_start'].pop()
+        if elapsed < self.threshold:
+            return
+
+        normalized = normalize_sql(statement)
+        route = request.endpoint if has_request_context() else None
+        redacted = redact(parameters) if not executemany else f'<{len(parameters)} rows>'
+        stack = list(islice(app_frames(), self.stack_depth))
+
+        with self._lock:
+            entry = self._statements.get(normalized)
+            new = entry is None
+            if new:
+                if len(self._statements) >= self.max_statements:
+                    cheapest = min(self._statements.values(), key=lambda s: s.total)
+                    del self._statements[cheapest.statement]
+                entry = self._statements[normalized] = SlowStatement(normalized)
+            entry.add(elapsed, route, redacted, stack)
+
+        if new and not executemany:
+            entry.plan = explain(conn, cursor, statement, parameters)
+
+        self.logger.warning(
+            'Slow query (%.1f ms) on %s: %s\n  parameters: %s\n  stack:\n    %s%s',
+            elapsed * 1000, route or '-', normalized, redacted,
+            '\n    '.join(stack) or '-',
+            '\n  plan:\n    ' + '\n    '.join(entry.plan) if new and entry.plan else ''
+        )
+
+    def top(self, limit=20, sort='total'):
+        """The ``limit`` worst statements by total, max, avg time or count"""
+        key = SORT_KEYS.get(sort, SORT_KEYS['total'])
+        with self._lock:
+            statements = sorted(self._statements.values(), key=key, reverse=True)[:limit]
+            return [statement.to_dict() for statement in statements]
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+
+
+slow_query_log = SlowQueryLog()
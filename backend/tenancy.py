@@ -0,0 +1,202 @@
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+
+from flask import g, jsonify, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+_tenant = contextvars.ContextVar('tenant', default=None)
+
+
+def current_tenant():
+    """Id of the tenant being served, or None for the default database"""
+    return _tenant.get()
+
+
+def tenant_path(path):
+    """``path`` made distinct for the current tenant, for indexes and models kept on disk"""
+    tenant = current_tenant()
+    if tenant is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f'{root}-{tenant}{ext}'
+
+
+class TenantSession(Session):
+    """``db.session`` that sends every statement to the current tenant's database"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        tenant = _tenant.get()
+        if bind is None and tenant is not None:
+            return tenancy.engine(tenant)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class TenantLocal:
+    """Gives each tenant its own instance of a per-process singleton.
+
+    Attribute access goes to the current tenant's instance, which is
+    created and initialized with the app the first time that tenant uses
+    it. :meth:`init_app` initializes the default database's instance.
+    """
+
+    registry = []
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instances = {}
+        self._app = None
+        self._lock = threading.RLock()
+        TenantLocal.registry.append(self)
+
+    def init_app(self, app):
+        self._app = app
+        with self._lock:
+            self._instances.clear()
+        self.instance()
+
+    def instance(self):
+        tenant = _tenant.get()
+        instance = self._instances.get(tenant)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(tenant)
+                if instance is None:
+                    instance = self._factory()
+                    if self._app is not None:
+                        instance.init_app(self._app)
+                    self._instances[tenant] = instance
+        return instance
+
+    def __getattr__(self, name):
+        return getattr(self.instance(), name)
+
+
+class Tenancy:
+    """Routes each request to its tenant's database.
+
+    Every id in TENANTS gets a database of its own: a SQLite file (or any
+    URL) from TENANT_DATABASE_URI, or with TENANT_SCHEMAS a PostgreSQL
+    schema in the main database. Each tenant has its own engine and so its
+    own connection pool. The tenant comes from the ``tenant`` claim of the
+    request's token, or TENANT_HEADER on requests without one (login), and
+    is kept in a context variable that :class:`TenantSession` reads. With
+    no TENANTS everything uses SQLALCHEMY_DATABASE_URI as before.
+
+    Every tenant database is created, migrated and seeded at startup, and
+    the in-memory indexes and caches are built per tenant through
+    :class:`TenantLocal`.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.tenants = ()
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.tenants = tuple(app.config.get('TENANTS', ()))
+        self._engines = {}
+        if not self.tenants:
+            return
+        app.before_request(self.select)
+        app.teardown_request(self.release)
+
+        from database import prepare_database
+        for tenant in self.tenants:
+            print(f"Initializing database for tenant {tenant}...")
+            if app.config['TENANT_SCHEMAS']:
+                self._create_schema(tenant)
+            with self.use(tenant):
+                prepare_database()
+                for local in TenantLocal.registry:
+                    local.instance()
+
+    @contextmanager
+    def use(self, tenant):
+        """Run the block against ``tenant``'s database, in an app context and session of its own"""
+        token = _tenant.set(tenant)
+        try:
+            with self.app.app_context():
+                yield
+        finally:
+            _tenant.reset(token)
+
+    def engine(self, tenant):
+        engine = self._engines.get(tenant)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(tenant)
+                if engine is None:
+                    engine = self._engines[tenant] = self._create_engine(tenant)
+        return engine
+
+    def _create_engine(self, tenant):
+        config = self.app.config
+        options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        options.setdefault('pool_size', config['TENANT_POOL_SIZE'])
+        options.setdefault('max_overflow', config['TENANT_MAX_OVERFLOW'])
+        if config['TENANT_SCHEMAS']:
+            url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+        else:
+            url = make_url(config['TENANT_DATABASE_URI'].format(tenant=tenant))
+        if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+            # Relative paths are under the instance folder, like Flask-SQLAlchemy's
+            path = os.path.join(self.app.instance_path, url.database)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            url = url.set(database=path)
+        engine = create_engine(url, **options)
+
+        if config['TENANT_SCHEMAS']:
+            schema = engine.dialect.identifier_preparer.quote(tenant)
+
+            @event.listens_for(engine, 'connect')
+            def set_search_path(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute(f'SET search_path TO {schema}')
+                cursor.close()
+
+        from query_budget import instrument_engine
+        from slow_query import slow_query_log
+        if config.get('QUERY_BUDGET_ENABLED', False):
+            instrument_engine(engine)
+        if slow_query_log.enabled:
+            slow_query_log.instrument_engine(engine)
+        return engine
+
+    def _create_schema(self, tenant):
+        from models import db
+        with self.app.app_context(), db.engine.begin() as connection:
+            schema = connection.dialect.identifier_preparer.quote(tenant)
+            connection.exec_driver_sql(f'CREATE SCHEMA IF NOT EXISTS {schema}')
+
+    def _requested_tenant(self):
+        try:
+            verify_jwt_in_request(optional=True)
+            claims = get_jwt()
+        except Exception:
+            # Left to login_required, which rejects the token
+            claims = {}
+        if claims:
+            return claims.get('tenant')
+        return request.headers.get(self.app.config['TENANT_HEADER']) or None
+
+    def select(self):
+        tenant = self._requested_tenant()
+        if tenant is not None and tenant not in self.tenants:
+            return jsonify({'error': 'Unknown tenant'}), 404
+        g._tenant_token = _tenant.set(tenant)
+
+    def release(self, exc=None):
+        token = g.pop('_tenant_token', None)
+        if token is not None:
+            _tenant.reset(token)
+
+
+tenancy = Tenancy()
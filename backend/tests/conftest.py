@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """The testing app on a database of its own, seeded once per session"""
+    # Relative paths in the config (rate limit file, indexes) are under the backend
+    os.chdir(BACKEND_DIR)
+    import config
+    config.TestingConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path_factory.mktemp('db') / 'test.db')
+    from app import create_app
+    return create_app('testing')
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, email='admin@peppermint.com', password='admin123'):
+    response = client.post('/api/v1/auth/login', json={'email': email, 'password': password})
+    assert response.status_code == 200, response.get_json()
+    return {'Authorization': 'Bearer ' + response.get_json()['token']}
+
+
+@pytest.fixture
+def admin(client):
+    return login(client)
+
+
+@pytest.fixture
+def agent(client):
+    return login(client, 'john.doe@company.com', 'password123')
+
+
+@pytest.fixture
+def ticket(client, admin):
+    response = client.post('/api/v1/ticket/create', json={'title': 'Printer on fire', 'detail': 'Third floor'},
+                           headers=admin)
+    assert response.status_code == 201
+    return response.get_json()
@@ -0,0 +1,21 @@
+import pytest
+
+
+@pytest.mark.parametrize('body', [
+    {'older_than_days': 0},
+    {'older_than_days': -30},
+    {'older_than_days': '30'},
+    {'older_than_days': 1.5},
+    {'older_than_days': True},
+    {'batch_size': 0},
+])
+def test_archive_rejects_bad_arguments(client, admin, body):
+    response = client.post('/api/v1/admin/archive', json=body, headers=admin)
+    assert response.status_code == 400
+    assert 'positive integer' in response.get_json()['error']
+
+
+def test_archive_accepts_positive_days(client, admin):
+    response = client.post('/api/v1/admin/archive', json={'older_than_days': 3650}, headers=admin)
+    assert response.status_code == 200
+    assert response.get_json() == {'archived': 0}
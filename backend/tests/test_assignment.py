@@ -0,0 +1,19 @@
+from assignment import agent_index
+
+
+def open_tickets(client, headers, user_id):
+    agents = client.get('/api/v1/admin/agents/load', headers=headers).get_json()['agents']
+    return next(agent['openTickets'] for agent in agents if agent['userId'] == user_id)
+
+
+def test_agent_load_follows_new_tickets(app, client, admin, agent, monkeypatch):
+    agent_id = client.get('/api/v1/auth/me', headers=agent).get_json()['id']
+    before = open_tickets(client, admin, agent_id)
+    # No reload in between: the load must come from the counter adjustment
+    with app.app_context():
+        monkeypatch.setattr(agent_index.instance(), 'resync_interval', float('inf'))
+
+    response = client.post('/api/v1/ticket/create', headers=admin,
+                           json={'title': 'VPN down', 'detail': 'Since 9am', 'assigned_to': agent_id})
+    assert response.status_code == 201
+    assert open_tickets(client, admin, agent_id) == before + 1
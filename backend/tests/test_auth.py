@@ -0,0 +1,22 @@
+from conftest import login
+
+
+def test_login_leaves_user_version_alone(client, admin):
+    agent = login(client, 'john.doe@company.com', 'password123')
+    me = client.get('/api/v1/auth/me', headers=agent).get_json()
+    etag = client.get(f'/api/v1/users/{me["id"]}', headers=admin).headers['ETag']
+
+    agent = login(client, 'john.doe@company.com', 'password123')
+
+    # The cached user was refreshed, so the new login time shows straight away
+    assert client.get('/api/v1/auth/me', headers=agent).get_json()['lastLogin'] != me['lastLogin']
+    # Same version, but the body changed, so the ETag did too
+    response = client.get(f'/api/v1/users/{me["id"]}', headers={**admin, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['version'] == me['version'] and response.headers['ETag'] != etag
+
+
+def test_missing_or_bad_token_is_401(client, capsys):
+    assert client.get('/api/v1/auth/me').status_code == 401
+    assert client.get('/api/v1/auth/me', headers={'Authorization': 'Bearer not-a-token'}).status_code == 401
+    assert capsys.readouterr().out == ''
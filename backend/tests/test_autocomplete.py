@@ -0,0 +1,62 @@
+import uuid
+
+import pytest
+
+from autocomplete import Autocomplete, PrefixIndex
+
+
+@pytest.fixture
+def unbudgeted(app, monkeypatch):
+    """Count queries without failing: the first change of each kind in a fresh
+    database also inserts its cache_versions row, and that depends on test order"""
+    monkeypatch.setitem(app.config, 'QUERY_BUDGET_ENFORCE', False)
+
+
+def _search(client, headers, kind, q):
+    response = client.get('/api/v1/autocomplete', query_string={'kind': kind, 'q': q}, headers=headers)
+    assert response.status_code == 200
+    return [row['id'] for row in response.get_json()['results']]
+
+
+def test_every_query_word_must_prefix_a_token():
+    index = PrefixIndex([
+        {'id': 'a', 'name': 'Ada Lovelace', 'email': 'ada@engine.example.com'},
+        {'id': 'b', 'name': 'Alan Turing', 'email': 'alan@bletchley.example.com'},
+    ])
+    assert [row['id'] for row in index.search('A', 10)] == ['a', 'b']
+    assert [row['id'] for row in index.search('al tur', 10)] == ['b']
+    assert [row['id'] for row in index.search('engine.example', 10)] == ['a']
+
+    index.put({'id': 'a', 'name': 'Grace Hopper', 'email': 'grace@navy.example.com'})
+    assert index.search('ada', 10) == [] and [row['id'] for row in index.search('hop', 10)] == ['a']
+    index.remove('b')
+    assert index.search('alan', 10) == [] and len(index) == 1
+
+
+def test_user_changes_show_up_straight_away(client, admin, unbudgeted):
+    tag = f'Qx{uuid.uuid4().hex[:6]}'
+    user = client.post('/api/v1/users', json={'name': f'{tag} Original', 'email': f'{tag}@example.com',
+                                              'password': 'secret123'}, headers=admin).get_json()
+    assert _search(client, admin, 'user', f'{tag} orig') == [user['id']]
+
+    client.put(f"/api/v1/users/{user['id']}", json={'name': f'{tag} Renamed'}, headers=admin)
+    assert _search(client, admin, 'user', f'{tag} orig') == []
+    assert _search(client, admin, 'user', f'{tag} ren') == [user['id']]
+
+    client.delete(f"/api/v1/users/{user['id']}", headers=admin)
+    assert _search(client, admin, 'user', tag) == []
+
+
+def test_other_workers_rebuild_after_a_version_bump(app, client, admin, unbudgeted):
+    with app.app_context():
+        other = Autocomplete(check_interval=0)
+        other.rebuild('client')
+        lagging = Autocomplete(check_interval=3600)
+        lagging.rebuild('client')
+    tag = f'Qx{uuid.uuid4().hex[:6]}'
+    created = client.post('/api/v1/clients', json={'name': f'{tag} Ltd', 'email': f'{tag}@example.com'},
+                          headers=admin).get_json()
+
+    with app.test_request_context():
+        assert [row['id'] for row in other.search('client', tag)] == [created['id']]
+        assert lagging.search('client', tag) == []
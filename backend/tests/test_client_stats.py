@@ -0,0 +1,68 @@
+import uuid
+
+import pytest
+
+from client_stats import rebuild_client_stats
+from models import db, Client, ClientStats
+
+
+def _client(app):
+    suffix = uuid.uuid4().hex[:8]
+    with app.app_context():
+        row = Client(name=f'Client {suffix}', email=f'{suffix}@example.com')
+        db.session.add(row)
+        db.session.commit()
+        return row.id
+
+
+def _ticket(client, admin, client_id):
+    return client.post('/api/v1/ticket/create', json={'title': 'Client ticket', 'detail': 'x', 'client_id': client_id},
+                       headers=admin).get_json()
+
+
+def _stats(client, admin, client_id):
+    body = client.get(f'/api/v1/clients/{client_id}/tickets', headers=admin).get_json()['client']
+    return body['openTickets'], body['resolvedTickets'], body['loggedHours']
+
+
+@pytest.fixture
+def acme(app):
+    return _client(app)
+
+
+def test_counts_follow_status_changes(client, admin, acme):
+    first, second = _ticket(client, admin, acme), _ticket(client, admin, acme)
+    client.post(f"/api/v1/ticket/{first['id']}/time", json={'description': 'Call', 'hours': 1.25,
+                                                           'date': '2024-05-01'}, headers=admin)
+    assert _stats(client, admin, acme) == (2, 0, 1.25)
+
+    client.patch(f"/api/v1/ticket/{second['id']}/close", headers=admin)
+    assert _stats(client, admin, acme) == (1, 1, 1.25)
+    client.patch(f"/api/v1/ticket/{second['id']}/reopen", headers=admin)
+    assert _stats(client, admin, acme) == (2, 0, 1.25)
+
+
+def test_moving_a_ticket_moves_its_hours(app, client, admin, acme):
+    other = _client(app)
+    ticket = _ticket(client, admin, acme)
+    client.post(f"/api/v1/ticket/{ticket['id']}/time", json={'description': 'Fix', 'hours': 3,
+                                                            'date': '2024-05-02'}, headers=admin)
+    client.patch(f"/api/v1/ticket/{ticket['id']}/close", headers=admin)
+
+    client.put(f"/api/v1/ticket/{ticket['id']}", json={'client_id': other}, headers=admin)
+    assert _stats(client, admin, acme) == (0, 0, 0.0)
+    assert _stats(client, admin, other) == (0, 1, 3.0)
+    client.put(f"/api/v1/ticket/{ticket['id']}", json={'client_id': None}, headers=admin)
+    assert _stats(client, admin, other) == (0, 0, 0.0)
+
+
+def test_rebuild_matches_the_incremental_counts(app, client, admin, acme):
+    _ticket(client, admin, acme)
+    with app.app_context():
+        def snapshot():
+            return {row.client_id: (row.open_tickets, row.resolved_tickets, round(row.logged_hours, 2))
+                    for row in ClientStats.query if any((row.open_tickets, row.resolved_tickets, row.logged_hours))}
+
+        incremental = snapshot()
+        rebuild_client_stats()
+        assert snapshot() == incremental
@@ -0,0 +1,60 @@
+import uuid
+
+import pytest
+
+from models import db, Client
+
+
+@pytest.fixture
+def tag(app, client, admin):
+    """Prefix shared by a few new clients, some differing only in case"""
+    # A worker's first request also reads the user cache version; keep that
+    # out of the directory's two-query budget
+    client.get('/api/v1/auth/me', headers=admin)
+    tag = f'zq{uuid.uuid4().hex[:6]}'
+    with app.app_context():
+        db.session.add_all([
+            Client(name=f'{tag} Beta', email=f'beta@{tag}.example.com'),
+            Client(name=f'{tag.upper()} alpha', email=f'alpha@{tag}.example.com'),
+            Client(name=f'{tag} Alpha', email=f'alpha2@{tag}.example.com'),
+            Client(name='Gamma Corp', email=f'gamma@{tag}.example.com', contact_name=f'{tag} Contact'),
+            Client(name=f'{tag} Retired', email=f'old@{tag}.example.com', active=False),
+        ])
+        db.session.commit()
+    return tag
+
+
+def _walk(client, headers, **params):
+    pages, cursor = [], None
+    while True:
+        response = client.get('/api/v1/clients', query_string={**params, 'cursor': cursor}, headers=headers)
+        assert response.status_code == 200
+        body = response.get_json()
+        pages.append(body['clients'])
+        cursor = body['nextCursor']
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_the_directory_in_name_order(app, client, admin, tag):
+    pages = _walk(client, admin, limit=2)
+    assert all(len(page) == 2 for page in pages[:-1])
+    walked = [(row['name'].lower(), row['id']) for page in pages for row in page]
+    with app.app_context():
+        expected = sorted((row.name.lower(), row.id) for row in Client.query.filter_by(active=True))
+    assert walked == expected
+
+
+def test_search_matches_name_email_or_contact_prefix(client, admin, tag):
+    pages = _walk(client, admin, q=tag.upper(), limit=2)
+    names = [row['name'] for page in pages for row in page]
+    # Case-insensitive prefix on any column, in name order; inactive clients never show
+    assert names[0] == 'Gamma Corp' and names[3] == f'{tag} Beta'
+    assert set(names[1:3]) == {f'{tag.upper()} alpha', f'{tag} Alpha'}
+
+
+def test_picker_view_and_bad_cursor(client, admin, tag):
+    body = client.get('/api/v1/clients', query_string={'q': tag, 'view': 'picker'}, headers=admin).get_json()
+    assert all(set(row) == {'id', 'name'} for row in body['clients']) and len(body['clients']) == 4
+    assert client.get('/api/v1/clients', query_string={'cursor': 'garbage'}, headers=admin).status_code == 400
+    assert client.get('/api/v1/clients', query_string={'view': 'table'}, headers=admin).status_code == 400
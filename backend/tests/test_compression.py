@@ -0,0 +1,15 @@
+def test_compressed_responses_have_their_own_etag(client, admin, ticket):
+    plain = client.get(f"/api/v1/ticket/{ticket['id']}", headers=admin)
+    compressed = client.get(f"/api/v1/ticket/{ticket['id']}", headers=dict(admin, **{'Accept-Encoding': 'gzip'}))
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+
+    # Either tag validates the same version
+    for etag in (plain.headers['ETag'], compressed.headers['ETag']):
+        assert client.get(f"/api/v1/ticket/{ticket['id']}",
+                          headers=dict(admin, **{'If-None-Match': etag})).status_code == 304
+    updated = client.put(f"/api/v1/ticket/{ticket['id']}", json={'title': 'Via gzip tag'},
+                         headers=dict(admin, **{'If-Match': compressed.headers['ETag']}))
+    assert updated.status_code == 200
+    assert client.get(f"/api/v1/ticket/{ticket['id']}",
+                      headers=dict(admin, **{'If-None-Match': plain.headers['ETag']})).status_code == 200
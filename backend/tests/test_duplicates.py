@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from models import db, Ticket
+from duplicates import duplicate_index, minhash, store_signature, ticket_text
+
+
+@pytest.fixture
+def indexed(app, ticket):
+    """The ticket's row, with the index left holding its real signature afterwards"""
+    with app.app_context():
+        row = db.session.get(Ticket, ticket['id'])
+        yield row
+        db.session.rollback()
+        row = db.session.get(Ticket, ticket['id'])
+        store_signature(row, minhash(ticket_text(row.title, row.detail)))
+        db.session.commit()
+
+
+def test_index_changes_wait_for_commit(indexed):
+    original = duplicate_index.signature_of(indexed.id)
+    replacement = minhash('Keyboard missing several keys')
+    store_signature(indexed, replacement)
+    assert np.array_equal(duplicate_index.signature_of(indexed.id), original)
+    db.session.commit()
+    assert np.array_equal(duplicate_index.signature_of(indexed.id), replacement)
+
+
+def test_rolled_back_index_changes_are_discarded(indexed):
+    original = duplicate_index.signature_of(indexed.id)
+    store_signature(indexed, minhash('Keyboard missing several keys'))
+    db.session.rollback()
+    db.session.commit()
+    assert np.array_equal(duplicate_index.signature_of(indexed.id), original)
+
+
+def test_new_ticket_finds_its_duplicate(client, admin):
+    body = {'title': 'Projector in room 4 flickers', 'detail': 'Every few minutes during calls'}
+    first = client.post('/api/v1/ticket/create', json=body, headers=admin).get_json()
+    second = client.post('/api/v1/ticket/create', json=dict(body, detail=body['detail'] + '!'), headers=admin)
+    assert [match['id'] for match in second.get_json()['possibleDuplicates']] == [first['id']]
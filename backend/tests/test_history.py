@@ -0,0 +1,33 @@
+def _history(client, headers, ticket_id, **params):
+    response = client.get(f'/api/v1/ticket/{ticket_id}/history', query_string=params, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_updates_record_only_the_changed_fields(client, admin, ticket):
+    client.put(f"/api/v1/ticket/{ticket['id']}", json={'priority': 'high', 'status': 'in_progress',
+                                                      'title': ticket['title']}, headers=admin)
+    # Nothing tracked changes, so no event
+    client.put(f"/api/v1/ticket/{ticket['id']}", json={'priority': 'high'}, headers=admin)
+
+    created, updated = _history(client, admin, ticket['id'])['events']
+    assert created['kind'] == 'created'
+    assert 'detail' not in {change['field'] for change in created['changes']}
+    assert {'field': 'title', 'from': None, 'to': 'Printer on fire'} in created['changes']
+    assert updated['kind'] == 'updated'
+    assert updated['changes'] == [
+        {'field': 'status', 'from': ticket['status'], 'to': 'in_progress'},
+        {'field': 'priority', 'from': ticket['priority'], 'to': 'high'},
+    ]
+
+
+def test_close_and_reopen_page_in_order(client, admin, ticket):
+    client.patch(f"/api/v1/ticket/{ticket['id']}/close", headers=admin)
+    client.patch(f"/api/v1/ticket/{ticket['id']}/reopen", headers=admin)
+
+    first = _history(client, admin, ticket['id'], limit=2)
+    assert [event['kind'] for event in first['events']] == ['created', 'closed']
+    assert {'field': 'status', 'from': ticket['status'], 'to': 'resolved'} in first['events'][1]['changes']
+    rest = _history(client, admin, ticket['id'], limit=2, after=first['nextCursor'])
+    assert [event['kind'] for event in rest['events']] == ['reopened'] and rest['nextCursor'] is None
+    assert {'field': 'is_complete', 'from': True, 'to': False} in rest['events'][0]['changes']
@@ -0,0 +1,63 @@
+import pytest
+
+from models import Ticket, IdempotencyKey
+
+
+def _create(client, headers, key, title='Coffee machine leaks'):
+    return client.post('/api/v1/ticket/create', json={'title': title, 'detail': 'x'},
+                       headers=dict(headers, **{'Idempotency-Key': key}))
+
+
+def _count(app, title):
+    with app.app_context():
+        return Ticket.query.filter_by(title=title).count()
+
+
+def test_retry_replays_first_response(app, client, admin):
+    first = _create(client, admin, 'replay', 'Replayed ticket')
+    retry = _create(client, admin, 'replay', 'Replayed ticket')
+    assert first.status_code == retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert _count(app, 'Replayed ticket') == 1
+
+
+def test_key_is_per_user(app, client, admin, agent):
+    assert _create(client, admin, 'shared', 'Per user').status_code == 201
+    assert 'Idempotent-Replayed' not in _create(client, agent, 'shared', 'Per user').headers
+    assert _count(app, 'Per user') == 2
+
+
+def test_reuse_for_another_request_is_rejected(client, admin):
+    assert _create(client, admin, 'reused', 'One').status_code == 201
+    assert _create(client, admin, 'reused', 'Another').status_code == 422
+
+
+def test_failed_request_is_not_stored(app, client, admin):
+    with app.app_context():
+        keys = IdempotencyKey.query.count()
+    headers = dict(admin, **{'Idempotency-Key': 'invalid'})
+    assert client.post('/api/v1/ticket/create', json={'title': 'No detail'}, headers=headers).status_code == 400
+    with app.app_context():
+        assert IdempotencyKey.query.count() == keys
+    # The fixed request is run, not rejected as a reuse of the key
+    fixed = client.post('/api/v1/ticket/create', json={'title': 'No detail', 'detail': 'x'}, headers=headers)
+    assert fixed.status_code == 201
+
+
+def test_key_committed_without_response_is_kept(app, client, admin, monkeypatch):
+    import app as app_module
+
+    def fail(ticket_ids):
+        raise RuntimeError('after commit')
+
+    # create_ticket commits, then fails building its response
+    monkeypatch.setattr(app_module, 'duplicate_summaries', fail)
+    with pytest.raises(RuntimeError):
+        _create(client, admin, 'lost', 'Lost response')
+    monkeypatch.undo()
+
+    retry = _create(client, admin, 'lost', 'Lost response')
+    assert retry.status_code == 409
+    assert 'took effect' in retry.get_json()['error']
+    assert _count(app, 'Lost response') == 1
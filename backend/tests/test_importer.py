@@ -0,0 +1,48 @@
+import json
+
+import importer
+
+
+def _ndjson(*rows):
+    return '\n'.join(json.dumps(row) for row in rows)
+
+
+def _import(client, admin, body, **params):
+    return client.post('/api/v1/ticket/import', query_string=params, data=body,
+                       headers={**admin, 'Content-Type': 'application/x-ndjson'})
+
+
+def test_bad_rows_are_reported_by_line(client, admin):
+    body = _ndjson(
+        {'title': 'Imported fine', 'detail': 'ok'},
+        {'title': 'No detail'},
+        {'title': 'Odd creator', 'detail': 'x', 'created_by': ['not', 'an', 'id']},
+        {'title': 'Odd assignee', 'detail': 'x', 'assigned_to': {'id': 1}},
+        {'title': 'Ghost', 'detail': 'x', 'assigned_to': 'nobody@example.com'},
+    ) + '\nnot json'
+    response = _import(client, admin, body)
+    assert response.status_code == 201
+    result = response.get_json()
+    assert result['imported'] == 1 and result['failed'] == 5 and not result['stopped']
+    assert [(error['line'], error['error'].split()[0]) for error in result['errors']] == [
+        (2, 'detail'), (3, 'created_by'), (4, 'assigned_to'), (5, 'assigned_to'), (6, 'Invalid')
+    ]
+
+
+def test_number_allocation_exhaustion_stops_the_import(client, admin, ticket, monkeypatch):
+    # The first chunk gets a free number; every later attempt collides with an existing ticket
+    real = importer.get_next_ticket_number
+    calls = []
+
+    def next_number():
+        calls.append(1)
+        return real() if len(calls) == 1 else ticket['Number']
+
+    monkeypatch.setattr(importer, 'get_next_ticket_number', next_number)
+    body = _ndjson(*({'title': f'Chunked {i}', 'detail': 'x'} for i in range(3)))
+
+    response = _import(client, admin, body, batch_size=1, chunk_size=1)
+    assert response.status_code == 409
+    result = response.get_json()
+    assert result['stopped'] and result['imported'] == 1 and result['failed'] == 1
+    assert result['errors'][0]['line'] == 2
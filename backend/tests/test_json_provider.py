@@ -0,0 +1,54 @@
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+import json_provider
+from json_provider import FastJSONProvider, encode_fragment
+
+USER = {'id': 'u1', 'name': 'Agent', 'createdAt': datetime(2024, 1, 2, 3, 4, 5)}
+PAYLOAD = {
+    'when': datetime(2024, 5, 6, 7, 8, 9, 123456),
+    'day': date(2024, 5, 6),
+    'hours': Decimal('1.25'),
+    'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'createdBy': encode_fragment(USER),
+    'users': [encode_fragment(USER), None],
+}
+EXPECTED = {
+    'when': '2024-05-06T07:08:09.123456',
+    'day': '2024-05-06',
+    'hours': '1.25',
+    'id': '12345678-1234-5678-1234-567812345678',
+    'createdBy': {'id': 'u1', 'name': 'Agent', 'createdAt': '2024-01-02T03:04:05'},
+    'users': [{'id': 'u1', 'name': 'Agent', 'createdAt': '2024-01-02T03:04:05'}, None],
+}
+
+
+@pytest.mark.parametrize('with_orjson', [True, False])
+def test_both_encoders_agree(app, monkeypatch, with_orjson):
+    if not with_orjson:
+        monkeypatch.setattr(json_provider, 'orjson', None)
+    provider = FastJSONProvider(app)
+    assert json.loads(provider.dumps(PAYLOAD)) == EXPECTED
+    with app.test_request_context():
+        assert json.loads(provider.response(PAYLOAD).get_data()) == EXPECTED
+
+
+def test_fragments_embed_the_encoded_bytes(app):
+    fragment = encode_fragment(USER)
+    assert fragment.obj is USER
+    # Changing the record after encoding does not change what is embedded
+    USER['name'] = 'Changed'
+    try:
+        assert json.loads(FastJSONProvider(app).dumps({'user': fragment}))['user']['name'] == 'Agent'
+    finally:
+        USER['name'] = 'Agent'
+
+
+def test_ticket_embeds_the_cached_user(client, admin, ticket):
+    me = client.get('/api/v1/auth/me', headers=admin).get_json()
+    loaded = client.get(f"/api/v1/ticket/{ticket['id']}", headers=admin).get_json()
+    assert loaded['createdBy'] == me
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+
+from models import db, ChangeRecord, Ticket
+from conftest import login
+from outbox import latest_offset, record_change
+
+
+def _changes(client, headers, **params):
+    response = client.get('/api/v1/changes', query_string=params, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_changes_in_commit_order(app, client, admin):
+    with app.app_context():
+        start = latest_offset()
+    ticket = client.post('/api/v1/ticket/create', json={'title': 'Outbox', 'detail': 'x'}, headers=admin).get_json()
+    client.put(f"/api/v1/ticket/{ticket['id']}", json={'priority': 'high'}, headers=admin)
+    client.post(f"/api/v1/ticket/{ticket['id']}/comments", json={'content': 'On it'}, headers=admin)
+    client.patch(f"/api/v1/ticket/{ticket['id']}/close", headers=admin)
+
+    page = _changes(client, admin, after=start)
+    offsets = [change['offset'] for change in page['changes']]
+    assert offsets == sorted(offsets) and len(set(offsets)) == len(offsets)
+    assert [change['event'] for change in page['changes']] == [
+        'ticket.created', 'ticket.updated', 'comment.created', 'ticket.closed'
+    ]
+    assert page['changes'][1]['data']['changes'] == {'priority': ['medium', 'high']}
+    assert page['nextOffset'] == offsets[-1] and not page['hasMore']
+
+
+def test_paging_and_filter(app, client, admin):
+    with app.app_context():
+        start = latest_offset()
+    for i in range(3):
+        client.post('/api/v1/ticket/create', json={'title': f'Page {i}', 'detail': 'x'}, headers=admin)
+
+    first = _changes(client, admin, after=start, limit=2)
+    assert len(first['changes']) == 2 and first['hasMore']
+    rest = _changes(client, admin, after=first['nextOffset'], limit=2)
+    assert len(rest['changes']) == 1 and not rest['hasMore']
+    assert _changes(client, admin, after=start, events='comment.created')['changes'] == []
+    assert client.get('/api/v1/changes?events=nope', headers=admin).status_code == 400
+
+
+def test_rolled_back_change_leaves_no_record(app):
+    with app.app_context():
+        before = latest_offset()
+        record_change('ticket.updated', 'missing', {})
+        db.session.rollback()
+        assert latest_offset() == before
+        assert db.session.get(ChangeRecord, before + 1) is None
+
+
+def test_import_records_batches(app, client, admin, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHANGES_BATCH_SIZE', 2)
+    with app.app_context():
+        start = latest_offset()
+    body = '\n'.join(f'{{"title": "Imported {i}", "detail": "x"}}' for i in range(3))
+    response = client.post('/api/v1/ticket/import', data=body, content_type='application/x-ndjson', headers=admin)
+    assert response.get_json()['imported'] == 3
+
+    changes = _changes(client, admin, after=start, events='ticket.imported')['changes']
+    assert [change['data']['count'] for change in changes] == [2, 1]
+    ids = [ticket_id for change in changes for ticket_id in change['data']['ids']]
+    assert len(set(ids)) == 3 and all(change['actorId'] for change in changes)
+    assert client.get(f'/api/v1/ticket/{ids[0]}', headers=admin).get_json()['title'] == 'Imported 0'
+
+
+def test_archive_and_restore_are_recorded(app, client, admin, ticket):
+    client.patch(f"/api/v1/ticket/{ticket['id']}/close", headers=admin)
+    with app.app_context():
+        tickets = Ticket.__table__
+        db.session.execute(tickets.update().where(tickets.c.id == ticket['id'])
+                           .values(updated_at=datetime.utcnow() - timedelta(days=400)))
+        db.session.commit()
+        start = latest_offset()
+
+    assert client.post('/api/v1/admin/archive', json={'older_than_days': 365}, headers=admin).get_json() == {
+        'archived': 1
+    }
+    assert client.post(f"/api/v1/ticket/{ticket['id']}/restore", headers=admin).status_code == 200
+
+    changes = _changes(client, admin, after=start)['changes']
+    assert [change['event'] for change in changes] == ['ticket.archived', 'ticket.restored']
+    assert changes[0]['data']['ids'] == [ticket['id']]
+    assert changes[1]['entityId'] == ticket['id'] and changes[1]['data']['Number'] == ticket['Number']
+
+
+def test_provisioning_is_recorded(app, client, admin):
+    with app.app_context():
+        start = latest_offset()
+    users = [{'name': f'Bulk {i}', 'email': f'bulk{i}@example.com', 'password': 'secret123'} for i in range(2)]
+    assert client.post('/api/v1/users/bulk', json={'users': users}, headers=admin).status_code == 201
+
+    changes = _changes(client, admin, after=start, events='user.provisioned')['changes']
+    assert len(changes) == 1 and changes[0]['data']['count'] == 2
+    emails = {client.get(f'/api/v1/users/{user_id}', headers=admin).get_json()['email']
+              for user_id in changes[0]['data']['ids']}
+    assert emails == {user['email'] for user in users}
+
+
+def test_user_changes_are_recorded(app, client, admin):
+    with app.app_context():
+        start = latest_offset()
+    created = client.post('/api/v1/users', json={'name': 'Outbox User', 'email': 'outbox@example.com',
+                                                 'password': 'secret123'}, headers=admin).get_json()
+    client.put(f"/api/v1/users/{created['id']}", json={'department': 'IT'}, headers=admin)
+    own = login(client, 'outbox@example.com', 'secret123')
+    client.put('/api/v1/auth/profile', json={'phone': '555-0100'}, headers=own)
+    client.delete(f"/api/v1/users/{created['id']}", headers=admin)
+
+    changes = _changes(client, admin, after=start)['changes']
+    assert [change['event'] for change in changes] == ['user.created', 'user.updated', 'user.updated', 'user.deleted']
+    assert {change['entityId'] for change in changes} == {created['id']}
+    assert changes[1]['data']['department'] == 'IT' and changes[2]['data']['phone'] == '555-0100'
+    assert changes[2]['actorId'] == created['id'] and changes[3]['actorId'] != created['id']
+    assert 'password' not in str(changes)
@@ -0,0 +1,61 @@
+import bcrypt
+
+import provisioning
+from models import db, User
+
+
+def _user(i, **fields):
+    return {'name': f'Provisioned {i}', 'email': f'provisioned{i}@example.com', 'password': 'secret123', **fields}
+
+
+def test_bad_rows_are_reported_by_line(client, admin):
+    users = [
+        _user(1),
+        _user(2, password=12345678),
+        _user(3, password='x' * 73),
+        _user(4, email=['not', 'an', 'email']),
+        _user(1),
+        {'name': 'No password', 'email': 'nopassword@example.com'},
+        _user(5, email='admin@peppermint.com'),
+    ]
+    response = client.post('/api/v1/users/bulk', json={'users': users}, headers=admin)
+    assert response.status_code == 201
+    result = response.get_json()
+    assert result['imported'] == 1 and result['failed'] == 6
+    assert [(error['line'], error['error']) for error in result['errors']] == [
+        (2, 'password must be a string'),
+        (3, 'password must be at most 72 bytes'),
+        (4, 'email must be a string'),
+        (5, 'Duplicate email provisioned1@example.com in input'),
+        (6, 'password is required'),
+        (7, 'User with this email already exists'),
+    ]
+
+
+def test_concurrent_email_is_reported_and_the_rest_created(app, client, admin, monkeypatch):
+    hash_passwords = provisioning.hash_passwords
+
+    def hash_and_race(passwords, workers=None):
+        # Another request creates the second email between the check and the insert
+        racer = User(name='Racer', email='provisioned12@example.com')
+        racer.set_password('secret123')
+        db.session.add(racer)
+        db.session.commit()
+        return hash_passwords(passwords, workers)
+
+    monkeypatch.setattr(provisioning, 'hash_passwords', hash_and_race)
+    users = [_user(11), _user(12), _user(13)]
+    response = client.post('/api/v1/users/bulk', json={'users': users}, headers=admin)
+    assert response.status_code == 201
+    result = response.get_json()
+    assert result['imported'] == 2 and result['failed'] == 1
+    assert result['errors'] == [{'line': 2, 'error': 'User with this email already exists'}]
+    with app.app_context():
+        names = {user.email: user.name for user in User.query.filter(User.email.like('provisioned1_@example.com'))}
+    assert names == {'provisioned11@example.com': 'Provisioned 11', 'provisioned12@example.com': 'Racer',
+                     'provisioned13@example.com': 'Provisioned 13'}
+
+
+def test_hash_passwords_in_spawned_workers():
+    hashes = provisioning.hash_passwords(['first', 'second'], workers=2)
+    assert bcrypt.checkpw(b'first', hashes[0].encode()) and bcrypt.checkpw(b'second', hashes[1].encode())
@@ -0,0 +1,60 @@
+import pytest
+
+from models import db, Ticket
+from query_budget import QueryBudgetExceeded, count_queries
+from user_cache import user_cache
+
+from conftest import login
+
+
+@pytest.fixture
+def populated(client, admin, ticket):
+    """A ticket with a few comments and time entries, on top of several tickets"""
+    for i in range(3):
+        client.post('/api/v1/ticket/create', json={'title': f'Ticket {i}', 'detail': 'x'}, headers=admin)
+        client.post(f"/api/v1/ticket/{ticket['id']}/comments", json={'content': f'Comment {i}'}, headers=admin)
+        client.post(f"/api/v1/ticket/{ticket['id']}/time",
+                    json={'description': 'Work', 'hours': 1, 'date': '2026-01-0%d' % (i + 1)}, headers=admin)
+    return ticket
+
+
+@pytest.mark.parametrize('path', [
+    '/api/v1/ticket',
+    '/api/v1/ticket?per_page=50',
+    '/api/v1/me/queue',
+    '/api/v1/ticket/{id}',
+    '/api/v1/ticket/{id}/comments',
+    '/api/v1/ticket/{id}/time',
+    '/api/v1/ticket/{id}/history',
+    '/api/v1/users',
+    '/api/v1/clients',
+    '/api/v1/auth/me',
+    '/api/v1/changes',
+])
+def test_endpoints_stay_within_budget(app, client, admin, populated, path):
+    # The testing config enforces budgets, so a violation raises out of the request
+    with count_queries() as queries:
+        response = client.get(path.format(id=populated['id']), headers=admin)
+    assert response.status_code == 200
+    assert int(response.headers['X-Query-Count']) == queries.count
+    assert not queries.repeated(app.config['QUERY_BUDGET_REPEAT_THRESHOLD'])
+
+
+def test_n_plus_one_fails_the_request(client, admin, ticket, monkeypatch):
+    for email, password in [('admin@peppermint.com', 'admin123'), ('demo@example.com', 'demo123'),
+                            ('john.doe@company.com', 'password123')]:
+        client.post(f"/api/v1/ticket/{ticket['id']}/comments", json={'content': email},
+                    headers=login(client, email, password))
+    # Without the batched prime every comment author is loaded on its own
+    cache = user_cache.instance()
+    monkeypatch.setattr(cache, 'prime', lambda user_ids: None)
+    cache.clear()
+    with pytest.raises(QueryBudgetExceeded, match=r'N\+1 x3: SELECT users\.'):
+        client.get(f"/api/v1/ticket/{ticket['id']}/comments", headers=admin)
+
+
+def test_count_queries_records_statements(app):
+    with app.app_context(), count_queries() as queries:
+        db.session.execute(db.select(Ticket.id).limit(1)).all()
+    assert queries.count == 1
+    assert 'FROM tickets' in queries.statements[0][0]
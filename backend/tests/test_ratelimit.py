@@ -0,0 +1,64 @@
+import pytest
+from flask import Flask
+
+from ratelimit import MemoryBucketStore, RateLimiter, SharedBucketStore, fcntl
+
+
+@pytest.fixture(params=['memory', 'shared'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBucketStore()
+    if fcntl is None:
+        pytest.skip('shared storage needs POSIX file locks')
+    return SharedBucketStore(str(tmp_path / 'buckets.bin'), slots=64)
+
+
+def test_bucket_drains_and_refills(store):
+    assert [store.take('k', 3, 1.0, 100.0)[0] for _ in range(4)] == [True, True, True, False]
+    # One token per second
+    assert store.take('k', 3, 1.0, 101.0)[0]
+    assert not store.take('k', 3, 1.0, 101.0)[0]
+    # Never refills past capacity
+    assert store.take('k', 3, 1.0, 1000.0)[1] == 2
+
+
+def test_bucket_from_the_future_starts_full(store):
+    # Left drained by a clock that ran ahead of this one (before a reboot, on another host)
+    assert store.take('k', 2, 1.0, 5000.0)[0]
+    assert store.take('k', 2, 1.0, 5000.0)[0]
+    assert not store.take('k', 2, 1.0, 5000.0)[0]
+    allowed, tokens = store.take('k', 2, 1.0, 10.0)
+    assert allowed and tokens == 1
+
+
+def test_shared_buckets_survive_reopening(tmp_path):
+    if fcntl is None:
+        pytest.skip('shared storage needs POSIX file locks')
+    path = str(tmp_path / 'buckets.bin')
+    SharedBucketStore(path, slots=64).take('k', 1, 0.001, 100.0)
+    assert not SharedBucketStore(path, slots=64).take('k', 1, 0.001, 101.0)[0]
+
+
+def test_keys_are_independent(store):
+    assert store.take('a', 1, 1.0, 10.0)[0]
+    assert not store.take('a', 1, 1.0, 10.0)[0]
+    assert store.take('b', 1, 1.0, 10.0)[0]
+
+
+def test_limited_requests_get_429():
+    app = Flask(__name__)
+    app.config.update(JWT_SECRET_KEY='test', RATELIMIT_STORAGE='memory',
+                      RATELIMIT_GROUPS={'reads': (2, 0.5), 'writes': (1, 0.5), 'login': (1, 0.5)})
+
+    @app.route('/ping')
+    def ping():
+        return 'pong'
+
+    from flask_jwt_extended import JWTManager
+    JWTManager(app)
+    RateLimiter(app)
+    client = app.test_client()
+    assert [client.get('/ping').status_code for _ in range(3)] == [200, 200, 429]
+    limited = client.get('/ping')
+    assert limited.headers['Retry-After'] == '2'
+    assert limited.get_json()['error'] == 'Too many requests'
@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import func, select
+
+from models import db, Ticket, TimeEntry
+from reports import aggregate_time
+
+ENTRIES = [
+    ('2024-03-04', 1.5), ('2024-03-06', 2.25), ('2024-03-10', 0.5),
+    ('2024-03-11', 4.0), ('2024-04-01', 3.0), ('2024-04-30', 0.75),
+]
+
+
+@pytest.fixture
+def logged(client, admin, agent, ticket):
+    for i, (day, hours) in enumerate(ENTRIES):
+        response = client.post(f"/api/v1/ticket/{ticket['id']}/time", json={
+            'description': f'Work {i}', 'hours': hours, 'date': day
+        }, headers=admin if i % 2 else agent)
+        assert response.status_code == 201
+    return ticket
+
+
+def _sql_totals(*columns):
+    entries, tickets = TimeEntry.__table__, Ticket.__table__
+    query = select(*columns, func.sum(entries.c.hours), func.count()).select_from(
+        entries.join(tickets, tickets.c.id == entries.c.ticket_id)
+    ).group_by(*columns)
+    return {tuple(row[:-2]): (round(row[-2], 2), row[-1]) for row in db.session.execute(query)}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4, 1000])
+def test_totals_match_sql_group_by(app, logged, chunk_size):
+    entries, tickets = TimeEntry.__table__, Ticket.__table__
+    with app.app_context():
+        rows, totals = aggregate_time(['user', 'type'], include_archived=False, chunk_size=chunk_size)
+        expected = _sql_totals(entries.c.user_id, tickets.c.type)
+        assert {(row['user'], row['type']): (row['hours'], row['entries']) for row in rows} == expected
+        assert totals['entries'] == sum(count for _, count in expected.values())
+
+        rows, _ = aggregate_time(['month'], include_archived=False, chunk_size=chunk_size)
+        assert {(row['month'],): (row['hours'], row['entries']) for row in rows} == \
+            _sql_totals(func.strftime('%Y-%m', entries.c.date))
+
+
+def test_weeks_start_on_monday_and_ranges_are_inclusive(client, admin, logged):
+    response = client.get('/api/v1/reports/time', query_string={
+        'group_by': 'week', 'from': '2024-03-04', 'to': '2024-03-11'
+    }, headers=admin)
+    assert response.status_code == 200
+    report = response.get_json()
+    weeks = {row['week']: row['hours'] for row in report['rows']}
+    # 2024-03-04 and 2024-03-11 are Mondays; 03-10 is the Sunday of the first week
+    assert weeks['2024-03-04'] >= 4.25 and weeks['2024-03-11'] >= 4.0
+    assert set(weeks) == {'2024-03-04', '2024-03-11'}
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from similar import MANIFEST, similar_index
+
+
+@pytest.fixture
+def index(app, tmp_path, monkeypatch):
+    """The app's similar index, built into a directory of its own"""
+    with app.app_context():
+        instance = similar_index.instance()
+        monkeypatch.setattr(instance, 'path', str(tmp_path))
+        monkeypatch.setattr(instance, '_checked_at', None)
+        yield instance
+    # Back to the real index, dropping the segments mapped from tmp_path
+    monkeypatch.undo()
+    instance.load()
+
+
+def _resolved(client, admin, title, detail):
+    ticket = client.post('/api/v1/ticket/create', json={'title': title, 'detail': detail}, headers=admin).get_json()
+    assert client.patch(f"/api/v1/ticket/{ticket['id']}/close", headers=admin).status_code == 200
+    return ticket
+
+
+def test_search_ranks_the_closest_resolved_ticket_first(client, admin, index):
+    plotter = _resolved(client, admin, 'Plotter jams on glossy paper', 'The plotter jams halfway through glossy sheets')
+    vpn = _resolved(client, admin, 'VPN drops hourly', 'Tunnel reconnects every hour from the branch office')
+    assert index.update(full=True) >= 2
+
+    matches = index.search('plotter keeps jamming with glossy paper', limit=2)
+    assert matches[0][0] == plotter['id'] and 0 < matches[0][1] <= 1
+    assert vpn['id'] not in [ticket_id for ticket_id, _ in matches]
+    assert plotter['id'] not in [ticket_id for ticket_id, _ in index.search(
+        'plotter jams on glossy paper', exclude=plotter['id'])]
+
+
+def test_updates_append_segments_for_newly_resolved_tickets(client, admin, index):
+    index.update(full=True)
+    segments = len(index._read_manifest()['segments'])
+    assert index.update() == 0
+
+    scanner = _resolved(client, admin, 'Scanner feeder skews pages', 'Duplex scanner feeder skews every page')
+    assert index.update() == 1
+    assert len(index._read_manifest()['segments']) == segments + 1
+    assert index.search('duplex scanner skews pages', limit=1)[0][0] == scanner['id']
+    assert os.path.exists(os.path.join(index.path, MANIFEST))
+
+
+def test_endpoint_drops_tickets_reopened_since_the_build(client, admin, index):
+    printer = _resolved(client, admin, 'Label printer smears ink', 'Thermal label printer smears the ink')
+    index.update(full=True)
+    query = client.post('/api/v1/ticket/create', json={'title': 'Label printer smearing ink',
+                                                       'detail': 'Our thermal label printer smears'},
+                        headers=admin).get_json()
+
+    similar = client.get(f"/api/v1/ticket/{query['id']}/similar", headers=admin).get_json()['similar']
+    assert similar[0]['id'] == printer['id'] and similar[0]['comments'] == []
+
+    client.patch(f"/api/v1/ticket/{printer['id']}/reopen", headers=admin)
+    similar = client.get(f"/api/v1/ticket/{query['id']}/similar", headers=admin).get_json()['similar']
+    assert printer['id'] not in [ticket['id'] for ticket in similar]
@@ -0,0 +1,39 @@
+from models import db, Ticket
+from slow_query import explain, slow_query_log
+
+
+def _explain(statement, parameters=()):
+    connection = db.session.connection()
+    cursor = connection.connection.cursor()
+    try:
+        return explain(connection, cursor, statement, parameters)
+    finally:
+        cursor.close()
+
+
+def test_explains_selects_only(app, ticket):
+    with app.app_context():
+        plan = _explain('SELECT id FROM tickets WHERE id = ?', (ticket['id'],))
+        assert plan and 'tickets' in ' '.join(plan)
+        assert _explain('UPDATE tickets SET title = ? WHERE id = ?', ('x', ticket['id'])) is None
+        assert _explain('DELETE FROM tickets WHERE id = ?', (ticket['id'],)) is None
+        assert _explain('WITH t AS (SELECT 1) SELECT * FROM t') is None
+        db.session.rollback()
+
+
+def test_failed_explain_leaves_the_transaction_usable(app, ticket):
+    with app.app_context():
+        row = db.session.get(Ticket, ticket['id'])
+        assert _explain('SELECT * FROM no_such_table')[0].startswith('EXPLAIN failed')
+        assert db.session.get(Ticket, ticket['id']) is row
+        db.session.rollback()
+
+
+def test_slow_statements_are_reported(app, client, admin, monkeypatch):
+    monkeypatch.setattr(slow_query_log, 'threshold', 0.0)
+    slow_query_log.reset()
+    client.get('/api/v1/ticket', headers=admin)
+    report = client.get('/api/v1/admin/slow-queries', headers=admin).get_json()['statements']
+    selects = [entry for entry in report if entry['statement'].startswith('SELECT')]
+    assert selects and all(entry['plan'] for entry in selects)
+    assert all(entry['plan'] is None for entry in report if not entry['statement'].startswith('SELECT'))
@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy import text
+
+from models import db
+from tenancy import TenantLocal, _tenant, current_tenant, tenancy, tenant_path
+
+
+@pytest.fixture
+def acme(app, tmp_path, monkeypatch):
+    """A tenant 'acme' with a SQLite file of its own, without rebuilding the app"""
+    monkeypatch.setattr(tenancy, 'tenants', ('acme',))
+    monkeypatch.setattr(tenancy, '_engines', {})
+    monkeypatch.setitem(app.config, 'TENANT_DATABASE_URI', f'sqlite:///{tmp_path}/{{tenant}}.db')
+    yield 'acme'
+    for engine in tenancy._engines.values():
+        engine.dispose()
+
+
+def test_paths_and_singletons_are_per_tenant(app):
+    class Singleton:
+        def init_app(self, app):
+            self.app = app
+
+    local = TenantLocal(Singleton)
+    TenantLocal.registry.remove(local)
+    local.init_app(app)
+    default = local.instance()
+
+    token = _tenant.set('acme')
+    try:
+        assert current_tenant() == 'acme'
+        assert tenant_path('/data/triage.npz') == '/data/triage-acme.npz'
+        assert local.instance() is local.instance() is not default and local.app is app
+    finally:
+        _tenant.reset(token)
+    assert tenant_path('/data/triage.npz') == '/data/triage.npz' and local.instance() is default
+
+
+def test_requests_select_their_tenant(app, acme):
+    with app.test_request_context(headers={'X-Tenant': acme}):
+        assert tenancy.select() is None and current_tenant() == acme
+        tenancy.release()
+    assert current_tenant() is None
+    with app.test_request_context(headers={'X-Tenant': 'globex'}):
+        response, status = tenancy.select()
+        assert status == 404 and response.get_json() == {'error': 'Unknown tenant'}
+
+
+def test_the_session_follows_the_tenant(app, acme, tmp_path):
+    with tenancy.use(acme):
+        engine = db.session.get_bind()
+        assert engine.url.database == str(tmp_path / 'acme.db')
+        db.session.execute(text('CREATE TABLE marker (id INTEGER)'))
+        db.session.commit()
+    with app.app_context():
+        assert db.session.get_bind() is not engine
+        assert db.session.execute(text("SELECT count(*) FROM sqlite_master WHERE name = 'marker'")).scalar() == 0
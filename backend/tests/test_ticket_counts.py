@@ -0,0 +1,40 @@
+from collections import Counter
+
+import pytest
+
+from models import db, User
+import ticket_counts
+
+
+@pytest.fixture
+def heard(app, monkeypatch):
+    """Adjustments reported to counter listeners during the test"""
+    heard = []
+    monkeypatch.setattr(ticket_counts, '_listeners', [heard.append])
+    with app.app_context():
+        yield heard
+        db.session.rollback()
+
+
+def agent_id():
+    return db.session.query(User.id).filter_by(email='john.doe@company.com').scalar()
+
+
+def test_listeners_hear_adjustments_on_commit(heard):
+    deltas = Counter({(agent_id(), 'open'): 1})
+    ticket_counts.adjust_counts(deltas)
+    ticket_counts.adjust_counts(deltas)
+    assert heard == []
+    db.session.commit()
+    assert heard == [Counter({(agent_id(), 'open'): 2})]
+
+    ticket_counts.adjust_counts(Counter({(agent_id(), 'open'): -2}))
+    db.session.commit()
+    assert heard[-1] == Counter({(agent_id(), 'open'): -2})
+
+
+def test_rolled_back_adjustments_are_discarded(heard):
+    ticket_counts.adjust_counts(Counter({(agent_id(), 'open'): 1}))
+    db.session.rollback()
+    db.session.commit()
+    assert heard == []
@@ -0,0 +1,42 @@
+from timer_wheel import TimerWheel
+
+
+def test_fires_at_deadline_not_before():
+    wheel = TimerWheel(tick=1.0, slots=8, levels=2)
+    wheel.schedule('a', 5)
+    wheel.schedule('b', 3.2)
+    assert wheel.advance(3) == []
+    assert wheel.advance(4) == ['b']
+    assert wheel.advance(5) == ['a']
+    assert len(wheel) == 0
+
+
+def test_far_deadlines_cascade_down():
+    wheel = TimerWheel(tick=1.0, slots=4, levels=2)
+    # Beyond level 1 (16 ticks): starts in the overflow list
+    wheel.schedule('far', 37)
+    wheel.schedule('mid', 9)
+    fired = {}
+    for now in range(1, 40):
+        for key in wheel.advance(now):
+            fired[key] = now
+    assert fired == {'mid': 9, 'far': 37}
+
+
+def test_reschedule_and_cancel():
+    wheel = TimerWheel(tick=1.0, slots=8, levels=2)
+    wheel.schedule('moved', 2)
+    wheel.schedule('moved', 6)
+    wheel.schedule('cancelled', 3)
+    wheel.cancel('cancelled')
+    assert wheel.advance(5) == []
+    assert wheel.deadline('moved') == 6
+    assert wheel.advance(6) == ['moved']
+    assert 'cancelled' not in wheel
+
+
+def test_jumping_the_clock_fires_everything_due():
+    wheel = TimerWheel(tick=1.0, slots=4, levels=2)
+    for i in range(1, 30):
+        wheel.schedule(i, i)
+    assert sorted(wheel.advance(100)) == list(range(1, 30))
@@ -0,0 +1,82 @@
+import pytest
+
+from duplicates import ticket_text
+from triage import NaiveBayes, featurize, triage_model
+
+
+@pytest.mark.parametrize('body, error', [
+    ({'min_confidence': 1.5}, 'min_confidence'),
+    ({'min_confidence': -0.1}, 'min_confidence'),
+    ({'min_confidence': '0.5'}, 'min_confidence'),
+    ({'min_confidence': True}, 'min_confidence'),
+    ({'batch_size': 0}, 'batch_size'),
+    ({'batch_size': 2.5}, 'batch_size'),
+    ({'batch_size': False}, 'batch_size'),
+])
+def test_retriage_rejects_bad_arguments(client, admin, body, error):
+    response = client.post('/api/v1/admin/triage', json=body, headers=admin)
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith(error)
+
+
+def test_retriage_accepts_bounds(client, admin):
+    response = client.post('/api/v1/admin/triage', json={'min_confidence': 1, 'batch_size': 1}, headers=admin)
+    assert response.status_code == 200
+    assert response.get_json()['applied'] == 0
+
+
+@pytest.fixture
+def model(app, tmp_path, monkeypatch):
+    """A model trained on a few hand-written tickets, saved where only this test looks"""
+    examples = [
+        ('Production outage', 'The whole site is down for every customer', 'high', 'bug'),
+        ('Checkout down', 'Payments fail and the site is down', 'high', 'bug'),
+        ('Typo on about page', 'Small cosmetic typo in the footer text', 'low', 'feature'),
+        ('Footer colour', 'Cosmetic request to change the footer colour', 'low', 'feature'),
+    ]
+    with app.app_context():
+        instance = triage_model.instance()
+        monkeypatch.setattr(instance, 'path', str(tmp_path / 'triage.npz'))
+        features = 1 << instance.bits
+        matrix = featurize([ticket_text(title, detail) for title, detail, _, _ in examples], instance.bits)
+        models = {}
+        for index, field in ((2, 'priority'), (3, 'type')):
+            statistics = {}
+            NaiveBayes.accumulate(statistics, [example[index] for example in examples], *matrix, features)
+            models[field] = NaiveBayes.fit(statistics)
+        instance.save(models)
+        yield instance
+    monkeypatch.undo()
+    instance.load()
+
+
+def _open_ticket(client, admin):
+    ticket = client.post('/api/v1/ticket/create', json={
+        'title': 'Site down', 'detail': 'Production outage, the site is down for every customer'
+    }, headers=admin).get_json()
+    assert (ticket['priority'], ticket['type']) == ('medium', 'support')
+    return ticket
+
+
+def test_dry_run_counts_without_writing(client, admin, model):
+    ticket = _open_ticket(client, admin)
+    summary = client.post('/api/v1/admin/triage', json={}, headers=admin).get_json()
+    assert summary['applied'] == 0 and summary['changes']['priority'] >= 1 and summary['changes']['type'] >= 1
+
+    loaded = client.get(f"/api/v1/ticket/{ticket['id']}", headers=admin).get_json()
+    assert (loaded['priority'], loaded['type'], loaded['version']) == ('medium', 'support', ticket['version'])
+
+
+def test_apply_writes_through_the_change_path(client, admin, model):
+    ticket = _open_ticket(client, admin)
+    summary = client.post('/api/v1/admin/triage', json={'apply': True, 'batch_size': 1}, headers=admin).get_json()
+    assert summary['applied'] >= 1
+
+    loaded = client.get(f"/api/v1/ticket/{ticket['id']}", headers=admin).get_json()
+    assert (loaded['priority'], loaded['type']) == ('high', 'bug')
+    events = client.get(f"/api/v1/ticket/{ticket['id']}/history", headers=admin).get_json()['events']
+    assert events[-1]['kind'] == 'updated'
+    assert {change['field'] for change in events[-1]['changes']} == {'priority', 'type'}
+    # Nothing is left at a default for the next run to change
+    again = client.post('/api/v1/admin/triage', json={'apply': True}, headers=admin).get_json()
+    assert again['applied'] == 0
@@ -0,0 +1,57 @@
+import pytest
+
+from models import db, User
+from user_cache import UserCache
+
+
+@pytest.fixture
+def user(app):
+    with app.test_request_context():
+        user = User.query.filter_by(email='john.doe@company.com').one()
+        name = user.name
+        yield user
+        db.session.rollback()
+        _rename(user, name)
+        UserCache().invalidate(user.id)
+        db.session.commit()
+
+
+def _rename(user, name):
+    # Straight to the table, as another worker's commit would look from here
+    db.session.execute(User.__table__.update().where(User.__table__.c.id == user.id).values(name=name))
+    db.session.commit()
+
+
+def test_a_version_bump_clears_other_workers(user):
+    here, there = UserCache(check_interval=0), UserCache(check_interval=0)
+    original = user.name
+    assert here.get(user.id)['name'] == there.get(user.id)['name'] == original
+
+    _rename(user, 'Renamed Elsewhere')
+    # Cached, so the change is not seen yet
+    assert there.get(user.id)['name'] == original
+
+    here.invalidate(user.id)
+    db.session.commit()
+    assert there.get(user.id)['name'] == 'Renamed Elsewhere'
+
+
+def test_the_version_is_polled_at_most_once_per_interval(user):
+    cache = UserCache(check_interval=3600)
+    original = cache.get(user.id)['name']
+    _rename(user, 'Renamed Again')
+    UserCache().invalidate(user.id)
+    db.session.commit()
+
+    assert cache.get(user.id)['name'] == original
+    cache._checked_at = 0.0
+    assert cache.get(user.id)['name'] == 'Renamed Again'
+
+
+def test_records_are_copies_and_the_cache_is_bounded(user):
+    cache = UserCache(max_size=1, check_interval=0)
+    cache.get(user.id)['name'] = 'Mutated'
+    assert cache.get(user.id)['name'] == user.name
+
+    cache.put('someone-else', {'name': 'Other'})
+    assert list(cache._entries) == ['someone-else']
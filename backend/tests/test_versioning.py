@@ -0,0 +1,65 @@
+import pytest
+from sqlalchemy.orm.exc import StaleDataError
+
+from models import db, Ticket
+
+
+def test_etag_and_if_match(client, admin, ticket):
+    response = client.get(f"/api/v1/ticket/{ticket['id']}", headers=admin)
+    etag = response.headers['ETag']
+    assert etag.startswith('"%d.' % response.get_json()['version'])
+
+    updated = client.put(f"/api/v1/ticket/{ticket['id']}", json={'title': 'Renamed'},
+                         headers=dict(admin, **{'If-Match': etag}))
+    assert updated.status_code == 200
+    assert updated.headers['ETag'] != etag
+
+    stale = client.put(f"/api/v1/ticket/{ticket['id']}", json={'title': 'Lost update'},
+                       headers=dict(admin, **{'If-Match': etag}))
+    assert stale.status_code == 412
+    assert stale.get_json()['version'] == updated.get_json()['version']
+    assert client.get(f"/api/v1/ticket/{ticket['id']}", headers=admin).get_json()['title'] == 'Renamed'
+
+
+def test_concurrent_write_raises_stale_data(app, ticket):
+    with app.app_context():
+        row = db.session.get(Ticket, ticket['id'])
+        # Another writer commits in between this read and its UPDATE
+        with db.engine.begin() as connection:
+            connection.execute(Ticket.__table__.update().where(Ticket.id == row.id)
+                               .values(version=Ticket.version + 1))
+        row.title = 'Mine'
+        with pytest.raises(StaleDataError):
+            db.session.commit()
+        db.session.rollback()
+
+
+def test_etag_follows_changes_without_a_version_bump(app, client, admin, ticket):
+    response = client.get(f"/api/v1/ticket/{ticket['id']}", headers=admin)
+    etag = response.headers['ETag']
+    assert client.get(f"/api/v1/ticket/{ticket['id']}",
+                      headers=dict(admin, **{'If-None-Match': etag})).status_code == 304
+
+    # Like the SLA scheduler setting flags: a core UPDATE that leaves version alone
+    with app.app_context():
+        db.session.execute(Ticket.__table__.update().where(Ticket.id == ticket['id']).values(sla_flags=1))
+        db.session.commit()
+    changed = client.get(f"/api/v1/ticket/{ticket['id']}", headers=dict(admin, **{'If-None-Match': etag}))
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    # The version didn't move, so the old tag still passes If-Match
+    updated = client.put(f"/api/v1/ticket/{ticket['id']}", json={'priority': 'low'},
+                         headers=dict(admin, **{'If-Match': etag}))
+    assert updated.status_code == 200
+
+
+def test_first_response_leaves_version_alone(client, admin, agent, ticket):
+    etag = client.get(f"/api/v1/ticket/{ticket['id']}", headers=admin).headers['ETag']
+    reply = client.post(f"/api/v1/ticket/{ticket['id']}/comments", json={'content': 'Looking now'}, headers=agent)
+    assert reply.status_code == 201
+
+    after = client.get(f"/api/v1/ticket/{ticket['id']}", headers=admin).get_json()
+    assert after['sla']['firstResponseAt'] and after['version'] == ticket['version']
+    # An edit started before the reply still goes through
+    updated = client.put(f"/api/v1/ticket/{ticket['id']}", json={'priority': 'high'},
+                         headers=dict(admin, **{'If-Match': etag}))
+    assert updated.status_code == 200
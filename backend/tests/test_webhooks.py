@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from models import db, WebhookSubscription, WebhookDeadLetter
+from outbox import latest_offset, record_change
+from webhook_receiver import Receiver
+from webhooks import SIGNATURE_HEADER, sign, verify_signature, webhook_dispatcher
+
+SECRET = 'test-secret'
+
+
+class RecordingReceiver(Receiver):
+    """Keeps every batch and answers with the queued statuses, then 200"""
+    batches = []
+    statuses = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.batches.append((self.headers[SIGNATURE_HEADER], body))
+        self.reply(self.statuses.pop(0) if self.statuses else 200, 'ok')
+
+
+@pytest.fixture
+def receiver():
+    RecordingReceiver.batches, RecordingReceiver.statuses = [], []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RecordingReceiver)
+    RecordingReceiver.url = f'http://127.0.0.1:{server.server_port}/'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield RecordingReceiver
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def subscription(app, receiver, monkeypatch):
+    """A subscription to the local receiver, starting after every existing change"""
+    monkeypatch.setitem(app.config, 'WEBHOOK_BATCH_SIZE', 2)
+    with app.app_context():
+        row = WebhookSubscription(url=receiver.url, secret=SECRET, last_change_id=latest_offset())
+        db.session.add(row)
+        db.session.commit()
+        yield row
+        db.session.rollback()
+        WebhookDeadLetter.query.filter_by(subscription_id=row.id).delete()
+        db.session.delete(row)
+        db.session.commit()
+
+
+def _changes(count):
+    for i in range(count):
+        record_change('ticket.updated', f'ticket-{i}', {'n': i})
+    db.session.commit()
+
+
+def _offsets(batch):
+    return [delivery['offset'] for delivery in json.loads(batch[1])['deliveries']]
+
+
+def test_batches_advance_the_offset(receiver, subscription):
+    start = subscription.last_change_id
+    _changes(3)
+    dispatcher = webhook_dispatcher.instance()
+    now = datetime.utcnow()
+
+    assert dispatcher.deliver_due(now) == 2
+    assert dispatcher.deliver_due(now) == 1
+    assert dispatcher.deliver_due(now) == 0
+
+    assert [_offsets(batch) for batch in receiver.batches] == [[start + 1, start + 2], [start + 3]]
+    assert all(verify_signature(SECRET, header, body) for header, body in receiver.batches)
+    db.session.refresh(subscription)
+    assert subscription.last_change_id == start + 3 and subscription.attempts == 0
+
+
+def test_failures_back_off_then_dead_letter(app, receiver, subscription, monkeypatch):
+    monkeypatch.setitem(app.config, 'WEBHOOK_MAX_ATTEMPTS', 2)
+    start = subscription.last_change_id
+    _changes(2)
+    dispatcher = webhook_dispatcher.instance()
+    receiver.statuses[:] = [503, 503]
+    now = datetime.utcnow()
+
+    assert dispatcher.deliver_due(now) == 2
+    db.session.refresh(subscription)
+    assert subscription.attempts == 1 and subscription.last_error == 'HTTP 503'
+    assert subscription.last_change_id == start and subscription.next_attempt_at > now
+    # Not due again until the backoff has passed
+    assert dispatcher.deliver_due(now) == 0
+
+    assert dispatcher.deliver_due(subscription.next_attempt_at) == 2
+    db.session.refresh(subscription)
+    assert subscription.last_change_id == start + 2 and subscription.attempts == 0
+    dead = WebhookDeadLetter.query.filter_by(subscription_id=subscription.id).order_by(WebhookDeadLetter.change_id)
+    assert [(row.change_id, row.attempts, row.last_error) for row in dead] == [
+        (start + 1, 2, 'HTTP 503'), (start + 2, 2, 'HTTP 503')
+    ]
+    assert [_offsets(batch) for batch in receiver.batches] == [[start + 1, start + 2]] * 2
+
+
+def test_verify_signature_round_trips():
+    body = b'{"deliveries":[]}'
+    header = sign(SECRET, int(time.time()), body)
+    assert verify_signature(SECRET, header, body)
+    assert not verify_signature(SECRET, header, body + b' ')
+    assert not verify_signature('other-secret', header, body)
+    assert not verify_signature(SECRET, sign(SECRET, int(time.time()) - 3600, body), body)
+    assert not verify_signature(SECRET, None, body)
@@ -0,0 +1,118 @@
+from collections import Counter
+
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Ticket, TicketCount
+from changes import on_ticket_change
+from history import previous
+
+UPSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+_listeners = []
+
+# Session.info key for adjustments made in a transaction that hasn't committed yet
+PENDING_KEY = 'pending_count_deltas'
+
+
+def on_counts_adjusted(listener):
+    """Register ``listener(deltas)``, called with every adjustment committed in this process"""
+    _listeners.append(listener)
+    return listener
+
+
+@event.listens_for(db.session, 'after_commit')
+def _notify_committed(session):
+    deltas = session.info.pop(PENDING_KEY, None)
+    if deltas:
+        for listener in _listeners:
+            listener(deltas)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def adjust_counts(deltas):
+    """Apply ``{(user_id, status): delta}`` to the counter table in the current transaction.
+
+    Unassigned tickets and tickets without a status aren't counted.
+    Listeners hear about the adjustment once the transaction commits.
+    """
+    table = TicketCount.__table__
+    upsert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    for (user_id, status), delta in deltas.items():
+        if not delta or user_id is None or status is None:
+            continue
+        if upsert is not None:
+            db.session.execute(
+                upsert(table).values(user_id=user_id, status=status, count=delta).on_conflict_do_update(
+                    index_elements=['user_id', 'status'], set_={'count': table.c.count + delta}
+                )
+            )
+            continue
+        updated = db.session.execute(
+            table.update()
+            .where(table.c.user_id == user_id, table.c.status == status)
+            .values(count=table.c.count + delta)
+        ).rowcount
+        if not updated:
+            db.session.execute(table.insert().values(user_id=user_id, status=status, count=delta))
+    db.session.info.setdefault(PENDING_KEY, Counter()).update(deltas)
+
+
+@on_ticket_change
+def count_ticket_change(ticket, before, kind, actor_id=None):
+    """Move a ticket between (assignee, status) counters when either changes"""
+    deltas = Counter()
+    if before is not None:
+        deltas[(previous(before, 'assigned_to'), previous(before, 'status'))] -= 1
+    deltas[(ticket.assigned_to, ticket.status)] += 1
+    adjust_counts(deltas)
+
+
+def count_rows(rows, sign=1):
+    """Adjust counters for ``(assigned_to, status)`` pairs inserted or removed in bulk"""
+    adjust_counts(Counter({key: sign * n for key, n in Counter(rows).items()}))
+
+
+def count_tickets(ticket_ids, sign=1):
+    """Adjust counters for live tickets about to leave (-1) or just added (+1) in bulk"""
+    tickets = Ticket.__table__
+    grouped = db.session.execute(
+        select(tickets.c.assigned_to, tickets.c.status, func.count())
+        .where(tickets.c.id.in_(ticket_ids), tickets.c.assigned_to.is_not(None))
+        .group_by(tickets.c.assigned_to, tickets.c.status)
+    )
+    adjust_counts(Counter({(user_id, status): sign * n for user_id, status, n in grouped}))
+
+
+def forget_user(user_id):
+    """Drop a deleted user's counters"""
+    db.session.execute(TicketCount.__table__.delete().where(TicketCount.__table__.c.user_id == user_id))
+
+
+def rebuild_ticket_counts():
+    """Recompute every counter from the tickets table; used to backfill or repair"""
+    tickets = Ticket.__table__
+    db.session.execute(TicketCount.__table__.delete())
+    db.session.execute(TicketCount.__table__.insert().from_select(
+        ['user_id', 'status', 'count'],
+        select(tickets.c.assigned_to, tickets.c.status, func.count())
+        .where(tickets.c.assigned_to.is_not(None), tickets.c.status.is_not(None))
+        .group_by(tickets.c.assigned_to, tickets.c.status)
+    ))
+    db.session.commit()
+
+
+def get_ticket_counts(user_id):
+    """``{status: count}`` of a user's live assigned tickets; a single primary-key range read"""
+    rows = db.session.execute(
+        select(TicketCount.status, TicketCount.count)
+        .where(TicketCount.user_id == user_id, TicketCount.count > 0)
+    )
+    return dict(rows.all())
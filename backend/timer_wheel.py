@@ -0,0 +1,100 @@
+import threading
+
+
+class TimerWheel:
+    """Hierarchical timing wheel.
+
+    Level 0 has ``slots`` buckets of one tick each, level 1 has ``slots``
+    buckets of ``slots`` ticks, and so on; deadlines beyond the top level wait
+    in an overflow list. Scheduling is O(1), and advancing the clock touches
+    only the bucket for each tick plus, when a lower level wraps, the single
+    higher bucket that is cascaded down. Nothing ever walks every timer.
+
+    Rescheduling or cancelling a key is lazy: the stale entry stays in its
+    bucket and is dropped when reached, because only the latest deadline per
+    key is remembered.
+    """
+
+    def __init__(self, tick=1.0, slots=64, levels=4, now=0.0):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.spans = [slots ** level for level in range(levels + 1)]
+        self.buckets = [[set() for _ in range(slots)] for _ in range(levels)]
+        self.overflow = set()
+        self.deadlines = {}
+        self.current = int(now // tick)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def _place(self, key, when, earliest):
+        # Entries due before ``earliest`` go in its bucket and fire from there
+        at = max(when, earliest)
+        delta = at - self.current
+        for level in range(self.levels):
+            if delta < self.spans[level + 1]:
+                self.buckets[level][(at // self.spans[level]) % self.slots].add((key, when))
+                return
+        self.overflow.add((key, when))
+
+    def schedule(self, key, at):
+        """Fire ``key`` at time ``at``, replacing any deadline it already had"""
+        when = int(-(-at // self.tick))  # round up: never fire early
+        with self._lock:
+            self.deadlines[key] = when
+            # The current tick's bucket has already been emptied
+            self._place(key, when, self.current + 1)
+
+    def cancel(self, key):
+        with self._lock:
+            self.deadlines.pop(key, None)
+
+    def deadline(self, key):
+        """Scheduled time for ``key``, or None"""
+        when = self.deadlines.get(key)
+        return None if when is None else when * self.tick
+
+    def _cascade(self, entries):
+        for key, when in entries:
+            if self.deadlines.get(key) == when:
+                self._place(key, when, self.current)
+
+    def advance(self, now):
+        """Move the clock to ``now`` and return the keys whose deadline has passed"""
+        target = int(now // self.tick)
+        fired = []
+        with self._lock:
+            while self.current < target:
+                self.current += 1
+                # Refill lower levels from the top down before firing level 0
+                for level in range(self.levels, 0, -1):
+                    if self.current % self.spans[level]:
+                        continue
+                    if level == self.levels:
+                        entries, self.overflow = self.overflow, set()
+                    else:
+                        bucket = self.buckets[level][(self.current // self.spans[level]) % self.slots]
+                        entries = list(bucket)
+                        bucket.clear()
+                    self._cascade(entries)
+
+                bucket = self.buckets[0][self.current % self.slots]
+                entries = list(bucket)
+                bucket.clear()
+                for key, when in entries:
+                    if self.deadlines.get(key) != when:
+                        continue
+                    if when <= self.current:
+                        del self.deadlines[key]
+                        fired.append(key)
+                    else:
+                        self._place(key, when, self.current + 1)
+        return fired
+
+    def next_tick_at(self):
+        return (self.current + 1) * self.tick
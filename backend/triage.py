@@ -0,0 +1,273 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select
+
+from models import db, Ticket
+from changes import ticket_changed
+from history import snapshot
+from duplicates import ticket_text
+from similar import term_counts
+from tenancy import TenantLocal, tenant_path
+
+# Fields the model predicts, with the value create_ticket falls back to
+TARGETS = {
+    'priority': 'medium',
+    'type': 'support',
+}
+
+
+def featurize(texts, bits):
+    """Hashed bag-of-words of ``texts`` as CSR arrays ``(indptr, terms, counts)``"""
+    indptr = np.zeros(len(texts) + 1, dtype=np.int64)
+    terms, counts = [], []
+    for row, text in enumerate(texts):
+        row_counts = term_counts(text, bits)
+        terms.extend(row_counts)
+        counts.extend(row_counts.values())
+        indptr[row + 1] = len(terms)
+    return indptr, np.array(terms, dtype=np.int64), np.array(counts, dtype=np.float32)
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes over hashed word counts for one field"""
+
+    def __init__(self, classes, log_prior, log_likelihood):
+        self.classes = list(classes)
+        self.log_prior = log_prior
+        self.log_likelihood = log_likelihood  # (classes, 2**bits)
+
+    @staticmethod
+    def accumulate(statistics, labels, indptr, terms, counts, features):
+        """Add a batch to ``statistics``: ``{label: [examples, word counts]}``"""
+        names, label_ids, totals = np.unique(np.asarray(labels), return_inverse=True, return_counts=True)
+        rows = np.repeat(np.arange(len(labels)), np.diff(indptr))
+        # Word counts per class for the whole batch in one pass over the flattened matrix
+        batch = np.bincount(
+            label_ids[rows] * features + terms, weights=counts, minlength=len(names) * features
+        ).reshape(len(names), features)
+        for name, total, word_counts in zip(names.tolist(), totals, batch):
+            entry = statistics.setdefault(name, [0, np.zeros(features)])
+            entry[0] += int(total)
+            entry[1] += word_counts
+
+    @classmethod
+    def fit(cls, statistics, alpha=1.0, min_examples=1):
+        """Model from accumulated statistics, or None when no class has ``min_examples``"""
+        classes = sorted(name for name, (examples, _) in statistics.items() if examples >= min_examples)
+        if not classes:
+            return None
+        examples = np.array([statistics[name][0] for name in classes], dtype=np.float64)
+        smoothed = np.stack([statistics[name][1] for name in classes]) + alpha
+        log_likelihood = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+        log_prior = np.log(examples / examples.sum())
+        return cls(classes, log_prior.astype(np.float32), log_likelihood.astype(np.float32))
+
+    def predict(self, indptr, terms, counts):
+        """(class index, probability) per row; every class is scored with one bincount"""
+        n = len(indptr) - 1
+        rows = np.repeat(np.arange(n), np.diff(indptr))
+        scores = np.empty((n, len(self.classes)), dtype=np.float64)
+        for c in range(len(self.classes)):
+            scores[:, c] = self.log_prior[c] + np.bincount(
+                rows, weights=counts * self.log_likelihood[c, terms], minlength=n
+            )
+        best = scores.argmax(axis=1)
+        # Softmax probability of the winner
+        shifted = np.exp(scores - scores[np.arange(n), best][:, None])
+        return best, 1.0 / shifted.sum(axis=1)
+
+
+class TriageModel:
+    """Per-field naive Bayes classifiers trained offline from past tickets.
+
+    The artifact is a single ``.npz`` file (TRIAGE_MODEL_PATH, by default
+    ``triage.npz`` in the instance folder) written by ``flask tickets
+    triage-train``. Each worker loads it on first use and again only when
+    the file changes, checked at most every TRIAGE_RELOAD_SECONDS. Without
+    a trained model there are simply no suggestions.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.bits = 16
+        self.reload_interval = 60.0
+        self.models = {}
+        self.trained_at = None
+        self._mtime = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.path = tenant_path(config.get('TRIAGE_MODEL_PATH') or os.path.join(app.instance_path, 'triage.npz'))
+        self.bits = config['TRIAGE_HASH_BITS']
+        self.reload_interval = config['TRIAGE_RELOAD_SECONDS']
+
+    def _fresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self.load()
+
+    def load(self):
+        with self._lock:
+            self.models, self.trained_at, self._mtime = {}, None, None
+            if not os.path.exists(self.path):
+                return
+            with np.load(self.path) as artifact:
+                if int(artifact['bits']) != self.bits:
+                    return
+                for field in TARGETS:
+                    if f'{field}_classes' in artifact:
+                        self.models[field] = NaiveBayes(
+                            artifact[f'{field}_classes'].tolist(),
+                            artifact[f'{field}_log_prior'],
+                            artifact[f'{field}_log_likelihood'],
+                        )
+                self.trained_at = str(artifact['trained_at'])
+            self._mtime = os.stat(self.path).st_mtime_ns
+
+    def save(self, models):
+        arrays = {'bits': np.array(self.bits), 'trained_at': np.array(datetime.utcnow().isoformat())}
+        for field, model in models.items():
+            arrays[f'{field}_classes'] = np.array(model.classes)
+            arrays[f'{field}_log_prior'] = model.log_prior
+            arrays[f'{field}_log_likelihood'] = model.log_likelihood
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp.npz'
+        np.savez_compressed(tmp, **arrays)
+        os.replace(tmp, self.path)
+        self._checked_at = None
+
+    def predict(self, texts, fields=None):
+        """``{field: [(value, probability)]}`` for each text, for the fields a model exists for"""
+        self._fresh()
+        models = self.models
+        if not models or not texts:
+            return {}
+        features = featurize(texts, self.bits)
+        predictions = {}
+        for field in (models if fields is None else fields):
+            model = models.get(field)
+            if model is not None:
+                best, probability = model.predict(*features)
+                predictions[field] = [
+                    (model.classes[c], round(float(p), 3)) for c, p in zip(best, probability)
+                ]
+        return predictions
+
+    def suggest(self, title, detail, fields=None):
+        """``{field: {'value', 'confidence'}}`` for one ticket"""
+        return {
+            field: {'value': value, 'confidence': confidence}
+            for field, [(value, confidence)] in self.predict([ticket_text(title, detail)], fields).items()
+        }
+
+
+triage_model = TenantLocal(TriageModel)
+
+
+def train_triage_model(batch_size=10000):
+    """Fit one classifier per field from resolved tickets and save the artifact.
+
+    Resolved tickets are used because their priority and type have been
+    through an agent's hands; open ones mostly still carry the defaults.
+    Returns ``{field: [classes]}``.
+    """
+    config = current_app.config
+    tickets = Ticket.__table__
+    query = select(tickets.c.id, tickets.c.title, tickets.c.detail, tickets.c.priority, tickets.c.type).where(
+        tickets.c.is_complete.is_(True), tickets.c.merged_into.is_(None)
+    ).order_by(tickets.c.id).limit(batch_size)
+
+    features = 1 << triage_model.bits
+    statistics = {field: {} for field in TARGETS}
+    after = ''
+    while True:
+        rows = db.session.execute(query.where(tickets.c.id > after)).all()
+        if not rows:
+            break
+        matrix = featurize([ticket_text(row.title, row.detail) for row in rows], triage_model.bits)
+        for field, default in TARGETS.items():
+            labels = [getattr(row, field) or default for row in rows]
+            NaiveBayes.accumulate(statistics[field], labels, *matrix, features)
+        after = rows[-1].id
+
+    models = {}
+    for field in TARGETS:
+        model = NaiveBayes.fit(
+            statistics[field], alpha=config['TRIAGE_ALPHA'], min_examples=config['TRIAGE_MIN_EXAMPLES']
+        )
+        if model is not None:
+            models[field] = model
+    if not models:
+        return {}
+    triage_model.save(models)
+    return {field: model.classes for field, model in models.items()}
+
+
+def retriage_open_tickets(apply=False, min_confidence=None, batch_size=None, actor_id=None):
+    """Score every open ticket still carrying a default priority or type.
+
+    Suggestions at or above TRIAGE_MIN_CONFIDENCE that differ from the
+    current value are counted and, with ``apply``, written through the
+    usual change path so history, counters and SLA deadlines follow.
+    Returns a summary with ``scored``, ``changes`` per field and ``applied``.
+    """
+    config = current_app.config
+    min_confidence = config['TRIAGE_MIN_CONFIDENCE'] if min_confidence is None else min_confidence
+    batch_size = batch_size or config['TRIAGE_BATCH_SIZE']
+    tickets = Ticket.__table__
+    defaults = [tickets.c[field] == default for field, default in TARGETS.items()]
+    query = select(
+        tickets.c.id, tickets.c.title, tickets.c.detail, tickets.c.priority, tickets.c.type
+    ).where(
+        tickets.c.is_complete.is_(False), tickets.c.merged_into.is_(None), db.or_(*defaults)
+    ).order_by(tickets.c.id).limit(batch_size)
+
+    summary = {'scored': 0, 'changes': {field: 0 for field in TARGETS}, 'applied': 0}
+    after = ''
+    started = time.perf_counter()
+    while True:
+        rows = db.session.execute(query.where(tickets.c.id > after)).all()
+        if not rows:
+            break
+        after = rows[-1].id
+        predictions = triage_model.predict([ticket_text(row.title, row.detail) for row in rows])
+        if not predictions:
+            break
+        summary['scored'] += len(rows)
+
+        updates = {}
+        for field, predicted in predictions.items():
+            for row, (value, confidence) in zip(rows, predicted):
+                current = getattr(row, field)
+                # Only defaults are replaced; a value somebody chose is left alone
+                if current == TARGETS[field] and value != current and confidence >= min_confidence:
+                    updates.setdefault(row.id, {})[field] = value
+                    summary['changes'][field] += 1
+
+        if apply and updates:
+            now = datetime.utcnow()
+            for ticket in Ticket.query.filter(Ticket.id.in_(list(updates))):
+                before = snapshot(ticket)
+                for field, value in updates[ticket.id].items():
+                    setattr(ticket, field, value)
+                ticket.updated_at = now
+                ticket_changed(ticket, before, 'updated', actor_id)
+            db.session.commit()
+            summary['applied'] += len(updates)
+
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
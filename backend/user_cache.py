@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g
+
+from json_provider import encode_fragment
+from tenancy import TenantLocal
+
+CACHE_NAME = 'users'
+
+
+class UserCache:
+    """Bounded LRU/TTL cache of serialized user records keyed by user id.
+
+    Records are ``User.to_dict()`` output. Handlers that change a user call
+    :meth:`invalidate` before committing; that drops the local entry and bumps
+    the ``users`` row in ``cache_versions`` in the same transaction. Every
+    process polls that counter at most once per check interval and clears
+    its cache when it moves, so other workers catch up within that interval.
+
+    With ``fragments`` enabled each record is also kept pre-encoded as JSON,
+    and :meth:`summary` hands that out so embedding a user in a response
+    costs a byte copy instead of re-encoding the dict.
+    """
+
+    def __init__(self, max_size=4096, ttl=300, check_interval=1.0, fragments=False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.fragments = fragments
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+
+    def init_app(self, app):
+        self.max_size = app.config.get('USER_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        self.check_interval = app.config.get('USER_CACHE_CHECK_INTERVAL', self.check_interval)
+        self.fragments = app.config.get('JSON_CACHE_FRAGMENTS', self.fragments)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+            self._checked_at = 0.0
+
+    def _check_version(self, now):
+        if now - self._checked_at < self.check_interval:
+            return
+        from database import get_cache_version
+        version = get_cache_version(CACHE_NAME)
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._checked_at = now
+
+    def _entry(self, user_id):
+        now = time.monotonic()
+        self._check_version(now)
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(user_id)
+                return entry
+
+        from models import db, User
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        # The session only holds rows weakly; keeping this one for the rest of
+        # the request lets get_current_user() find it without another SELECT
+        g.setdefault('_loaded_users', []).append(user)
+        return self.put(user_id, user.to_dict(), now)
+
+    def prime(self, user_ids):
+        """Load every missing or expired user in ``user_ids`` with one IN query"""
+        now = time.monotonic()
+        self._check_version(now)
+        with self._lock:
+            missing = set()
+            for user_id in user_ids:
+                if user_id is None:
+                    continue
+                entry = self._entries.get(user_id)
+                if entry is None or entry[2] <= now:
+                    missing.add(user_id)
+        if not missing:
+            return
+
+        from models import User
+        for user in User.query.filter(User.id.in_(missing)):
+            self.put(user.id, user.to_dict(), now)
+
+    def get(self, user_id):
+        """Return a copy of the cached record for ``user_id``, loading it on a miss"""
+        entry = self._entry(user_id) if user_id else None
+        return dict(entry[0]) if entry else None
+
+    def summary(self, user_id):
+        """Return the user for embedding in a response: pre-encoded when enabled, else a copy"""
+        entry = self._entry(user_id) if user_id else None
+        if not entry:
+            return None
+        return entry[1] if entry[1] is not None else dict(entry[0])
+
+    def put(self, user_id, record, now=None):
+        if now is None:
+            now = time.monotonic()
+        fragment = encode_fragment(record) if self.fragments else None
+        entry = (record, fragment, now + self.ttl)
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, user_id):
+        """Forget a user here and tell other workers; call before the change is committed"""
+        from database import bump_cache_version
+        bump_cache_version(CACHE_NAME)
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+user_cache = TenantLocal(UserCache)
@@ -0,0 +1,59 @@
+"""ETag / If-Match preconditions for rows with a ``version`` column.
+
+Ticket and User map ``version`` as their version_id_col, so SQLAlchemy
+writes every update of one as ``UPDATE ... WHERE id = ? AND version = ?``
+setting ``version + 1``, with no lock and no extra read. When that UPDATE
+matches no row, another writer committed first and the flush raises
+StaleDataError, which the app answers with 412 like a failed If-Match.
+
+Responses carry a strong ETag of ``<version>.<body digest>``. The digest
+covers what changes without a version bump (embedded user summaries, SLA
+flags, login times), so a GET with a matching If-None-Match gets 304 only
+when the body really is the same. If-Match compares the version alone: a
+client sends the tag back to be told, before anything is written, that
+the row moved on since it was read; without If-Match the write only
+conflicts with writes made between this request's read and its UPDATE.
+Compressed responses carry the tag with a coding suffix (compression.py),
+which is ignored when comparing.
+"""
+
+from hashlib import blake2b
+
+from flask import current_app, jsonify, request
+
+from compression import uncoded_etag
+
+
+def _body_etag(response, row):
+    return f'{row.version}.{blake2b(response.get_data(), digest_size=8).hexdigest()}'
+
+
+def _versions(etags):
+    return {uncoded_etag(tag).partition('.')[0] for tag in etags.as_set()}
+
+
+def with_etag(response, row):
+    """Tag the response with the row's version and body digest; 304 for a GET that already has it"""
+    if row.version is None:
+        return response
+    etag = _body_etag(response, row)
+    etags = request.if_none_match
+    if request.method in ('GET', 'HEAD') and etags and (
+            etags.star_tag or etag in {uncoded_etag(tag) for tag in etags.as_set(include_weak=True)}):
+        response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def precondition_failed(row):
+    """412 response when If-Match names another version of ``row``, else None"""
+    etags = request.if_match
+    if not etags or etags.star_tag or str(row.version) in _versions(etags):
+        return None
+    response = jsonify({'error': 'Modified since you loaded it; reload and try again', 'version': row.version})
+    response.status_code = 412
+    return response
+
+
+def conflict_response():
+    return jsonify({'error': 'Modified by someone else; reload and try again'}), 412
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Stand-in webhook receiver for trying out and testing webhook delivery
+locally. Prints every batch it receives, checks the signature when given
+the subscription's secret, and can fail on purpose to exercise retries.
+
+Usage: python webhook_receiver.py [--port 5005] [--secret S] [--fail 3] [--status 503]
+Then subscribe it: POST /api/v1/admin/webhooks {"url": "http://127.0.0.1:5005/"}
+"""
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from webhooks import SIGNATURE_HEADER, verify_signature
+
+
+class Receiver(BaseHTTPRequestHandler):
+    # HTTP/1.1 so the dispatcher's keep-alive connections are reused
+    protocol_version = 'HTTP/1.1'
+    secret = None
+    fail = 0
+    status = 500
+    seen = set()
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.secret and not verify_signature(self.secret, self.headers.get(SIGNATURE_HEADER), body):
+            return self.reply(401, 'bad signature')
+        with self.lock:
+            if Receiver.fail > 0:
+                Receiver.fail -= 1
+                return self.reply(self.status, 'failing on purpose')
+            deliveries = json.loads(body)['deliveries']
+            for delivery in deliveries:
+                duplicate = ' (duplicate)' if delivery['offset'] in self.seen else ''
+                self.seen.add(delivery['offset'])
+                print(f"#{delivery['offset']} {delivery['event']} attempt {delivery['attempt']}{duplicate}")
+        self.reply(200, 'ok')
+
+    def reply(self, status, message):
+        body = message.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=5005)
+    parser.add_argument('--secret', help='Reject batches without a valid signature from this secret.')
+    parser.add_argument('--fail', type=int, default=0, help='Answer the first N batches with an error.')
+    parser.add_argument('--status', type=int, default=500, help='Status code used when failing.')
+    args = parser.parse_args()
+
+    Receiver.secret, Receiver.fail, Receiver.status = args.secret, args.fail, args.status
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), Receiver)
+    print(f'Receiving webhooks on http://127.0.0.1:{args.port}/')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
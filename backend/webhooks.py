@@ -0,0 +1,228 @@
+import contextvars
+import hashlib
+import hmac
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import or_
+
+from models import db, WebhookSubscription, WebhookDeadLetter
+from outbox import EVENTS, latest_offset, read_changes, encode_changes
+from tenancy import TenantLocal
+
+SIGNATURE_HEADER = 'X-Peppermint-Signature'
+
+
+def sign(secret, timestamp, body):
+    """``t=<unix time>,v1=<hex HMAC-SHA256 of "<t>.<body>">``, as sent in SIGNATURE_HEADER"""
+    digest = hmac.new(secret.encode('utf-8'), f'{timestamp}.'.encode('utf-8') + body, hashlib.sha256)
+    return f't={timestamp},v1={digest.hexdigest()}'
+
+
+def verify_signature(secret, header, body, tolerance=300):
+    """Check a SIGNATURE_HEADER value on the receiving side; rejects replays older than ``tolerance`` seconds"""
+    try:
+        parts = dict(item.split('=', 1) for item in header.split(','))
+        timestamp = int(parts['t'])
+    except (AttributeError, KeyError, ValueError):
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    return hmac.compare_digest(sign(secret, timestamp, body), header)
+
+
+def _backoff(attempts, config):
+    delay = min(config['WEBHOOK_BACKOFF_MAX_SECONDS'], config['WEBHOOK_BACKOFF_SECONDS'] * 2 ** (attempts - 1))
+    # Jitter so endpoints coming back up aren't hit by every retry at once
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+# A change record as sent: offset, event name and stored payload
+Delivery = namedtuple('Delivery', 'id event payload')
+
+
+class WebhookDispatcher:
+    """Delivers change records to webhook subscriptions from a background thread.
+
+    Subscriptions tail the outbox (outbox.py): each keeps the offset of the
+    last change record it was sent, so handlers do nothing for webhooks
+    beyond the change record they write anyway, and every endpoint gets its
+    events in commit order. A pass claims the active subscriptions that are
+    due and behind the latest offset with one ``UPDATE ... RETURNING``
+    that also pushes their next attempt out by a lease, so several workers
+    never send to the same endpoint at once and a worker that dies
+    mid-send leaves the batch to be retried. Each claimed subscription is
+    sent up to WEBHOOK_BATCH_SIZE records after its offset, several
+    endpoints in parallel, over a pooled keep-alive ``requests`` session.
+    Each body is signed with the subscription's secret (:func:`sign`).
+
+    A 2xx advances the offset. Anything else retries the same batch with
+    exponential backoff, and after WEBHOOK_MAX_ATTEMPTS moves it to
+    ``webhook_dead_letters`` and moves on. Delivery is at least once:
+    receivers should skip offsets they have already seen.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.http = None
+        self._pool = None
+        self._thread = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        self.http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=config['WEBHOOK_POOL_CONNECTIONS'],
+            pool_maxsize=config['WEBHOOK_WORKERS'],
+            max_retries=0
+        )
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+        self._pool = ThreadPoolExecutor(max_workers=config['WEBHOOK_WORKERS'], thread_name_prefix='webhook')
+        if config.get('WEBHOOKS_ENABLED', False):
+            self.start()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        # The copied context keeps the tenant this dispatcher was started for
+        self._thread = threading.Thread(
+            target=contextvars.copy_context().run, args=(self._run,), name='webhook-dispatcher', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            sent = 0
+            with self.app.app_context():
+                try:
+                    sent = self.deliver_due()
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Webhook delivery failed')
+                finally:
+                    db.session.remove()
+            # Keep going without a pause while there is a backlog
+            if not sent:
+                self._stop.wait(self.app.config['WEBHOOK_POLL_SECONDS'])
+
+    def claim(self, now, latest):
+        subscriptions = WebhookSubscription.__table__
+        rows = db.session.execute(
+            subscriptions.update()
+            .where(
+                subscriptions.c.active.is_(True),
+                subscriptions.c.last_change_id < latest,
+                or_(subscriptions.c.next_attempt_at.is_(None), subscriptions.c.next_attempt_at <= now)
+            )
+            .values(next_attempt_at=now + timedelta(seconds=self.app.config['WEBHOOK_LEASE_SECONDS']))
+            .returning(subscriptions.c.id, subscriptions.c.url, subscriptions.c.secret, subscriptions.c.events,
+                       subscriptions.c.last_change_id, subscriptions.c.attempts)
+        ).all()
+        db.session.commit()
+        return rows
+
+    def deliver_due(self, now=None):
+        """Send the next batch to every subscription that is due; returns how many records were sent"""
+        now = now or datetime.utcnow()
+        latest = latest_offset()
+        claimed = self.claim(now, latest)
+        if not claimed:
+            return 0
+        batch_size = self.app.config['WEBHOOK_BATCH_SIZE']
+        batches = [
+            (subscription, [Delivery(*row) for row in read_changes(
+                subscription.last_change_id, batch_size,
+                events=None if subscription.events == '*' else subscription.events.split(','), upto=latest
+            )])
+            for subscription in claimed
+        ]
+
+        results = self._pool.map(
+            lambda batch: self.post(batch[0].url, batch[0].secret, batch[1], batch[0].attempts + 1)
+            if batch[1] else None,
+            batches
+        )
+        subscriptions = WebhookSubscription.__table__
+        for (subscription, rows), error in zip(batches, results):
+            if error is None:
+                # A short batch means nothing else up to ``latest`` matched its events
+                db.session.execute(subscriptions.update().where(subscriptions.c.id == subscription.id).values(
+                    last_change_id=rows[-1].id if len(rows) == batch_size else latest,
+                    attempts=0, next_attempt_at=now, last_error=None
+                ))
+            else:
+                self._failed(subscription, rows, error, now)
+        db.session.commit()
+        return sum(len(rows) for _, rows in batches)
+
+    def post(self, url, secret, rows, attempt):
+        """POST one batch of Delivery rows; returns None on a 2xx, else what went wrong"""
+        body = ('{"deliveries":' + encode_changes(rows, lambda row: f'"attempt":{attempt},') + '}').encode('utf-8')
+        headers = {
+            'Content-Type': 'application/json',
+            'User-Agent': 'peppermint-webhooks',
+            SIGNATURE_HEADER: sign(secret, int(time.time()), body),
+        }
+        try:
+            response = self.http.post(url, data=body, headers=headers,
+                                      timeout=self.app.config['WEBHOOK_TIMEOUT_SECONDS'])
+            # Drain the body so the connection goes back to the pool
+            response.content
+        except requests.RequestException as error:
+            return f'{type(error).__name__}: {error}'
+        if 200 <= response.status_code < 300:
+            return None
+        return f'HTTP {response.status_code}'
+
+    def _failed(self, subscription, rows, error, now):
+        config = self.app.config
+        subscriptions = WebhookSubscription.__table__
+        attempts = subscription.attempts + 1
+        if attempts < config['WEBHOOK_MAX_ATTEMPTS']:
+            db.session.execute(subscriptions.update().where(subscriptions.c.id == subscription.id).values(
+                attempts=attempts, next_attempt_at=now + _backoff(attempts, config), last_error=error
+            ))
+            return
+        # Give up on this batch so the endpoint's later events aren't held back forever
+        db.session.execute(WebhookDeadLetter.__table__.insert(), [
+            {'subscription_id': subscription.id, 'change_id': row.id, 'event': row.event, 'payload': row.payload,
+             'attempts': attempts, 'last_error': error, 'failed_at': now}
+            for row in rows
+        ])
+        db.session.execute(subscriptions.update().where(subscriptions.c.id == subscription.id).values(
+            last_change_id=rows[-1].id, attempts=0, next_attempt_at=now, last_error=error
+        ))
+
+
+def retry_dead_letter(dead_letter):
+    """Send a dead-lettered event again now; returns None on success, else what went wrong"""
+    subscription = dead_letter.subscription
+    row = Delivery(dead_letter.change_id or 0, dead_letter.event, dead_letter.payload)
+    error = webhook_dispatcher.post(subscription.url, subscription.secret, [row], dead_letter.attempts + 1)
+    if error is None:
+        db.session.delete(dead_letter)
+    else:
+        dead_letter.attempts += 1
+        dead_letter.last_error = error
+    return error
+
+
+webhook_dispatcher = TenantLocal(WebhookDispatcher)